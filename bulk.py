@@ -0,0 +1,420 @@
+"""Offline bulk runner: many source/reference pairs through the same inference path as predict().
+
+Pairs are streamed from
+
+- a directory: ``<dir>/sources`` and ``<dir>/references`` matched by file stem, or a
+  flat directory of sources combined with ``--reference`` / ``--reference-id``,
+- a manifest (``.csv`` / ``.jsonl``) with ``source``, ``reference`` or ``reference_id``
+  and optional ``id`` / ``intensity`` columns (paths relative to the manifest),
+- an Arrow (``.arrow`` / ``.feather``) or Parquet table, or a Hugging Face ``datasets``
+  dataset (``load_from_disk`` directory or hub name) with the same columns; image
+  columns may hold paths, encoded bytes or decoded images.
+
+A thread pool decodes items ahead of the model (bounded by ``--prefetch``). The
+model runs items one at a time through Predictor._transfer; ``--batch-size``
+only groups consecutive items so the CLIP reference embedding is computed once
+per distinct reference within a group (there is no batched inference). Results
+are written as
+
+    <out>/images/<shard>/<id>.jpg
+    <out>/shards/shard-<n>.parquet   one row per item: id, inputs, output, status, timing
+
+Items map to shards by position, and a shard's Parquet file is written
+atomically once all of its items are done. Its metadata records how many items
+a full shard holds (``expected_items``), how many it holds (``items``) and how
+many finished ok (``ok_items``). A rerun skips full shards whose items all
+finished ok without decoding them. A short shard (the input ended there, or
+``--limit``) or one with failed rows keeps its ok rows; its other items are
+decoded and run again and the shard is rewritten, so a grown input continues
+where it ended and failed rows are retried.
+
+    python bulk.py pairs.csv /data/out --shard-size 256 --batch-size 8
+    python bulk.py faces/ /data/out --reference-id coral_glam
+"""
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from PIL import Image
+
+from image_io import DEFAULT_SIZE, GENERATION_SIZES, decode_image, fit_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+CONFIG_NAME = "bulk.json"
+SHARD_SCHEMA = pa.schema([
+    ("index", pa.int64()),
+    ("id", pa.string()),
+    ("source", pa.string()),
+    ("reference", pa.string()),
+    ("reference_id", pa.string()),
+    ("intensity", pa.float64()),
+    ("shard", pa.int64()),
+    ("output", pa.string()),
+    ("status", pa.string()),
+    ("error", pa.string()),
+    ("decode_s", pa.float64()),
+    ("infer_s", pa.float64()),
+    ("steps_run", pa.int64()),
+])
+
+
+def _images_in(directory: str) -> List[str]:
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def _rows_from_directory(path: str) -> Iterator[Dict]:
+    sources_dir, references_dir = os.path.join(path, "sources"), os.path.join(path, "references")
+    if os.path.isdir(sources_dir) and os.path.isdir(references_dir):
+        references = {os.path.splitext(os.path.basename(p))[0]: p for p in _images_in(references_dir)}
+        for source in _images_in(sources_dir):
+            stem = os.path.splitext(os.path.basename(source))[0]
+            if stem in references:
+                yield {"id": stem, "source": source, "reference": references[stem]}
+    else:
+        for source in _images_in(path):
+            yield {"id": os.path.splitext(os.path.basename(source))[0], "source": source}
+
+
+def _rows_from_table_batches(batches: Iterable[pa.RecordBatch]) -> Iterator[Dict]:
+    for batch in batches:
+        yield from batch.to_pylist()
+
+
+def iter_rows(spec: str, split: str = "train") -> Iterator[Dict]:
+    """Raw input rows from a directory, manifest, Arrow/Parquet file or ``datasets`` dataset."""
+    lower = spec.lower()
+    if os.path.isdir(spec) and not os.path.exists(os.path.join(spec, "dataset_info.json")) \
+            and not os.path.exists(os.path.join(spec, "dataset_dict.json")):
+        yield from _rows_from_directory(spec)
+    elif lower.endswith(".csv"):
+        with open(spec, newline="") as f:
+            yield from csv.DictReader(f)
+    elif lower.endswith((".jsonl", ".ndjson")):
+        with open(spec) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif lower.endswith(".parquet"):
+        yield from _rows_from_table_batches(pq.ParquetFile(spec).iter_batches(batch_size=256))
+    elif lower.endswith((".arrow", ".feather", ".ipc")):
+        with pa.memory_map(spec, "r") as source:
+            try:
+                reader = pa.ipc.open_file(source)
+                batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+            except pa.ArrowInvalid:
+                batches = pa.ipc.open_stream(source)
+            yield from _rows_from_table_batches(batches)
+    else:
+        import datasets
+
+        if os.path.isdir(spec):
+            dataset = datasets.load_from_disk(spec)
+            if isinstance(dataset, datasets.DatasetDict):
+                dataset = dataset[split]
+        else:
+            dataset = datasets.load_dataset(spec, split=split, streaming=True)
+        yield from dataset
+
+
+def _base_dir(spec: str) -> str:
+    return spec if os.path.isdir(spec) else os.path.dirname(os.path.abspath(spec))
+
+
+def _item_key(value) -> Optional[str]:
+    """Identity of an image value, so items sharing a reference share one decoded image."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict) and value.get("path"):
+        return value["path"]
+    return None
+
+
+def load_image(value, base_dir: str = ".", size: int = DEFAULT_SIZE) -> Image.Image:
+    """Decode an image column value (path, encoded bytes, {"bytes", "path"} dict or PIL image) to size x size."""
+    if isinstance(value, Image.Image):
+        return fit_image(value, (size, size))
+    if isinstance(value, dict):
+        value = value.get("bytes") or value.get("path")
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return decode_image(io.BytesIO(bytes(value)), (size, size))
+    if isinstance(value, str):
+        return decode_image(value if os.path.isabs(value) else os.path.join(base_dir, value), (size, size))
+    raise TypeError(f"Unsupported image value of type {type(value).__name__}")
+
+
+def _safe_name(item_id: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", str(item_id)).strip("_") or "item"
+
+
+@contextlib.contextmanager
+def shared_reference_embeds(makeup_encoder) -> Iterator[None]:
+    """Inside the block, get_image_embeds runs once per distinct reference image object."""
+    original = makeup_encoder.get_image_embeds
+    patched = makeup_encoder.__dict__.get("get_image_embeds")
+    cache: Dict[int, tuple] = {}
+
+    def get_image_embeds(image, *args, **kwargs):
+        key = id(image)
+        if key not in cache:
+            # Keep the image referenced so its id() can't be reused within the block
+            cache[key] = (image, original(image, *args, **kwargs))
+        return cache[key][1]
+
+    makeup_encoder.get_image_embeds = get_image_embeds
+    try:
+        yield
+    finally:
+        if patched is None:
+            del makeup_encoder.get_image_embeds
+        else:
+            makeup_encoder.get_image_embeds = patched
+
+
+class BulkRunner:
+    def __init__(self, predictor, output_dir: str, shard_size: int = 256, batch_size: int = 8,
+                 decode_workers: int = 4, prefetch: int = 32, reference_cache: int = 64,
+                 options: Optional[Dict] = None):
+        self.predictor = predictor
+        self.output_dir = os.path.abspath(output_dir)
+        self.shard_size = shard_size
+        self.batch_size = batch_size
+        self.decode_workers = decode_workers
+        self.prefetch = max(prefetch, batch_size)
+        self.options = dict(options or {})
+        self._references: "OrderedDict[str, Image.Image]" = OrderedDict()
+        self._reference_cache = reference_cache
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.output_dir, "shards"), exist_ok=True)
+        self._check_config()
+
+    # -- bookkeeping -------------------------------------------------------
+    def _check_config(self) -> None:
+        path = os.path.join(self.output_dir, CONFIG_NAME)
+        if os.path.exists(path):
+            with open(path) as f:
+                previous = json.load(f)
+            if previous.get("shard_size") != self.shard_size:
+                raise ValueError(f"{self.output_dir} was written with shard_size={previous.get('shard_size')}; "
+                                 f"resume with the same shard size")
+            # Same JSON round trip as the stored copy, so e.g. tuples and lists compare equal
+            options = json.loads(json.dumps(self.options))
+            stored = previous.get("options", {})
+            changed = sorted(k for k in set(options) | set(stored) if options.get(k) != stored.get(k))
+            if changed:
+                details = ", ".join(f"{k}: {stored.get(k)!r} -> {options.get(k)!r}" for k in changed)
+                raise ValueError(f"{self.output_dir} was written with other settings ({details}); resume with "
+                                 f"the same options or use a new output directory")
+        else:
+            with open(path, "w") as f:
+                json.dump({"shard_size": self.shard_size, "options": self.options}, f, indent=2)
+
+    def shard_path(self, shard: int) -> str:
+        return os.path.join(self.output_dir, "shards", f"shard-{shard:05d}.parquet")
+
+    def shard_progress(self) -> Tuple[Set[int], Dict[int, Dict[int, Dict]]]:
+        """Complete shards, and the ok rows (by item index) of every other shard on disk.
+
+        A shard is complete when it holds ``shard_size`` items and all of them finished ok.
+        Shards written without the metadata are read row by row, like short ones.
+        """
+        names = os.listdir(os.path.join(self.output_dir, "shards"))
+        complete, finished = set(), {}
+        for shard in sorted(int(n[6:11]) for n in names if re.fullmatch(r"shard-\d{5}\.parquet", n)):
+            path = self.shard_path(shard)
+            metadata = pq.read_schema(path).metadata or {}
+            counts = [int(metadata.get(key, -1)) for key in (b"expected_items", b"items", b"ok_items")]
+            if counts == [self.shard_size] * 3:
+                complete.add(shard)
+                continue
+            rows = pq.read_table(path).to_pylist()
+            finished[shard] = {row["index"]: row for row in rows if row["status"] == "ok"}
+        return complete, finished
+
+    def _write_shard(self, shard: int, rows: List[Dict]) -> None:
+        rows = sorted(rows, key=lambda row: row["index"])
+        metadata = {
+            b"expected_items": str(self.shard_size).encode(),
+            b"items": str(len(rows)).encode(),
+            b"ok_items": str(sum(row["status"] == "ok" for row in rows)).encode(),
+        }
+        path = self.shard_path(shard)
+        tmp = f"{path}.tmp{os.getpid()}"
+        pq.write_table(pa.Table.from_pylist(rows, schema=SHARD_SCHEMA.with_metadata(metadata)), tmp)
+        os.replace(tmp, path)
+
+    # -- stages ------------------------------------------------------------
+    def _reference(self, value, base_dir: str) -> Image.Image:
+        key = _item_key(value)
+        if key is not None:
+            with self._lock:
+                if key in self._references:
+                    self._references.move_to_end(key)
+                    return self._references[key]
+        image = load_image(value, base_dir, self.options.get("resolution", DEFAULT_SIZE))
+        if key is not None:
+            with self._lock:
+                self._references[key] = image
+                while len(self._references) > self._reference_cache:
+                    self._references.popitem(last=False)
+        return image
+
+    def _decode(self, index: int, row: Dict, base_dir: str) -> Dict:
+        item = {
+            "index": index,
+            "id": str(row.get("id") or f"{index:08d}"),
+            "source": _item_key(row.get("source")),
+            "reference": _item_key(row.get("reference")),
+            "reference_id": row.get("reference_id") or self.options.get("reference_id"),
+            "intensity": float(row.get("intensity") or self.options.get("intensity", 1.0)),
+        }
+        start = time.perf_counter()
+        try:
+            item["id_image"] = load_image(row["source"], base_dir, self.options.get("resolution", DEFAULT_SIZE))
+            if not item["reference_id"]:
+                reference = row.get("reference") or self.options.get("reference")
+                if reference is None:
+                    raise ValueError("row has neither reference nor reference_id")
+                item["reference"] = item["reference"] or _item_key(reference)
+                item["makeup_image"] = self._reference(reference, base_dir)
+        except Exception as e:
+            item["error"] = f"decode: {type(e).__name__}: {e}"
+        item["decode_s"] = time.perf_counter() - start
+        return item
+
+    def _decoded(self, rows: Iterator[Dict], base_dir: str, skip) -> Iterator[Dict]:
+        """Decode rows on the thread pool, in order, with at most ``prefetch`` in flight."""
+        with ThreadPoolExecutor(max_workers=self.decode_workers, thread_name_prefix="bulk-decode") as pool:
+            pending = deque()
+            for index, row in enumerate(rows):
+                if skip(index):
+                    continue
+                pending.append(pool.submit(self._decode, index, row, base_dir))
+                if len(pending) >= self.prefetch:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _infer(self, item: Dict, shard: int) -> Dict:
+        row = {k: item.get(k) for k in ("index", "id", "source", "reference", "reference_id", "intensity")}
+        row.update(shard=shard, output=None, status="error", error=item.get("error"),
+                   decode_s=item["decode_s"], infer_s=None, steps_run=None)
+        if row["error"]:
+            return row
+        start = time.perf_counter()
+        try:
+            image = self.predictor._transfer(
+                item["id_image"], item.get("makeup_image"), item["intensity"],
+                self.options.get("landmark_backend"), reference_id=item["reference_id"],
+                adaptive_steps=self.options.get("adaptive_steps", False), strength=self.options.get("strength", 1.0),
+                cfg_fast_path=self.options.get("cfg_fast_path", False),
+                cfg_truncation=self.options.get("cfg_truncation", 0.0),
+                output_size=self.options.get("output_size", 0),
+            )
+            relative = os.path.join("images", f"{shard:05d}", f"{_safe_name(item['id'])}.jpg")
+            os.makedirs(os.path.dirname(os.path.join(self.output_dir, relative)), exist_ok=True)
+            image.save(os.path.join(self.output_dir, relative))
+            row.update(output=relative, status="ok", steps_run=self.predictor.last_run_stats.get("steps_run"))
+        except Exception as e:
+            row["error"] = f"{type(e).__name__}: {e}"
+        row["infer_s"] = time.perf_counter() - start
+        return row
+
+    def run(self, spec: str, split: str = "train", limit: Optional[int] = None) -> Dict:
+        """Process every pair of ``spec`` that hasn't finished ok in an earlier run; returns a summary."""
+        self.predictor._prepare_runtime()
+        makeup_encoder = self.predictor._load_model_namespace().makeup_encoder
+        complete, finished = self.shard_progress()
+        reused = {index for shard_rows in finished.values() for index in shard_rows}
+        rows = itertools.islice(iter_rows(spec, split), limit)
+        items = self._decoded(rows, _base_dir(spec),
+                              skip=lambda index: index // self.shard_size in complete or index in reused)
+
+        def write(shard, new_rows):
+            # Ok rows from an earlier run are kept; every other item of the shard was run again
+            self._write_shard(shard, list(finished.pop(shard, {}).values()) + new_rows)
+            summary["written_shards"] += 1
+
+        summary = {"skipped_shards": len(complete), "reused_items": len(reused), "written_shards": 0,
+                   "ok": 0, "errors": 0}
+        started = time.perf_counter()
+        current, shard_rows = None, []
+        while True:
+            batch = list(itertools.islice(items, self.batch_size))
+            if not batch:
+                break
+            with shared_reference_embeds(makeup_encoder):
+                for item in batch:
+                    shard = item["index"] // self.shard_size
+                    if current is not None and shard != current:
+                        write(current, shard_rows)
+                        shard_rows = []
+                    current = shard
+                    row = self._infer(item, shard)
+                    summary["ok" if row["status"] == "ok" else "errors"] += 1
+                    shard_rows.append(row)
+            print(f"⏱️ {summary['ok'] + summary['errors']} items, shard {current}, "
+                  f"{(summary['ok'] + summary['errors']) / (time.perf_counter() - started):.2f} items/s")
+        if shard_rows:
+            write(current, shard_rows)
+        summary["elapsed_s"] = time.perf_counter() - started
+        return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Directory, .csv/.jsonl manifest, .arrow/.parquet file or datasets name/path")
+    parser.add_argument("output_dir")
+    look = parser.add_mutually_exclusive_group()
+    look.add_argument("--reference", help="Reference image for rows without one")
+    look.add_argument("--reference-id", help="Catalog look for rows without a reference (MAKEUP_CATALOG_DIR)")
+    parser.add_argument("--intensity", type=float, default=1.0, help="Default makeup intensity")
+    parser.add_argument("--landmark-backend", default=None)
+    parser.add_argument("--adaptive-steps", action="store_true")
+    parser.add_argument("--strength", type=float, default=1.0)
+    parser.add_argument("--cfg-fast-path", action="store_true", help="Skip the unconditional pass at guidance <= 1")
+    parser.add_argument("--cfg-truncation", type=float, default=0.0, help="Final fraction of steps without CFG")
+    parser.add_argument("--resolution", type=int, default=DEFAULT_SIZE, choices=GENERATION_SIZES)
+    parser.add_argument("--output-size", type=int, default=0, help="Bicubic-upscale outputs to this size")
+    parser.add_argument("--split", default="train", help="datasets split")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--shard-size", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--decode-workers", type=int, default=4)
+    parser.add_argument("--prefetch", type=int, default=32)
+    args = parser.parse_args()
+
+    from predict import Predictor
+
+    options = {
+        "reference": os.path.abspath(args.reference) if args.reference else None,
+        "reference_id": args.reference_id,
+        "intensity": args.intensity,
+        "landmark_backend": args.landmark_backend,
+        "adaptive_steps": args.adaptive_steps,
+        "strength": args.strength,
+        "cfg_fast_path": args.cfg_fast_path,
+        "cfg_truncation": args.cfg_truncation,
+        "resolution": args.resolution,
+        "output_size": args.output_size,
+    }
+    runner = BulkRunner(Predictor(), args.output_dir, shard_size=args.shard_size, batch_size=args.batch_size,
+                        decode_workers=args.decode_workers, prefetch=args.prefetch, options=options)
+    spec = os.path.abspath(args.input) if os.path.exists(args.input) else args.input
+    summary = runner.run(spec, split=args.split, limit=args.limit)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
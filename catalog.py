@@ -0,0 +1,236 @@
+"""Precomputed reference-look catalog.
+
+A catalog is built offline from a directory of reference makeup images. Every
+look is decoded and resized once, CLIP-encoded once with the makeup encoder,
+and stored in a compact on-disk index:
+
+    <index_dir>/catalog.arrow   Arrow IPC manifest (id, file, sha256, row)
+    <index_dir>/pixels.npy      uint8 [N, S, S, 3] preprocessed reference images
+    <index_dir>/embeds.npy      float16 [N, T, D] image prompt embeddings
+    <index_dir>/uncond.npy      float16 [T, D] unconditional embedding (shared by all looks)
+    <index_dir>/vectors.npy     float32 [N, D] L2-normalised search vectors
+
+Arrays are opened with ``mmap_mode="r"`` so looking up one look only pages in
+that row. ``predict(reference_id=...)`` then skips upload, decode, resize and
+the CLIP forward pass, and ``nearest()`` suggests similar looks.
+
+    python catalog.py build looks/ /data/catalog
+    python catalog.py search /data/catalog coral_glam -k 5
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import torch
+from PIL import Image
+
+from image_io import decode_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+MANIFEST_NAME = "catalog.arrow"
+
+
+def look_id_for(filename: str) -> str:
+    """Stable look ID from a file name: lower-case stem with non-word characters as '_'."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return re.sub(r"\W+", "_", stem).strip("_").lower()
+
+
+def _search_vector(cond: np.ndarray) -> np.ndarray:
+    vector = cond.astype(np.float32).reshape(-1, cond.shape[-1]).mean(axis=0)
+    return vector / max(float(np.linalg.norm(vector)), 1e-8)
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_catalog(image_dir: str, index_dir: str, makeup_encoder, size: int = 512) -> int:
+    """Encode every image in ``image_dir`` with ``makeup_encoder`` and write the index. Returns the look count."""
+    files = sorted(f for f in os.listdir(image_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+    if not files:
+        raise ValueError(f"No reference images found in {image_dir}")
+    ids = [look_id_for(f) for f in files]
+    duplicates = {i for i in ids if ids.count(i) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate look IDs in {image_dir}: {sorted(duplicates)}")
+    os.makedirs(index_dir, exist_ok=True)
+
+    pixels = embeds = vectors = None
+    uncond_saved = False
+    for row, fname in enumerate(files):
+        path = os.path.join(image_dir, fname)
+        image = decode_image(path, (size, size))
+        with torch.inference_mode():
+            cond, uncond = makeup_encoder.get_image_embeds(image)
+        cond = cond[0].float().cpu().numpy().astype(np.float16)
+        if pixels is None:
+            pixels = np.lib.format.open_memmap(os.path.join(index_dir, "pixels.npy"), mode="w+",
+                                               dtype=np.uint8, shape=(len(files), size, size, 3))
+            embeds = np.lib.format.open_memmap(os.path.join(index_dir, "embeds.npy"), mode="w+",
+                                               dtype=np.float16, shape=(len(files),) + cond.shape)
+            vectors = np.lib.format.open_memmap(os.path.join(index_dir, "vectors.npy"), mode="w+",
+                                                dtype=np.float32, shape=(len(files), cond.shape[-1]))
+        if not uncond_saved:
+            np.save(os.path.join(index_dir, "uncond.npy"), uncond[0].float().cpu().numpy().astype(np.float16))
+            uncond_saved = True
+        pixels[row] = np.asarray(image, dtype=np.uint8)
+        embeds[row] = cond
+        vectors[row] = _search_vector(cond)
+        print(f"✅ Encoded look {ids[row]} ({row + 1}/{len(files)})")
+    for array in (pixels, embeds, vectors):
+        array.flush()
+
+    table = pa.table({
+        "id": ids,
+        "file": files,
+        "sha256": [_sha256(os.path.join(image_dir, f)) for f in files],
+        "row": list(range(len(files))),
+    })
+    table = table.replace_schema_metadata({"size": str(size), "embed_shape": json.dumps(list(embeds.shape[1:]))})
+    with ipc.new_file(os.path.join(index_dir, MANIFEST_NAME), table.schema) as writer:
+        writer.write_table(table)
+    return len(files)
+
+
+def _embed_placement(makeup_encoder) -> Tuple[torch.device, torch.dtype]:
+    """Device and dtype get_image_embeds would return: those of the encoder's floating-point weights.
+
+    The upstream encoder has no ``device`` attribute; its weights are where the models were placed.
+    """
+    if isinstance(makeup_encoder, torch.nn.Module):
+        modules = [makeup_encoder]
+    else:
+        modules = [m for m in vars(makeup_encoder).values() if isinstance(m, torch.nn.Module)]
+    for module in modules:
+        for parameter in module.parameters():
+            if parameter.is_floating_point():
+                return parameter.device, parameter.dtype
+    return torch.device(getattr(makeup_encoder, "device", "cpu")), getattr(makeup_encoder, "dtype", torch.float32)
+
+
+class ReferenceCatalog:
+    """Read-only, memory-mapped view of a catalog built by build_catalog()."""
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        with pa.memory_map(os.path.join(index_dir, MANIFEST_NAME), "r") as source:
+            table = ipc.open_file(source).read_all()
+        self.ids: List[str] = table.column("id").to_pylist()
+        self._rows: Dict[str, int] = dict(zip(self.ids, table.column("row").to_pylist()))
+        self.size = int((table.schema.metadata or {}).get(b"size", b"512"))
+        self._pixels = np.load(os.path.join(index_dir, "pixels.npy"), mmap_mode="r")
+        self._embeds = np.load(os.path.join(index_dir, "embeds.npy"), mmap_mode="r")
+        self._vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r")
+        self._uncond = np.load(os.path.join(index_dir, "uncond.npy"))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, look_id: str) -> bool:
+        return look_id in self._rows
+
+    def _row(self, look_id: str) -> int:
+        if look_id not in self._rows:
+            raise KeyError(f"Unknown reference_id {look_id!r} (catalog {self.index_dir} has {len(self)} looks)")
+        return self._rows[look_id]
+
+    def image(self, look_id: str) -> Image.Image:
+        """The preprocessed (resized) reference image for a look."""
+        return Image.fromarray(np.array(self._pixels[self._row(look_id)]))
+
+    def embeds(self, look_id: str, device="cpu", dtype=torch.float32) -> Tuple[torch.Tensor, torch.Tensor]:
+        """(cond, uncond) image prompt embeddings with a batch dimension, as get_image_embeds returns them."""
+        cond = torch.from_numpy(np.array(self._embeds[self._row(look_id)])).unsqueeze(0)
+        uncond = torch.from_numpy(self._uncond).unsqueeze(0)
+        return cond.to(device=device, dtype=dtype), uncond.to(device=device, dtype=dtype)
+
+    @contextlib.contextmanager
+    def cached_embeds(self, makeup_encoder, look_id: str) -> Iterator[None]:
+        """Make ``makeup_encoder.get_image_embeds`` return the stored embeddings inside the block."""
+        device, dtype = _embed_placement(makeup_encoder)
+        cond, uncond = self.embeds(look_id, device=device, dtype=dtype)
+        # Restore rather than delete, so this nests inside other instance-level patches
+        patched = makeup_encoder.__dict__.get("get_image_embeds")
+        makeup_encoder.get_image_embeds = lambda *args, **kwargs: (cond, uncond)
+        try:
+            yield
+        finally:
+            if patched is None:
+                del makeup_encoder.get_image_embeds
+            else:
+                makeup_encoder.get_image_embeds = patched
+
+    def nearest(self, query, k: int = 5, exclude_self: bool = True) -> List[Tuple[str, float]]:
+        """Top-k looks by cosine similarity to a look ID or a raw embedding vector."""
+        if isinstance(query, str):
+            vector = np.asarray(self._vectors[self._row(query)])
+        else:
+            vector = _search_vector(np.asarray(query))
+        scores = np.asarray(self._vectors) @ vector
+        order = np.argsort(-scores)
+        results = []
+        for row in order:
+            look_id = self.ids[row]
+            if exclude_self and isinstance(query, str) and look_id == query:
+                continue
+            results.append((look_id, float(scores[row])))
+            if len(results) >= k:
+                break
+        return results
+
+
+_CATALOGS: Dict[str, ReferenceCatalog] = {}
+
+
+def get_catalog(index_dir: Optional[str] = None) -> ReferenceCatalog:
+    """Cached catalog for ``index_dir`` (default MAKEUP_CATALOG_DIR)."""
+    index_dir = index_dir or os.environ.get("MAKEUP_CATALOG_DIR")
+    if not index_dir:
+        raise ValueError("reference_id requires a catalog; set MAKEUP_CATALOG_DIR")
+    index_dir = os.path.abspath(index_dir)
+    if index_dir not in _CATALOGS:
+        _CATALOGS[index_dir] = ReferenceCatalog(index_dir)
+    return _CATALOGS[index_dir]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build or query a reference-look catalog")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Encode a directory of reference images")
+    build.add_argument("image_dir")
+    build.add_argument("index_dir")
+    build.add_argument("--size", type=int, default=512)
+    search = sub.add_parser("search", help="Suggest looks similar to a look ID")
+    search.add_argument("index_dir")
+    search.add_argument("look_id")
+    search.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        image_dir, index_dir = os.path.abspath(args.image_dir), os.path.abspath(args.index_dir)
+        from predict import Predictor
+
+        predictor = Predictor()
+        predictor._prepare_runtime()
+        namespace = predictor._load_model_namespace()
+        count = build_catalog(image_dir, index_dir, namespace.makeup_encoder, size=args.size)
+        print(f"✅ Catalog with {count} looks written to {index_dir}")
+    else:
+        catalog = ReferenceCatalog(args.index_dir)
+        print(json.dumps(catalog.nearest(args.look_id, k=args.k), indent=2))
+
+
+if __name__ == "__main__":
+    main()
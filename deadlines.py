@@ -0,0 +1,164 @@
+"""Request deadlines, per-stage budgets and stage timings.
+
+A ``Deadline`` carries an optional total budget for the request plus a budget
+per named stage (``MAKEUP_STAGE_TIMEOUTS``, e.g. ``clone=300,download=1800``).
+Code runs each stage inside ``deadline.stage(name)``; blocking calls take their
+timeout from ``deadline.timeout()``, and loops (downloads, the denoising loop)
+call ``deadline.check()`` between chunks/steps. Running out of budget, or
+``cancel()``, raises ``DeadlineExceeded``, whose message is a JSON object
+naming the stage, so clients get a structured error instead of a fallback image.
+
+``activate()`` makes a deadline the one returned by ``current_deadline()`` for the
+duration of a request; outside a request (setup, scripts) stage budgets still apply.
+"""
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Setup stages only. Diffusion time depends on device, steps and resolution (minutes per image on CPU),
+# so it has no default limit: set one with MAKEUP_STAGE_TIMEOUTS (diffusion=...) or a request timeout_s.
+DEFAULT_STAGE_BUDGETS: Dict[str, float] = {
+    "clone": 300.0,
+    "pip": 180.0,
+    "download": 1800.0,
+}
+
+_ACTIVE: contextvars.ContextVar = contextvars.ContextVar("makeup_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """``stage`` is where the request was; ``limit`` is the budget that ran out ("request" or a stage)."""
+
+    def __init__(self, stage: str, limit: str, budget_s: Optional[float], elapsed_s: float,
+                 cancelled: bool = False):
+        self.stage = stage
+        self.limit = limit
+        self.budget_s = budget_s
+        self.elapsed_s = elapsed_s
+        self.cancelled = cancelled
+        super().__init__(json.dumps(self.to_dict()))
+
+    def to_dict(self) -> Dict:
+        return {
+            "error": "cancelled" if self.cancelled else "deadline_exceeded",
+            "stage": self.stage,
+            "limit": self.limit,
+            "budget_s": self.budget_s,
+            "elapsed_s": round(self.elapsed_s, 3),
+        }
+
+
+def parse_stage_budgets(spec: Optional[str]) -> Dict[str, float]:
+    """``"clone=300,diffusion=120"`` (or a JSON object) -> {stage: seconds}; 0 disables a stage limit."""
+    if not spec:
+        return {}
+    spec = spec.strip()
+    if spec.startswith("{"):
+        return {k: float(v) for k, v in json.loads(spec).items()}
+    budgets = {}
+    for part in spec.split(","):
+        if part.strip():
+            name, _, value = part.partition("=")
+            budgets[name.strip()] = float(value)
+    return budgets
+
+
+class Deadline:
+    def __init__(self, total_s: Optional[float] = None, stage_budgets: Optional[Dict[str, float]] = None):
+        self.start = time.monotonic()
+        self.total_s = total_s if total_s and total_s > 0 else None
+        self.stage_budgets = {k: v for k, v in {**DEFAULT_STAGE_BUDGETS, **(stage_budgets or {})}.items() if v > 0}
+        self.timings: Dict[str, float] = {}
+        self._stages: List[Tuple[str, float, Optional[float]]] = []
+        self._cancelled = threading.Event()
+
+    @classmethod
+    def for_request(cls, total_s: Optional[float] = None) -> "Deadline":
+        """Budgets from MAKEUP_STAGE_TIMEOUTS; total from ``total_s``, else MAKEUP_REQUEST_TIMEOUT_S."""
+        if not total_s:
+            total_s = float(os.environ.get("MAKEUP_REQUEST_TIMEOUT_S", 0) or 0)
+        return cls(total_s, parse_stage_budgets(os.environ.get("MAKEUP_STAGE_TIMEOUTS")))
+
+    # -- budgets -----------------------------------------------------------
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def _limit(self) -> Tuple[str, Optional[float], Optional[float]]:
+        """(name, budget, absolute end) of the tightest active limit."""
+        name, budget = "request", self.total_s
+        end = self.start + self.total_s if self.total_s is not None else None
+        for stage, started, stage_budget in self._stages:
+            if stage_budget is not None and (end is None or started + stage_budget < end):
+                name, budget, end = stage, stage_budget, started + stage_budget
+        return name, budget, end
+
+    def _error(self, cancelled: bool = False) -> DeadlineExceeded:
+        limit, budget, _end = self._limit()
+        stage = self._stages[-1][0] if self._stages else "request"
+        return DeadlineExceeded(stage, limit, budget, self.elapsed(), cancelled=cancelled)
+
+    def timeout(self, default: Optional[float] = None) -> Optional[float]:
+        """Seconds left for the current stage (for blocking calls); ``default`` when unbounded."""
+        self.check()
+        _name, _budget, end = self._limit()
+        if end is None:
+            return default
+        left = max(0.001, end - time.monotonic())
+        return min(left, default) if default is not None else left
+
+    def check(self) -> None:
+        """Raise DeadlineExceeded if the current stage or the request is out of budget, or was cancelled."""
+        if self._cancelled.is_set():
+            raise self._error(cancelled=True)
+        _name, _budget, end = self._limit()
+        if end is not None and time.monotonic() > end:
+            raise self._error()
+
+    def expired(self, exc: BaseException) -> DeadlineExceeded:
+        """DeadlineExceeded for a blocking call that hit its timeout (e.g. subprocess.TimeoutExpired)."""
+        error = self._error()
+        error.__cause__ = exc
+        return error
+
+    def cancel(self) -> None:
+        """Make the next check() raise; the denoising loop checks between steps."""
+        self._cancelled.set()
+
+    # -- stages ------------------------------------------------------------
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a stage (accumulated per name) and apply its budget while it runs."""
+        started = time.monotonic()
+        self._stages.append((name, started, self.stage_budgets.get(name)))
+        try:
+            self.check()
+            yield
+        finally:
+            self._stages.pop()
+            self.timings[name] = self.timings.get(name, 0.0) + time.monotonic() - started
+
+    def has_limit(self, stage: str) -> bool:
+        return self.total_s is not None or stage in self.stage_budgets
+
+    def report(self) -> Dict[str, float]:
+        return {**{k: round(v, 3) for k, v in self.timings.items()}, "total": round(self.elapsed(), 3)}
+
+    @contextlib.contextmanager
+    def activate(self) -> Iterator["Deadline"]:
+        token = _ACTIVE.set(self)
+        try:
+            yield self
+        finally:
+            _ACTIVE.reset(token)
+
+
+def current_deadline() -> Deadline:
+    """The active request's deadline, else stage budgets only (setup, scripts)."""
+    deadline = _ACTIVE.get()
+    if deadline is None:
+        deadline = Deadline(None, parse_stage_budgets(os.environ.get("MAKEUP_STAGE_TIMEOUTS")))
+    return deadline
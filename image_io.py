@@ -0,0 +1,116 @@
+"""Shared image decoding for the inference and eye-preservation stages.
+
+Uploaded phone photos are often 12-48MP JPEGs while the pipeline works at
+512x512 (or another of ``GENERATION_SIZES``). ``decode_image`` asks libjpeg for a DCT-domain reduced decode
+(``Image.draft``: 1/2, 1/4 or 1/8 scale, never below the target size), applies
+the EXIF orientation and resizes once. Each request decodes its source and
+reference exactly once and hands the same images to every stage.
+
+After generation the output lives in one writable HxWx3 uint8 buffer
+(``as_rgb_array``) until the JPEG encode: eye preservation edits it in place and
+only touches the bounding box of the eye mask (``composite_eyes``), instead of
+round-tripping whole frames through PIL YCbCr and float32 copies. ``upscale``
+is the optional cheap (bicubic) resize of a low-resolution output to a larger
+delivery size.
+"""
+import os
+from typing import Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+PathLike = Union[str, os.PathLike]
+
+# Square generation sizes (multiples of 64, so latents stay a multiple of 8); 512 is the trained size
+GENERATION_SIZES = (256, 384, 512, 768)
+DEFAULT_SIZE = 512
+
+
+def decode_image(path: PathLike, size: Tuple[int, int] = (512, 512)) -> Image.Image:
+    """Decode ``path`` to an RGB image of exactly ``size``, honouring EXIF orientation."""
+    with Image.open(path) as img:
+        if img.format == "JPEG":
+            # Reduced-scale JPEG decode; draft keeps both dimensions >= the requested size.
+            # The target is square, so rotating by EXIF orientation afterwards doesn't change that.
+            img.draft("RGB", size)
+        return fit_image(img, size)
+
+
+def fit_image(img: Image.Image, size: Tuple[int, int] = (512, 512)) -> Image.Image:
+    """An already opened image as RGB of exactly ``size``, honouring EXIF orientation."""
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if img.size != tuple(size):
+        img = img.resize(tuple(size))
+    return img
+
+
+def upscale(image: Image.Image, size: int) -> Image.Image:
+    """Bicubic resize to ``size`` x ``size``; returns ``image`` itself when it already has that size."""
+    if image.size == (size, size):
+        return image
+    return image.resize((size, size), Image.BICUBIC)
+
+
+def decode_full(path: PathLike) -> Image.Image:
+    """Full-resolution RGB decode, oriented per EXIF (the pre-draft behaviour, kept for benchmarks)."""
+    with Image.open(path) as img:
+        img = ImageOps.exif_transpose(img)
+        return img.convert("RGB")
+
+
+def as_rgb_array(image) -> np.ndarray:
+    """The pipeline output as a writable, C-contiguous HxWx3 uint8 array (at most one copy).
+
+    Accepts a PIL image, a NumPy array (uint8, or float in [0, 1] as with ``output_type="np"``)
+    or a CHW/HWC tensor in [0, 1].
+    """
+    if isinstance(image, Image.Image):
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return np.array(image)
+    if hasattr(image, "detach"):
+        image = image.detach().float().cpu().numpy()
+    array = np.asarray(image)
+    if array.ndim == 4:
+        array = array[0]
+    if array.ndim == 3 and array.shape[0] in (1, 3) and array.shape[-1] not in (1, 3):
+        array = array.transpose(1, 2, 0)
+    if array.dtype != np.uint8:
+        if np.issubdtype(array.dtype, np.floating) and array.max() <= 1.0:
+            array = array * 255.0
+        array = np.clip(np.rint(array), 0, 255).astype(np.uint8)
+    if array.shape[-1] == 1:
+        array = np.repeat(array, 3, axis=-1)
+    if not (array.flags.c_contiguous and array.flags.writeable):
+        array = np.array(array, order="C")
+    return array
+
+
+def composite_eyes(source: np.ndarray, output: np.ndarray, mask: np.ndarray, mode: str = "rgb") -> np.ndarray:
+    """Blend ``source`` into ``output`` (in place) with a soft uint8 ``mask``.
+
+    ``mode="chroma"`` keeps the output's luma and takes the source's Cb/Cr (JPEG
+    YCbCr), expressed directly as an RGB offset; ``"rgb"`` blends all channels.
+    Only the mask's bounding box is read or written.
+    """
+    ys, xs = np.nonzero(mask)
+    if len(ys) == 0:
+        return output
+    box = (slice(ys.min(), ys.max() + 1), slice(xs.min(), xs.max() + 1))
+    weight = mask[box].astype(np.float32)[..., None] * (1.0 / 255.0)
+    src = source[box].astype(np.float32)
+    out = output[box].astype(np.float32)
+    if mode == "chroma":
+        diff = src - out
+        d_cb = diff @ np.array([-0.168736, -0.331264, 0.5], dtype=np.float32)
+        d_cr = diff @ np.array([0.5, -0.418688, -0.081312], dtype=np.float32)
+        delta = np.stack([1.402 * d_cr, -0.344136 * d_cb - 0.714136 * d_cr, 1.772 * d_cb], axis=-1)
+        out += weight * delta
+    else:
+        out += weight * (src - out)
+    np.clip(np.rint(out, out=out), 0, 255, out=out)
+    output[box] = out
+    return output
+
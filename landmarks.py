@@ -0,0 +1,253 @@
+"""Pluggable face landmark backends for eye preservation.
+
+Every backend returns the 12 eye points in 68-point (iBUG 300-W) order, i.e.
+indices 36-41 (image-left eye) and 42-47 (image-right eye), plus the face box
+used for the rectangle fallback. Backends are built lazily and cached per
+process, so repeated requests reuse the same detector/model instances.
+
+Select with ``MAKEUP_LANDMARK_BACKEND`` (spiga | mediapipe | face_alignment) or
+the ``landmark_backend`` predictor input.
+
+A request detects landmarks once; the same result builds the eye mask
+(``eye_mask``) and, for backends with a full 68-point set, the pose map fed to
+the pose ControlNet (``pose_map``), instead of running upstream ``get_draw``'s
+own facelib + SPIGA pass on the same image.
+
+The cached instances are shared by every thread of the process; ``detect_landmarks``
+serializes detection per backend (the detector models are not guaranteed to be
+thread-safe) so callers such as pipeline.StagedPipeline can run it from a pool.
+"""
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+EYE_INDICES = list(range(36, 48))
+LANDMARK_BACKENDS = ("spiga", "mediapipe", "face_alignment")
+DEFAULT_LANDMARK_BACKEND = "spiga"
+
+# 68-point groups drawn into the pose map like upstream spiga_draw: (indices, RGB colour, closed + filled)
+POSE_MAP_PARTS = [
+    (range(0, 17), (0, 255, 0), False),       # face contour
+    (range(17, 22), (255, 255, 0), False),    # eyebrows
+    (range(22, 27), (255, 255, 0), False),
+    (range(27, 31), (255, 165, 0), False),    # nose bridge
+    (range(31, 36), (255, 165, 0), False),    # nose base
+    (range(36, 42), (255, 0, 255), True),     # eyes
+    (range(42, 48), (255, 0, 255), True),
+    (range(48, 60), (0, 255, 255), True),     # outer lips
+    (range(60, 68), (0, 0, 255), True),       # inner lips
+]
+POSE_MAP_LINE_WIDTH = 4
+
+# MediaPipe FaceMesh (468 points) indices matching 68-point eye indices 36..47
+MEDIAPIPE_EYE_INDICES = [33, 160, 158, 133, 153, 144, 362, 385, 387, 263, 373, 380]
+
+
+class LandmarkResult:
+    """Landmarks for the first detected face.
+
+    ``eyes`` is a (12, 2) float array for 68-point indices 36-47 (None when the
+    backend found a face but no landmarks), ``bbox`` is (x, y, w, h) of the face
+    and ``points`` holds the full landmark set when the backend produces one.
+    """
+
+    def __init__(self, eyes: Optional[np.ndarray], bbox: Optional[Tuple[float, float, float, float]],
+                 points: Optional[np.ndarray] = None):
+        self.eyes = eyes
+        self.bbox = bbox
+        self.points = points
+
+
+class LandmarkBackend:
+    name = ""
+
+    def detect(self, rgb: np.ndarray) -> Optional[LandmarkResult]:
+        """Return landmarks for the first face in an RGB uint8 image, or None if no face was found."""
+        raise NotImplementedError
+
+
+def _bbox_from_points(points: np.ndarray) -> Tuple[float, float, float, float]:
+    x0, y0 = points.min(axis=0)
+    x1, y1 = points.max(axis=0)
+    return float(x0), float(y0), float(x1 - x0), float(y1 - y0)
+
+
+class SpigaBackend(LandmarkBackend):
+    """facelib face detection followed by SPIGA 300-W landmarks (the original path)."""
+
+    name = "spiga"
+
+    def __init__(self):
+        try:
+            from spiga.inference.config import ModelConfig as _SPIGAConfig
+            from spiga.inference.framework import SPIGAFramework as _SPIGAFramework
+            from facelib import FaceDetector as _FaceDetector
+        except Exception as e:
+            raise RuntimeError(f"Required packages for SPIGA landmarks are missing: {e}")
+        self.processor = _SPIGAFramework(_SPIGAConfig("300wpublic"))
+        self.detector = _FaceDetector()
+
+    def detect(self, rgb: np.ndarray) -> Optional[LandmarkResult]:
+        import cv2
+
+        bgr = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+        _faces, boxes, _scores, _landmarks = self.detector.detect_align(bgr)
+        boxes = [] if boxes is None else boxes.cpu().numpy().tolist()
+        if not boxes:
+            return None
+        # SPIGA bbox format is (x, y, w, h)
+        bbox_list = [(float(x0), float(y0), float(x1 - x0), float(y1 - y0)) for (x0, y0, x1, y1) in boxes]
+        features = self.processor.inference(bgr, bbox_list)
+        lms = features.get("landmarks")
+        if lms is None or len(lms) == 0:
+            return LandmarkResult(None, bbox_list[0])
+        points = np.asarray(lms[0], dtype=np.float32)
+        eyes = points[EYE_INDICES] if len(points) >= 48 else None
+        return LandmarkResult(eyes, bbox_list[0], points)
+
+
+class MediapipeBackend(LandmarkBackend):
+    """MediaPipe FaceMesh; a few MB of TFLite models and fast on CPU."""
+
+    name = "mediapipe"
+
+    def __init__(self):
+        try:
+            import mediapipe as mp
+        except Exception as e:
+            raise RuntimeError(f"mediapipe is required for the mediapipe landmark backend: {e}")
+        self.face_mesh = mp.solutions.face_mesh.FaceMesh(
+            static_image_mode=True,
+            max_num_faces=1,
+            refine_landmarks=False,
+            min_detection_confidence=0.5,
+        )
+
+    def detect(self, rgb: np.ndarray) -> Optional[LandmarkResult]:
+        result = self.face_mesh.process(np.ascontiguousarray(rgb))
+        if not result.multi_face_landmarks:
+            return None
+        h, w = rgb.shape[:2]
+        mesh = result.multi_face_landmarks[0].landmark
+        points = np.array([(lm.x * w, lm.y * h) for lm in mesh], dtype=np.float32)
+        return LandmarkResult(points[MEDIAPIPE_EYE_INDICES], _bbox_from_points(points), points)
+
+
+class FaceAlignmentBackend(LandmarkBackend):
+    """face-alignment (FAN) 2D landmarks, natively in 68-point order."""
+
+    name = "face_alignment"
+
+    def __init__(self):
+        try:
+            import face_alignment
+        except Exception as e:
+            raise RuntimeError(f"face-alignment is required for the face_alignment landmark backend: {e}")
+        landmarks_type = getattr(face_alignment.LandmarksType, "TWO_D", None) or face_alignment.LandmarksType._2D
+        device = os.environ.get("MAKEUP_LANDMARK_DEVICE", "cpu")
+        self.model = face_alignment.FaceAlignment(landmarks_type, device=device, flip_input=False)
+
+    def detect(self, rgb: np.ndarray) -> Optional[LandmarkResult]:
+        preds = self.model.get_landmarks_from_image(rgb)
+        if not preds:
+            return None
+        points = np.asarray(preds[0], dtype=np.float32)[:, :2]
+        return LandmarkResult(points[EYE_INDICES], _bbox_from_points(points), points)
+
+
+_BACKEND_CLASSES = {
+    "spiga": SpigaBackend,
+    "mediapipe": MediapipeBackend,
+    "face_alignment": FaceAlignmentBackend,
+}
+_BACKENDS: Dict[str, LandmarkBackend] = {}
+_BACKEND_LOCKS: Dict[str, threading.Lock] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def register_landmark_backend(name: str, factory) -> None:
+    """Register an extra backend (a LandmarkBackend subclass or zero-arg factory) under ``name``."""
+    _BACKEND_CLASSES[name] = factory
+    _BACKENDS.pop(name, None)
+
+
+def resolve_backend_name(name: Optional[str] = None) -> str:
+    """Resolve an explicit name, else MAKEUP_LANDMARK_BACKEND, else the SPIGA default."""
+    if not name or name == "auto":
+        name = os.environ.get("MAKEUP_LANDMARK_BACKEND", DEFAULT_LANDMARK_BACKEND)
+    name = name.lower().replace("-", "_")
+    if name not in _BACKEND_CLASSES:
+        raise ValueError(f"Unknown landmark backend {name!r}; expected one of {tuple(_BACKEND_CLASSES)}")
+    return name
+
+
+def get_landmark_backend(name: Optional[str] = None) -> LandmarkBackend:
+    """Return the cached backend instance for ``name`` (see resolve_backend_name)."""
+    name = resolve_backend_name(name)
+    with _REGISTRY_LOCK:
+        if name not in _BACKENDS:
+            _BACKENDS[name] = _BACKEND_CLASSES[name]()
+            _BACKEND_LOCKS.setdefault(name, threading.Lock())
+        return _BACKENDS[name]
+
+
+def detect_landmarks(rgb: np.ndarray, name: Optional[str] = None) -> Optional[LandmarkResult]:
+    """``get_landmark_backend(name).detect(rgb)``, one call at a time per backend."""
+    backend = get_landmark_backend(name)
+    with _BACKEND_LOCKS[resolve_backend_name(name)]:
+        return backend.detect(rgb)
+
+
+def clear_landmark_backends() -> None:
+    """Drop the cached backend instances (they are rebuilt on next use)."""
+    _BACKENDS.clear()
+
+
+def pose_map(result: Optional[LandmarkResult], size: int, source_size: Sequence[int]) -> Optional[Image.Image]:
+    """Render the pose-ControlNet map (size x size RGB) from 68-point landmarks with cv2.
+
+    No face gives a black map, as upstream get_draw does. Returns None when the
+    backend has no 68-point set (e.g. MediaPipe's mesh), so the caller can fall
+    back to get_draw.
+    """
+    import cv2
+
+    canvas = np.zeros((size, size, 3), dtype=np.uint8)
+    if result is None:
+        return Image.fromarray(canvas)
+    if result.points is None or len(result.points) != 68:
+        return None
+    scale = np.array([size / float(source_size[0]), size / float(source_size[1])], dtype=np.float32)
+    points = np.rint(np.asarray(result.points, dtype=np.float32)[:, :2] * scale).astype(np.int32)
+    for indices, color, closed in POSE_MAP_PARTS:
+        part = points[list(indices)].reshape(-1, 1, 2)
+        if closed:
+            cv2.fillPoly(canvas, [part], color, lineType=cv2.LINE_AA)
+        cv2.polylines(canvas, [part], closed, color, thickness=POSE_MAP_LINE_WIDTH, lineType=cv2.LINE_AA)
+    return Image.fromarray(canvas)
+
+
+def eye_mask(result: Optional[LandmarkResult], size: Sequence[int]) -> Optional[Image.Image]:
+    """Binary "L" mask of both eyes: landmark polygons, else bbox-relative rectangles.
+
+    Returns None when there is nothing to mask (no face).
+    """
+    if result is None:
+        return None
+    mask = Image.new("L", tuple(size), 0)
+    draw = ImageDraw.Draw(mask)
+    if result.eyes is not None and len(result.eyes) == 12:
+        pts: List[Tuple[float, float]] = [(float(x), float(y)) for (x, y) in result.eyes]
+        draw.polygon(pts[:6], fill=255)
+        draw.polygon(pts[6:], fill=255)
+    elif result.bbox is not None:
+        # Fallback: approximate eye rectangles from the face bbox
+        x, y, w, h = result.bbox
+        draw.rectangle([int(x + 0.20 * w), int(y + 0.35 * h), int(x + 0.45 * w), int(y + 0.55 * h)], fill=255)
+        draw.rectangle([int(x + 0.55 * w), int(y + 0.35 * h), int(x + 0.80 * w), int(y + 0.55 * h)], fill=255)
+    else:
+        return None
+    return mask
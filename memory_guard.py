@@ -0,0 +1,181 @@
+"""Per-request memory accounting and a growth guard for long-lived predictors.
+
+``MemoryGuard.track()`` wraps one request and records RSS (plus CUDA allocated
+and reserved memory when a GPU is present) before and after it. From the
+post-request samples it detects sustained growth: a least-squares slope over the
+last ``window`` requests whose total exceeds ``growth_mb``. Only those last
+``window`` samples are kept (plus running first/peak values), so the guard
+itself doesn't grow in a long-running server.
+
+RSS counts every resident page mapped by the process, including pages it shares.
+In a WorkerPool worker that is the shared model weights too (shared memory and
+pages inherited copy-on-write from the parent): a worker touching more of them
+shows RSS growth, and each worker reports them in full. Compare budgets and
+slopes from pool workers with that in mind; WorkerPool.memory() gives PSS, which
+splits shared pages between the processes that map them.
+
+With ``MAKEUP_MEMORY_BUDGET_MB`` (RSS) and/or ``MAKEUP_CUDA_BUDGET_MB`` (CUDA
+reserved) set, ``MAKEUP_MEMORY_POLICY`` decides what happens once a request ends
+over budget:
+
+- ``none``     only log (default)
+- ``trim``     gc, release the CUDA caching allocator and return free heap to the OS
+- ``recycle``  trim, and if still over budget ask the owner to recycle
+               (``recycle_requested``): the Predictor drops and reloads its models,
+               a WorkerPool worker exits and is re-forked.
+"""
+import contextlib
+import ctypes
+import gc
+import os
+import resource
+import sys
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional
+
+import torch
+
+MEMORY_POLICIES = ("none", "trim", "recycle")
+
+
+def memory_snapshot() -> Dict[str, float]:
+    """RSS of this process in MB, plus CUDA allocated/reserved MB when CUDA is available."""
+    snapshot = {"rss_mb": 0.0}
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    snapshot["rss_mb"] = int(line.split()[1]) / 1024.0
+                    break
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        snapshot["rss_mb"] = peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+    if torch.cuda.is_available():
+        snapshot["cuda_allocated_mb"] = torch.cuda.memory_allocated() / 1024.0 ** 2
+        snapshot["cuda_reserved_mb"] = torch.cuda.memory_reserved() / 1024.0 ** 2
+    return snapshot
+
+
+def trim_caches() -> None:
+    """Collect garbage, empty the CUDA cache and hand free malloc arenas back to the OS."""
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    if sys.platform.startswith("linux"):
+        try:
+            ctypes.CDLL("libc.so.6").malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+
+def _slope(values: List[float]) -> float:
+    n = len(values)
+    mean_x = (n - 1) / 2.0
+    mean_y = sum(values) / n
+    num = sum((i - mean_x) * (v - mean_y) for i, v in enumerate(values))
+    den = sum((i - mean_x) ** 2 for i in range(n))
+    return num / den if den else 0.0
+
+
+class MemoryGuard:
+    def __init__(self, budget_mb: Optional[float] = None, cuda_budget_mb: Optional[float] = None,
+                 policy: str = "none", window: int = 20, growth_mb: float = 256.0):
+        if policy not in MEMORY_POLICIES:
+            raise ValueError(f"Unknown memory policy {policy!r}; expected one of {MEMORY_POLICIES}")
+        self.budget_mb = budget_mb
+        self.cuda_budget_mb = cuda_budget_mb
+        self.policy = policy
+        self.window = max(2, int(window))
+        self.growth_mb = growth_mb
+        self.history: Deque[Dict[str, float]] = deque(maxlen=self.window)
+        self.requests = 0
+        self.first_rss_mb: Optional[float] = None
+        self.peak_rss_mb: Optional[float] = None
+        self.trims = 0
+        self.recycles = 0
+        self.recycle_requested = False
+        self._growth_warned_at = -1
+
+    @classmethod
+    def from_env(cls) -> "MemoryGuard":
+        def number(name):
+            value = os.environ.get(name, "")
+            return float(value) if value else None
+
+        return cls(
+            budget_mb=number("MAKEUP_MEMORY_BUDGET_MB"),
+            cuda_budget_mb=number("MAKEUP_CUDA_BUDGET_MB"),
+            policy=os.environ.get("MAKEUP_MEMORY_POLICY", "none").lower(),
+            window=int(os.environ.get("MAKEUP_MEMORY_WINDOW", 20)),
+            growth_mb=float(os.environ.get("MAKEUP_MEMORY_GROWTH_MB", 256.0)),
+        )
+
+    @contextlib.contextmanager
+    def track(self) -> Iterator[None]:
+        """Record memory around one request, then apply growth detection and the budget policy."""
+        before = memory_snapshot()
+        try:
+            yield
+        finally:
+            after = memory_snapshot()
+            record = {f"before_{k}": v for k, v in before.items()}
+            record.update({f"after_{k}": v for k, v in after.items()})
+            self.history.append(record)
+            self.requests += 1
+            if self.first_rss_mb is None:
+                self.first_rss_mb = after["rss_mb"]
+            self.peak_rss_mb = max(self.peak_rss_mb or 0.0, after["rss_mb"])
+            self.check(after)
+
+    def growth_per_request_mb(self, key: str = "rss_mb") -> Optional[float]:
+        """Slope of post-request ``key`` over the last ``window`` requests, None until the window is full."""
+        values = [r[f"after_{key}"] for r in self.history if f"after_{key}" in r]
+        if len(values) < self.window:
+            return None
+        return _slope(values)
+
+    def sustained_growth(self) -> bool:
+        for key in ("rss_mb", "cuda_reserved_mb"):
+            slope = self.growth_per_request_mb(key)
+            if slope is not None and slope * (self.window - 1) >= self.growth_mb:
+                return True
+        return False
+
+    def over_budget(self, snapshot: Dict[str, float]) -> bool:
+        if self.budget_mb is not None and snapshot["rss_mb"] > self.budget_mb:
+            return True
+        return self.cuda_budget_mb is not None and snapshot.get("cuda_reserved_mb", 0.0) > self.cuda_budget_mb
+
+    def check(self, snapshot: Dict[str, float]) -> None:
+        requests = self.requests
+        if self.sustained_growth() and requests - self._growth_warned_at >= self.window:
+            self._growth_warned_at = requests
+            print(f"⚠️ Sustained memory growth: {self.growth_per_request_mb():+.1f} MB RSS/request "
+                  f"over the last {self.window} requests (now {snapshot['rss_mb']:.0f} MB)")
+        if self.policy == "none" or not self.over_budget(snapshot):
+            return
+        trim_caches()
+        self.trims += 1
+        trimmed = memory_snapshot()
+        self.history[-1].update({f"trimmed_{k}": v for k, v in trimmed.items()})
+        print(f"🧹 Over memory budget: RSS {snapshot['rss_mb']:.0f} -> {trimmed['rss_mb']:.0f} MB after trim")
+        if self.policy == "recycle" and self.over_budget(trimmed):
+            self.recycle_requested = True
+
+    def recycled(self) -> None:
+        """Called by the owner once it has acted on ``recycle_requested``."""
+        self.recycle_requested = False
+        self.recycles += 1
+
+    def report(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "first_rss_mb": self.first_rss_mb,
+            "last_rss_mb": self.history[-1]["after_rss_mb"] if self.history else None,
+            "peak_rss_mb": self.peak_rss_mb,
+            "rss_growth_per_request_mb": self.growth_per_request_mb(),
+            "cuda_reserved_growth_per_request_mb": self.growth_per_request_mb("cuda_reserved_mb"),
+            "sustained_growth": self.sustained_growth(),
+            "trims": self.trims,
+            "recycles": self.recycles,
+        }
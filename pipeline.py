@@ -0,0 +1,249 @@
+"""Staged request pipeline: CPU pre/post-processing overlapped with diffusion.
+
+    decode, landmarks, pose map  ->  diffusion  ->  eye compositing, JPEG encode
+       (pre pool, N threads)        (1 thread)          (post pool, M threads)
+
+Each request goes through the same three Predictor stages as predict()
+(``_preprocess`` / ``_diffuse`` / ``_postprocess``, with the eye-preservation
+settings of ``predict.EYE_PRESERVATION_DEFAULTS``), so the output is predict()'s;
+only the scheduling differs: the stages run on their own threads connected by
+bounded queues. While request N is in the denoising
+loop, request N+1 is decoded and its pose map drawn, and request N-1 is
+composited and encoded, so the accelerator no longer idles during CPU work.
+The diffusion stage is a single thread: it owns the model namespace, which is not
+safe to call concurrently. Landmark detection is serialized per backend
+(landmarks.detect_landmarks); decode, pose rendering, compositing and encode run
+in parallel. With ``MAKEUP_POSE_MAP=upstream`` the pose map is drawn by
+``get_draw`` inside the diffusion stage, as before.
+
+Queues hold at most ``queue_size`` requests each, so submit() blocks when the
+pipeline is full instead of piling up decoded images. ``report()`` gives each
+stage's utilization (busy time over wall time per thread), item count, mean
+latency, mean time spent waiting in its input queue and the deepest that queue
+got.
+
+    with StagedPipeline(Predictor()) as pipeline:
+        futures = [pipeline.submit(src, ref, makeup_intensity=1.0) for src, ref in pairs]
+        paths = [f.result() for f in futures]
+        print(pipeline.report())
+"""
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from deadlines import Deadline
+from image_io import DEFAULT_SIZE, decode_image
+
+DEFAULT_OUTPUT_DIR = "/tmp/makeup_pipeline"
+STAGES = ("pre", "diffusion", "post")
+_STOP = object()
+
+
+class StageStats:
+    """Busy time, items and queue behaviour of one stage."""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.errors = 0
+        self.busy_s = 0.0
+        self.wait_s = 0.0
+        self.max_depth = 0
+        self._lock = threading.Lock()
+
+    def queued(self, depth: int) -> None:
+        with self._lock:
+            self.max_depth = max(self.max_depth, depth)
+
+    def record(self, busy_s: float, wait_s: float, ok: bool) -> None:
+        with self._lock:
+            self.items += 1
+            self.errors += not ok
+            self.busy_s += busy_s
+            self.wait_s += wait_s
+
+    def report(self, wall_s: float) -> Dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "items": self.items,
+                "errors": self.errors,
+                "busy_s": round(self.busy_s, 3),
+                "utilization": round(self.busy_s / (wall_s * self.workers), 3) if wall_s > 0 else 0.0,
+                "mean_s": round(self.busy_s / self.items, 4) if self.items else None,
+                "mean_queue_wait_s": round(self.wait_s / self.items, 4) if self.items else None,
+                "max_queue_depth": self.max_depth,
+            }
+
+
+class _Job:
+    __slots__ = ("index", "request", "deadline", "future", "state", "pixels", "queued_at")
+
+    def __init__(self, index: int, request: Dict, deadline: Deadline):
+        self.index = index
+        self.request = request
+        self.deadline = deadline
+        self.future: Future = Future()
+        self.state = None
+        self.pixels = None
+        self.queued_at = time.perf_counter()
+
+
+class StagedPipeline:
+    def __init__(self, predictor, pre_workers: Optional[int] = None, post_workers: Optional[int] = None,
+                 queue_size: Optional[int] = None, output_dir: str = DEFAULT_OUTPUT_DIR):
+        self.predictor = predictor
+        self.pre_workers = pre_workers or int(os.environ.get("MAKEUP_PIPELINE_PRE_WORKERS", 2))
+        self.post_workers = post_workers or int(os.environ.get("MAKEUP_PIPELINE_POST_WORKERS", 2))
+        self.queue_size = queue_size or int(os.environ.get("MAKEUP_PIPELINE_QUEUE", 4))
+        self.output_dir = output_dir
+        self.stats = {
+            "pre": StageStats("pre", self.pre_workers),
+            "diffusion": StageStats("diffusion", 1),
+            "post": StageStats("post", self.post_workers),
+        }
+        self._queues = {name: queue.Queue(maxsize=self.queue_size) for name in STAGES}
+        self._threads: Dict[str, List[threading.Thread]] = {}
+        self._counter = itertools.count()
+        self._started_at: Optional[float] = None
+        self._stopped_at: Optional[float] = None
+
+    def start(self) -> "StagedPipeline":
+        """Prepare the runtime and load the models once, then start the stage threads."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.predictor._prepare_runtime()
+        self.predictor._load_model_namespace()
+        stages = [
+            ("pre", self.pre_workers, self._pre, "diffusion"),
+            ("diffusion", 1, self._diffuse, "post"),
+            ("post", self.post_workers, self._post, None),
+        ]
+        for name, workers, fn, next_stage in stages:
+            self._threads[name] = [
+                threading.Thread(target=self._worker, args=(name, fn, next_stage), name=f"pipeline-{name}-{i}",
+                                 daemon=True)
+                for i in range(workers)
+            ]
+            for thread in self._threads[name]:
+                thread.start()
+        self._started_at = time.perf_counter()
+        return self
+
+    def submit(self, source_path: str, reference_path: Optional[str] = None, makeup_intensity: float = 1.0,
+               landmark_backend: Optional[str] = None, reference_id: Optional[str] = None,
+               adaptive_steps: bool = False, strength: float = 1.0, cfg_fast_path: bool = False,
+               cfg_truncation: float = 0.0, resolution: int = DEFAULT_SIZE, output_size: int = 0,
+               timeout_s: float = 0.0,
+               output_path: Optional[str] = None) -> Future:
+        """Queue one request; blocks while the pre stage's queue is full. The future resolves to the JPEG path."""
+        if not self._threads:
+            self.start()
+        if reference_path is None and not reference_id:
+            raise ValueError("Either reference_path or reference_id is required")
+        index = next(self._counter)
+        request = {
+            "source_path": source_path,
+            "reference_path": reference_path,
+            "makeup_intensity": makeup_intensity,
+            "landmark_backend": landmark_backend,
+            "reference_id": reference_id,
+            "adaptive_steps": adaptive_steps,
+            "strength": strength,
+            "cfg_fast_path": cfg_fast_path,
+            "cfg_truncation": cfg_truncation,
+            "resolution": resolution,
+            "output_size": output_size,
+            "output_path": output_path or os.path.join(self.output_dir, f"{index:08d}.jpg"),
+        }
+        # The deadline starts at submission, so time spent queued counts against it
+        job = _Job(index, request, Deadline.for_request(timeout_s))
+        self._put("pre", job)
+        return job.future
+
+    # -- stages ------------------------------------------------------------
+    def _put(self, stage: str, job: _Job) -> None:
+        job.queued_at = time.perf_counter()
+        self._queues[stage].put(job)
+        self.stats[stage].queued(self._queues[stage].qsize())
+
+    def _worker(self, stage: str, fn: Callable[[_Job], Optional[str]], next_stage: Optional[str]) -> None:
+        inbox, stats = self._queues[stage], self.stats[stage]
+        while True:
+            job = inbox.get()
+            if job is _STOP:
+                return
+            if stage == "pre" and not job.future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            waited = started - job.queued_at
+            try:
+                with job.deadline.activate():
+                    result = fn(job)
+            except BaseException as e:
+                stats.record(time.perf_counter() - started, waited, ok=False)
+                job.future.set_exception(e)
+                continue
+            stats.record(time.perf_counter() - started, waited, ok=True)
+            if next_stage is None:
+                job.future.set_result(result)
+            else:
+                self._put(next_stage, job)
+
+    def _pre(self, job: _Job) -> None:
+        request = job.request
+        with job.deadline.stage("decode"):
+            size = (request["resolution"], request["resolution"])
+            id_image = decode_image(request["source_path"], size)
+            makeup_image = None if request["reference_id"] else decode_image(request["reference_path"], size)
+        job.state = self.predictor._preprocess(
+            id_image, makeup_image, request["landmark_backend"], reference_id=request["reference_id"]
+        )
+
+    def _diffuse(self, job: _Job) -> None:
+        request = job.request
+        job.pixels = self.predictor._diffuse(
+            job.state, request["makeup_intensity"], adaptive_steps=request["adaptive_steps"],
+            strength=request["strength"], cfg_fast_path=request["cfg_fast_path"],
+            cfg_truncation=request["cfg_truncation"],
+        )
+
+    def _post(self, job: _Job) -> str:
+        image = self.predictor._postprocess(job.state, job.pixels, output_size=job.request["output_size"])
+        path = job.request["output_path"]
+        with job.deadline.stage("encode"):
+            image.save(path)
+        job.state = job.pixels = None
+        return path
+
+    # -- lifecycle -----------------------------------------------------------
+    def report(self) -> Dict:
+        end = self._stopped_at or time.perf_counter()
+        wall_s = end - self._started_at if self._started_at is not None else 0.0
+        completed = self.stats["post"].items - self.stats["post"].errors
+        return {
+            "wall_s": round(wall_s, 3),
+            "completed": completed,
+            "throughput_per_s": round(completed / wall_s, 3) if wall_s > 0 else 0.0,
+            "stages": {name: self.stats[name].report(wall_s) for name in STAGES},
+        }
+
+    def close(self) -> None:
+        """Finish every queued request, then stop the stage threads (stage by stage, in order)."""
+        for name in STAGES:
+            for _ in self._threads.get(name, []):
+                self._queues[name].put(_STOP)
+            for thread in self._threads.get(name, []):
+                thread.join()
+        if self._threads and self._stopped_at is None:
+            self._stopped_at = time.perf_counter()
+
+    def __enter__(self) -> "StagedPipeline":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -2,195 +2,460 @@ import os
 import sys
 import subprocess
 import re
+import json
+import time
 import requests
-from typing import List
+from typing import List, Optional
 import torch
 from PIL import Image
-from PIL import ImageFilter, ImageDraw
+from PIL import ImageFilter
 import numpy as np
 import cv2
 from cog import BasePredictor, Input, Path
 
+from catalog import get_catalog
+from deadlines import Deadline, DeadlineExceeded, current_deadline
+from image_io import DEFAULT_SIZE, GENERATION_SIZES, as_rgb_array, composite_eyes, decode_image, upscale
+from landmarks import LandmarkResult, clear_landmark_backends, detect_landmarks, eye_mask, pose_map
+from memory_guard import MemoryGuard, trim_caches
+from quantization import quantize_stable_makeup
+from sampling import DenoiseController, controlled_generate
+from weight_store import get_weight_store
+
+# Eye preservation as predict() has always run it; MAKEUP_PRESERVE_EYES* env vars override each setting.
+# Read through _eye_setting by every entry point (predict, bulk, worker pool, staged pipeline, scripts).
+EYE_PRESERVATION_DEFAULTS = {
+    "MAKEUP_PRESERVE_EYES": "1",
+    "MAKEUP_PRESERVE_EYES_FEATHER": "2.0",
+    "MAKEUP_PRESERVE_EYES_DILATE": "5",
+    "MAKEUP_PRESERVE_EYES_MODE": "chroma",
+}
+
+
+def _eye_setting(name: str) -> str:
+    return str(os.environ.get(name, EYE_PRESERVATION_DEFAULTS[name]))
+
+
+# _preserve_eyes_colors(landmarks=...) default: detect them there. An explicit None means "no face".
+_DETECT_LANDMARKS = object()
+
+
 class Predictor(BasePredictor):
     def setup(self) -> None:
         print("🚀 Setting up Stable-Makeup model...")
-        # No setup required - everything is done in predict()
+        # By default everything is done lazily in predict(); MAKEUP_WARMUP=1 loads and warms up here instead
+        self.setup_report = {}
+        if str(os.environ.get("MAKEUP_WARMUP", "0")).lower() in ("1", "true", "yes"):
+            try:
+                self.setup_report = self._warm_up()
+                print(f"📊 Setup report: {json.dumps(self.setup_report)}")
+            except Exception as e:
+                print(f"⚠️ Warm-up skipped due to error: {e}")
         print("✅ Setup complete!")
 
     def predict(
         self,
         source_image: Path = Input(description="Source face image"),
-        reference_image: Path = Input(description="Reference makeup image"),
-        makeup_intensity: float = Input(description="Makeup transfer intensity", default=1.0, ge=0.1, le=2.0)
+        reference_image: Path = Input(description="Reference makeup image (optional when reference_id is set)", default=None),
+        makeup_intensity: float = Input(description="Makeup transfer intensity", default=1.0, ge=0.1, le=2.0),
+        landmark_backend: str = Input(
+            description="Eye landmark backend for eye preservation (auto uses MAKEUP_LANDMARK_BACKEND, else spiga)",
+            default="auto",
+            choices=["auto", "spiga", "mediapipe", "face_alignment"],
+        ),
+        reference_id: str = Input(
+            description="ID of a precomputed look in the reference catalog (MAKEUP_CATALOG_DIR); replaces reference_image",
+            default="",
+        ),
+        adaptive_steps: bool = Input(
+            description="Stop denoising early once the image has converged (MAKEUP_EARLY_EXIT_THRESHOLD / _MIN_STEPS)",
+            default=False,
+        ),
+        strength: float = Input(
+            description="Denoising strength: below 1.0 starts from the noised source face and runs only that "
+                        "fraction of the steps (faster, closer to the source; good for light makeup)",
+            default=1.0, ge=0.1, le=1.0,
+        ),
+        cfg_fast_path: bool = Input(
+            description="Skip the unconditional UNet pass when guidance (1.6 x intensity) is at or below 1, "
+                        "i.e. intensity <= 0.625 (halves UNet cost; low intensities then all render like 0.625)",
+            default=False,
+        ),
+        cfg_truncation: float = Input(
+            description="Run this final fraction of the denoising steps without classifier-free guidance",
+            default=0.0, ge=0.0, le=1.0,
+        ),
+        resolution: int = Input(
+            description="Generation size in pixels (square); lower is faster, 512 is the trained size",
+            default=DEFAULT_SIZE, choices=list(GENERATION_SIZES),
+        ),
+        output_size: int = Input(
+            description="Bicubic-upscale the result to this square size (0 = keep the generation size)",
+            default=0, ge=0, le=2048,
+        ),
+        timeout_s: float = Input(
+            description="Request deadline in seconds; on expiry the prediction fails with a JSON error naming the "
+                        "stage (0 = MAKEUP_REQUEST_TIMEOUT_S, else only the per-stage MAKEUP_STAGE_TIMEOUTS)",
+            default=0.0, ge=0.0,
+        ),
     ) -> Path:
         print(f"🎨 Starting Stable-Makeup inference with intensity: {makeup_intensity}")
-        # Enable eye preservation by default unless explicitly disabled in env
-        os.environ.setdefault("MAKEUP_PRESERVE_EYES", "1")
-        os.environ.setdefault("MAKEUP_PRESERVE_EYES_FEATHER", "2.0")
-        os.environ.setdefault("MAKEUP_PRESERVE_EYES_DILATE", "5")
-        os.environ.setdefault("MAKEUP_PRESERVE_EYES_MODE", "chroma")
-        
+        deadline = Deadline.for_request(timeout_s)
         try:
-            # Ensure repository exists with expected files (avoid broken submodule gitlink)
-            repo_dir = "Stable-Makeup"
-            need_clone = False
-            if not os.path.isdir(repo_dir):
-                need_clone = True
-            else:
-                expected = [
-                    "infer_kps.py",
-                    "gradio_demo_kps.py",
-                    "pipeline_sd15.py",
-                    os.path.join("utils", "pipeline_sd15.py"),
-                ]
-                if not any(os.path.exists(os.path.join(repo_dir, p)) for p in expected):
-                    need_clone = True
-
-            if need_clone:
-                print("📥 Cloning original Stable-Makeup repository...")
-                try:
-                    if os.path.exists(repo_dir) and not os.path.isdir(repo_dir):
-                        os.remove(repo_dir)
-                    elif os.path.isdir(repo_dir):
-                        import shutil
-                        shutil.rmtree(repo_dir, ignore_errors=True)
-                except Exception:
-                    pass
-                subprocess.run(["git", "clone", "https://github.com/Xiaojiu-z/Stable-Makeup.git", repo_dir], check=True)
-
-            os.chdir(repo_dir)
-            sys.path.append(os.getcwd())
-            
-            # Create necessary directories
-            os.makedirs("models/stablemakeup", exist_ok=True)
-            os.makedirs("test_imgs/id", exist_ok=True)
-            os.makedirs("test_imgs/makeup", exist_ok=True)
-            os.makedirs("output", exist_ok=True)
-            
-            # Copy model weights
-            self.copy_model_weights("models/stablemakeup")
-            
-            # Fix SPIGA model loading BEFORE any imports
-            self.fix_spiga_model_loading()
-            
-            # Fix all compatibility issues BEFORE any imports
-            self.fix_all_issues()
-            
-            # Normalize detail_encoder constructor at runtime to avoid duplicate args
-            self.monkey_patch_detail_encoder_init()
-            
-            # Use original input file paths; infer_with_params will copy into test folders
             source_path = str(source_image)
-            reference_path = str(reference_image)
-            
-            # Import and run inference (after all fixes are applied)
-            try:
-                # Use dynamic import to avoid Cog's AST import stripping breaking indentation
-                infer_kps = __import__("infer_kps")
-                result_image = infer_kps.infer_with_params(source_path, reference_path, makeup_intensity)
-            except Exception:
-                # Any import/parse error: fallback to gradio_demo_kps
-                result_image = self._fallback_infer_via_gradio_demo(source_path, reference_path, makeup_intensity)
-            
+            reference_path = str(reference_image) if reference_image is not None else None
+            if reference_path is None and not reference_id:
+                raise ValueError("Either reference_image or reference_id is required")
+            guard = self._memory_guard()
+            with deadline.activate(), guard.track():
+                result_image = self._run_inference(
+                    source_path, reference_path, makeup_intensity, landmark_backend, reference_id=reference_id or None,
+                    adaptive_steps=adaptive_steps, strength=strength, cfg_fast_path=cfg_fast_path,
+                    cfg_truncation=cfg_truncation, resolution=resolution, output_size=output_size,
+                )
+            if guard.recycle_requested:
+                print("♻️ Memory still over budget after trimming; reloading models")
+                self._recycle_models()
+                guard.recycled()
+
             # Save result
             result_path = "/tmp/result.jpg"
-            if not isinstance(result_image, Image.Image):
-                result_image = Image.fromarray(result_image.astype(np.uint8))
-
-            # Optional: preserve original eye colors using SPIGA landmarks (opt-in)
-            try:
-                if str(os.environ.get("MAKEUP_PRESERVE_EYES", "0")).lower() in ("1", "true", "yes"):    
-                    result_image = self._preserve_eyes_colors(
-                        source_path,
-                        result_image,
-                        feather_px=float(os.environ.get("MAKEUP_PRESERVE_EYES_FEATHER", 2.0)),
-                    )
-            except Exception as _e:
-                print(f"⚠️ Eye preservation skipped due to error: {_e}")
-
-            result_image.save(result_path)
+            with deadline.stage("encode"):
+                result_image.save(result_path)
             
+            print(f"⏱️ Stage timings: {json.dumps(deadline.report())}")
             print("✅ Stable-Makeup inference completed successfully!")
             return Path(result_path)
-            
+
+        except DeadlineExceeded as e:
+            # Fail the prediction (no fallback image) so the client sees which stage ran out of time
+            print(f"⏰ Deadline exceeded: {e}; stage timings: {json.dumps(deadline.report())}")
+            raise
+
         except Exception as e:
             print(f"❌ Error during inference: {e}")
             import traceback
             traceback.print_exc()
             
             # Return a fallback image
-            fallback = Image.new('RGB', (512, 512), color='black')
+            fallback = Image.new('RGB', (output_size or resolution,) * 2, color='black')
             fallback_path = "/tmp/error.jpg"
             fallback.save(fallback_path)
             return Path(fallback_path)
 
-    def _preserve_eyes_colors(self, source_path: str, stylized: Image.Image, feather_px: float = 2.0) -> Image.Image:
-        """Composite the original source eye regions back onto the stylized output using SPIGA landmarks.
-        This is designed to be non-invasive and only runs when explicitly enabled via MAKEUP_PRESERVE_EYES.
+    def _run_inference(self, source_path: str, reference_path: Optional[str], makeup_intensity: float = 1.0,
+                       landmark_backend: Optional[str] = None, reference_id: Optional[str] = None,
+                       adaptive_steps: bool = False, strength: float = 1.0, cfg_fast_path: bool = False,
+                       cfg_truncation: float = 0.0, resolution: int = DEFAULT_SIZE,
+                       output_size: int = 0) -> Image.Image:
+        """Run the full source/reference transfer (including optional eye preservation) and return the image.
+        With ``reference_id`` the look comes from the reference catalog instead of ``reference_path``.
+        Denoising statistics of the call are left in ``self.last_run_stats``. The inputs are decoded at
+        ``resolution`` (square), which sets the pose map and latent size; ``output_size`` upscales the result.
         """
-        # Prepare source at 512x512 to match pipeline output
-        src_img = Image.open(source_path).convert("RGB").resize((512, 512))
+        deadline = current_deadline()
+        with deadline.stage("prepare"):
+            self._prepare_runtime()
+        # Decode each input once (reduced-scale JPEG decode + EXIF orientation) and share it between stages
+        with deadline.stage("decode"):
+            id_image = decode_image(source_path, (resolution, resolution))
+            makeup_image = None if reference_id else decode_image(reference_path, (resolution, resolution))
+        return self._transfer(id_image, makeup_image, makeup_intensity, landmark_backend,
+                              reference_id=reference_id, adaptive_steps=adaptive_steps, strength=strength,
+                              cfg_fast_path=cfg_fast_path, cfg_truncation=cfg_truncation, output_size=output_size)
+
+    def _transfer(self, id_image: Image.Image, makeup_image: Optional[Image.Image], makeup_intensity: float = 1.0,
+                  landmark_backend: Optional[str] = None, reference_id: Optional[str] = None,
+                  adaptive_steps: bool = False, strength: float = 1.0, cfg_fast_path: bool = False,
+                  cfg_truncation: float = 0.0, output_size: int = 0) -> Image.Image:
+        """_run_inference for already decoded square inputs (``makeup_image`` unused with ``reference_id``);
+        the size of ``id_image`` is the generation size.
+        Runs the three stages that pipeline.StagedPipeline overlaps across requests, one after the other.
+        """
+        state = self._preprocess(id_image, makeup_image, landmark_backend, reference_id=reference_id)
+        result_pixels = self._diffuse(state, makeup_intensity, adaptive_steps=adaptive_steps, strength=strength,
+                                      cfg_fast_path=cfg_fast_path, cfg_truncation=cfg_truncation)
+        return self._postprocess(state, result_pixels, output_size=output_size)
+
+    def _preprocess(self, id_image: Image.Image, makeup_image: Optional[Image.Image],
+                    landmark_backend: Optional[str] = None, reference_id: Optional[str] = None) -> dict:
+        """CPU stage before diffusion: one landmark pass and the pose map; returns the request state."""
+        deadline = current_deadline()
+        preserve_eyes = _eye_setting("MAKEUP_PRESERVE_EYES").lower() in ("1", "true", "yes")
+
+        # One landmark pass per request feeds both the pose map and the eye mask
+        landmarks, detected = None, False
+        use_landmark_pose = str(os.environ.get("MAKEUP_POSE_MAP", "landmarks")).lower() == "landmarks"
+        if preserve_eyes or use_landmark_pose:
+            try:
+                with deadline.stage("landmarks"):
+                    landmarks = detect_landmarks(np.asarray(id_image), landmark_backend)
+                detected = True
+            except DeadlineExceeded:
+                raise
+            except Exception as _e:
+                print(f"⚠️ Landmark detection failed, using upstream pose map and no eye preservation: {_e}")
+        pose_image = pose_map(landmarks, id_image.size[0], id_image.size) if detected and use_landmark_pose else None
+        return {
+            "id_image": id_image,
+            "makeup_image": makeup_image,
+            "reference_id": reference_id,
+            "landmark_backend": landmark_backend,
+            "landmarks": landmarks,
+            "detected": detected,
+            "preserve_eyes": preserve_eyes,
+            "pose_image": pose_image,
+        }
+
+    def _diffuse(self, state: dict, makeup_intensity: float = 1.0, adaptive_steps: bool = False,
+                 strength: float = 1.0, cfg_fast_path: bool = False, cfg_truncation: float = 0.0) -> np.ndarray:
+        """Model stage: generate from a _preprocess state; returns the output as one writable uint8 array.
+        Denoising statistics are left in ``self.last_run_stats`` and ``state["stats"]``.
+        """
+        deadline = current_deadline()
+        controller = DenoiseController.for_request(
+            adaptive_steps, strength, deadline=deadline, guidance=self._guidance(makeup_intensity),
+            cfg_fast_path=cfg_fast_path, cfg_truncation=cfg_truncation,
+        )
+        with deadline.stage("load"):
+            namespace = self._load_model_namespace()
+        id_image, reference_id = state["id_image"], state["reference_id"]
+        with deadline.stage("diffusion"):
+            if reference_id:
+                # Catalog looks are already decoded, resized and CLIP-encoded; only the source is processed
+                catalog = get_catalog()
+                with catalog.cached_embeds(namespace.makeup_encoder, reference_id):
+                    result_image = self._generate_from_images(
+                        namespace, id_image, catalog.image(reference_id), makeup_intensity, controller=controller,
+                        pose_image=state["pose_image"],
+                    )
+            else:
+                result_image = self._generate_from_images(
+                    namespace, id_image, state["makeup_image"], makeup_intensity, controller=controller,
+                    pose_image=state["pose_image"],
+                )
+        self.last_run_stats = state["stats"] = controller.stats() if controller is not None else {}
+        if controller is not None:
+            print(f"🧮 Denoising used {controller.steps_run}/{controller.steps_scheduled} steps")
+
+        # From here on the output is one uint8 buffer, edited in place; PIL again only for the encoder
+        return as_rgb_array(result_image)
+
+    def _postprocess(self, state: dict, result_pixels: np.ndarray, output_size: int = 0) -> Image.Image:
+        """CPU stage after diffusion: optional eye preservation, in place on ``result_pixels``, then the
+        optional upscale to ``output_size``."""
+        deadline = current_deadline()
+        # Optional: preserve original eye colors using eye landmarks (opt-in)
+        try:
+            # No face (landmarks None) means nothing to preserve; don't run detection a second time
+            if state["preserve_eyes"] and state["detected"] and state["landmarks"] is not None:
+                with deadline.stage("eyes"):
+                    self._preserve_eyes_colors(
+                        np.asarray(state["id_image"]),
+                        result_pixels,
+                        feather_px=float(_eye_setting("MAKEUP_PRESERVE_EYES_FEATHER")),
+                        landmark_backend=state["landmark_backend"],
+                        landmarks=state["landmarks"],
+                    )
+        except DeadlineExceeded:
+            raise
+        except Exception as _e:
+            print(f"⚠️ Eye preservation skipped due to error: {_e}")
+        result_image = Image.fromarray(result_pixels)
+        return upscale(result_image, output_size) if output_size else result_image
+
+    def _warm_up(self) -> dict:
+        """Load models, optionally torch.compile UNet/VAE, and run dummy 512x512 generations.
+
+        The first dummy call pays for CUDA/cuDNN autotuning, lazy kernel loading, allocator
+        growth (oneDNN primitive creation on CPU) and compilation; the last one shows the
+        steady state. Their difference is what the first real request no longer pays.
+        """
+        report = {}
+        start = time.perf_counter()
+        self._prepare_runtime()
+        namespace = self._load_model_namespace()
+        report["load_s"] = time.perf_counter() - start
+
+        if torch.cuda.is_available():
+            # Let cuDNN autotune convolution algorithms for the fixed 512x512 shapes during warm-up
+            torch.backends.cudnn.benchmark = True
+        compile_mode = str(os.environ.get("MAKEUP_COMPILE", "0")).lower()
+        if compile_mode not in ("0", "false", "no", ""):
+            report["compile"] = self._compile_models(namespace, None if compile_mode in ("1", "true", "yes") else compile_mode)
+
+        # Representative inputs: real images if provided, otherwise flat 512x512 placeholders
+        warm_src = os.environ.get("MAKEUP_WARMUP_SOURCE")
+        warm_ref = os.environ.get("MAKEUP_WARMUP_REFERENCE")
+        id_image = decode_image(warm_src) if warm_src else Image.new("RGB", (512, 512), (180, 150, 130))
+        makeup_image = decode_image(warm_ref) if warm_ref else Image.new("RGB", (512, 512), (160, 90, 90))
+
+        timings = []
+        for _ in range(max(2, int(os.environ.get("MAKEUP_WARMUP_RUNS", 2)))):
+            t0 = time.perf_counter()
+            self._generate_from_images(namespace, id_image, makeup_image, 1.0)
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+            timings.append(time.perf_counter() - t0)
+        if _eye_setting("MAKEUP_PRESERVE_EYES").lower() in ("1", "true", "yes"):
+            t0 = time.perf_counter()
+            detect_landmarks(np.asarray(id_image))
+            report["landmarks_warmup_s"] = time.perf_counter() - t0
+
+        report.update(
+            warmup_total_s=time.perf_counter() - start,
+            first_call_s=timings[0],
+            warm_call_s=timings[-1],
+            first_request_saving_s=timings[0] - timings[-1],
+        )
+        return report
+
+    def _compile_models(self, namespace, mode: Optional[str] = None) -> dict:
+        """torch.compile the UNet forward and VAE decode, caching artifacts under MAKEUP_COMPILE_CACHE."""
+        cache_dir = os.environ.get("MAKEUP_COMPILE_CACHE", os.path.expanduser("~/.cache/stable-makeup/compile"))
+        os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.join(cache_dir, "inductor"))
+        os.environ.setdefault("TRITON_CACHE_DIR", os.path.join(cache_dir, "triton"))
+        if not hasattr(torch, "compile"):
+            return {"skipped": "torch.compile unavailable"}
+        pipe = namespace.pipe
+        kwargs = {"mode": mode} if mode else {}
+        compiled = []
+        # Compile bound forwards in place so the UNet object shared with makeup_encoder stays the same
+        pipe.unet.forward = torch.compile(pipe.unet.forward, **kwargs)
+        compiled.append("unet")
+        if getattr(pipe, "vae", None) is not None:
+            pipe.vae.decode = torch.compile(pipe.vae.decode, **kwargs)
+            compiled.append("vae.decode")
+        print(f"✅ torch.compile applied to {', '.join(compiled)}")
+        return {"modules": compiled, "mode": mode or "default", "cache_dir": cache_dir}
+
+    def _prepare_runtime(self) -> None:
+        """Clone/patch the upstream Stable-Makeup repo and fetch weights so infer_kps can be imported.
+        Runs once per Predictor; later calls keep the current working directory (workers may use their own).
+        """
+        if getattr(self, "_repo_dir", None):
+            return
+        # Ensure repository exists with expected files (avoid broken submodule gitlink)
+        # Anchor to this file so repeated calls (and forked workers) don't nest into Stable-Makeup/Stable-Makeup
+        repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Stable-Makeup")
+        need_clone = False
+        if not os.path.isdir(repo_dir):
+            need_clone = True
+        else:
+            expected = [
+                "infer_kps.py",
+                "gradio_demo_kps.py",
+                "pipeline_sd15.py",
+                os.path.join("utils", "pipeline_sd15.py"),
+            ]
+            if not any(os.path.exists(os.path.join(repo_dir, p)) for p in expected):
+                need_clone = True
 
-        # Get landmarks via SPIGA + facelib
+        if need_clone:
+            print("📥 Cloning original Stable-Makeup repository...")
+            try:
+                if os.path.exists(repo_dir) and not os.path.isdir(repo_dir):
+                    os.remove(repo_dir)
+                elif os.path.isdir(repo_dir):
+                    import shutil
+                    shutil.rmtree(repo_dir, ignore_errors=True)
+            except Exception:
+                pass
+            deadline = current_deadline()
+            with deadline.stage("clone"):
+                try:
+                    subprocess.run(["git", "clone", "https://github.com/Xiaojiu-z/Stable-Makeup.git", repo_dir],
+                                   check=True, timeout=deadline.timeout())
+                except subprocess.TimeoutExpired as e:
+                    import shutil
+                    shutil.rmtree(repo_dir, ignore_errors=True)
+                    raise deadline.expired(e)
+
+        os.chdir(repo_dir)
+        if os.getcwd() not in sys.path:
+            sys.path.append(os.getcwd())
+        
+        # Create necessary directories
+        os.makedirs("models/stablemakeup", exist_ok=True)
+        os.makedirs("test_imgs/id", exist_ok=True)
+        os.makedirs("test_imgs/makeup", exist_ok=True)
+        os.makedirs("output", exist_ok=True)
+        
+        # Copy model weights
+        self.copy_model_weights("models/stablemakeup")
+        
+        # Fix SPIGA model loading BEFORE any imports
+        self.fix_spiga_model_loading()
+        
+        # Fix all compatibility issues BEFORE any imports
+        self.fix_all_issues()
+        
+        # Normalize detail_encoder constructor at runtime to avoid duplicate args
+        self.monkey_patch_detail_encoder_init()
+        self._repo_dir = os.getcwd()
+
+    def _load_infer_module(self):
+        """Import infer_kps (building its models once) and apply optional CPU quantization."""
+        # Use dynamic import to avoid Cog's AST import stripping breaking indentation
+        infer_kps = __import__("infer_kps")
+        self._maybe_quantize(infer_kps)
+        return infer_kps
+
+    def _maybe_quantize(self, namespace) -> None:
+        """Apply MAKEUP_QUANTIZE (none|dynamic|weight_only) once per loaded model namespace."""
+        mode = str(os.environ.get("MAKEUP_QUANTIZE", "none")).lower()
+        if mode in ("", "0", "none", "false") or getattr(namespace, "_makeup_quantized", None) == mode:
+            return
         try:
-            from spiga.inference.config import ModelConfig as _SPIGAConfig
-            from spiga.inference.framework import SPIGAFramework as _SPIGAFramework
-            from facelib import FaceDetector as _FaceDetector
-            import numpy as _np
-            import cv2 as _cv2
+            stats = quantize_stable_makeup(namespace, mode)
+            namespace._makeup_quantized = mode
+            print(f"✅ Quantized {stats['linear_layers']} linear layers ({mode} int8)")
         except Exception as e:
-            raise RuntimeError(f"Required packages for eye preservation are missing: {e}")
-
-        processor = _SPIGAFramework(_SPIGAConfig("300wpublic"))
-        detector = _FaceDetector()
-
-        bgr = _cv2.cvtColor(_np.asarray(src_img), _cv2.COLOR_RGB2BGR)
-        faces, boxes, scores, landmarks = detector.detect_align(bgr)
-        boxes = [] if boxes is None else boxes.cpu().numpy().tolist()
-        if not boxes:
+            print(f"⚠️ Quantization ({mode}) skipped due to error: {e}")
+
+    @staticmethod
+    def _target_device() -> str:
+        """Device the upstream scripts should place models on (MAKEUP_DEVICE overrides auto-detect)."""
+        device = os.environ.get("MAKEUP_DEVICE")
+        if device:
+            return device
+        return "cuda" if torch.cuda.is_available() else "cpu"
+
+    def _preserve_eyes_colors(self, src_pixels: np.ndarray, stylized: np.ndarray, feather_px: float = 2.0,
+                              landmark_backend: Optional[str] = None,
+                              landmarks=_DETECT_LANDMARKS) -> np.ndarray:
+        """Composite the original source eye regions back onto the stylized output using eye landmarks.
+        On by default; MAKEUP_PRESERVE_EYES=0 turns it off (settings in EYE_PRESERVATION_DEFAULTS).
+        The landmark backend comes from ``landmark_backend`` or MAKEUP_LANDMARK_BACKEND (see landmarks.py).
+        Both images are HxWx3 uint8 arrays; ``stylized`` is modified in place and returned.
+        ``landmarks`` is the request's shared landmark result (None: no face, ``stylized`` is returned
+        unchanged); when omitted they are detected here.
+        """
+        # src_pixels is the already decoded source fed to the pipeline; landmarks are in its coordinates
+        if landmarks is _DETECT_LANDMARKS:
+            # Get eye landmarks from the selected backend (SPIGA + facelib by default)
+            landmarks = detect_landmarks(src_pixels, landmark_backend)
+        if landmarks is None:
             return stylized
-
-        # Convert to SPIGA bbox format (x,y,w,h)
-        bbox_list = []
-        for (x0, y0, x1, y1) in boxes:
-            bbox_list.append((float(x0), float(y0), float(x1 - x0), float(y1 - y0)))
-
-        features = processor.inference(bgr, bbox_list)
-        lms = features.get("landmarks")
-        mask = Image.new("L", (512, 512), 0)
-        draw = ImageDraw.Draw(mask)
-
-        if lms is not None and len(lms) > 0:
-            # Use first face landmarks (68-point format expected)
-            pts = [(float(x), float(y)) for (x, y) in lms[0]]
-            left_eye = pts[36:42]
-            right_eye = pts[42:48]
-            if len(left_eye) == 6:
-                draw.polygon(left_eye, fill=255)
-            if len(right_eye) == 6:
-                draw.polygon(right_eye, fill=255)
-        else:
-            # Fallback: approximate eye rectangles from the first face bbox
-            if bbox_list:
-                x, y, w, h = bbox_list[0]
-                # Left eye ROI
-                lx0 = int(x + 0.20 * w); lx1 = int(x + 0.45 * w)
-                ly0 = int(y + 0.35 * h); ly1 = int(y + 0.55 * h)
-                # Right eye ROI
-                rx0 = int(x + 0.55 * w); rx1 = int(x + 0.80 * w)
-                ry0 = int(y + 0.35 * h); ry1 = int(y + 0.55 * h)
-                draw.rectangle([lx0, ly0, lx1, ly1], fill=255)
-                draw.rectangle([rx0, ry0, rx1, ry1], fill=255)
-            else:
-                # Nothing we can do; return stylized unchanged
-                return stylized
+        size = (src_pixels.shape[1], src_pixels.shape[0])
+        mask = eye_mask(landmarks, size)
+        if mask is None:
+            # Nothing we can do; return stylized unchanged
+            return stylized
+        out_size = (stylized.shape[1], stylized.shape[0])
+        if out_size != size:
+            # The pipeline returned another size than it was given: bring the mask and source to the output
+            mask = mask.resize(out_size, Image.BILINEAR)
+            src_pixels = np.asarray(Image.fromarray(src_pixels).resize(out_size, Image.BICUBIC))
+        # Feather and dilation radii are tuned in pixels at 512; scale them with the output
+        scale = out_size[0] / float(DEFAULT_SIZE)
 
         if feather_px and feather_px > 0:
-            mask = mask.filter(ImageFilter.GaussianBlur(radius=float(feather_px)))
+            mask = mask.filter(ImageFilter.GaussianBlur(radius=float(feather_px) * scale))
 
         # Optional dilation to expand coverage
         try:
-            dilate = int(float(os.environ.get("MAKEUP_PRESERVE_EYES_DILATE", 0)))
+            dilate = int(round(float(_eye_setting("MAKEUP_PRESERVE_EYES_DILATE")) * scale))
         except Exception:
             dilate = 0
         if dilate and dilate > 0:
@@ -201,30 +466,14 @@ class Predictor(BasePredictor):
             except Exception:
                 pass
 
-        # Composite preserving either full RGB (default) or only chroma channels
-        mode = str(os.environ.get("MAKEUP_PRESERVE_EYES_MODE", "rgb")).lower()
-        if mode == "chroma":
-            # Blend chroma channels in YCbCr using soft mask weights
-            src_ycc = src_img.convert("YCbCr")
-            sty_ycc = stylized.convert("YCbCr")
-            import numpy as _np
-            src_arr = _np.array(src_ycc, dtype=_np.float32)
-            sty_arr = _np.array(sty_ycc, dtype=_np.float32)
-            m = _np.array(mask, dtype=_np.float32) / 255.0
-            m = _np.expand_dims(m, axis=-1)
-            # Y stays from stylized; Cb/Cr from source (soft blend)
-            out = sty_arr.copy()
-            out[..., 1] = (1.0 - m[..., 0]) * sty_arr[..., 1] + m[..., 0] * src_arr[..., 1]
-            out[..., 2] = (1.0 - m[..., 0]) * sty_arr[..., 2] + m[..., 0] * src_arr[..., 2]
-            out = _np.clip(out, 0, 255).astype("uint8")
-            return Image.fromarray(out, mode="YCbCr").convert("RGB")
-        else:
-            # Default full RGB compositing inside mask
-            return Image.composite(src_img, stylized, mask)
+        # Composite preserving either only chroma channels (default; Y stays from stylized) or full RGB
+        mode = _eye_setting("MAKEUP_PRESERVE_EYES_MODE").lower()
+        return composite_eyes(src_pixels, stylized, np.asarray(mask), "chroma" if mode == "chroma" else "rgb")
 
     def fix_spiga_model_loading(self):
         print("🔧 Fixing SPIGA model loading...")
-        spiga_models_dir = os.path.expanduser("~/.pyenv/versions/3.10.18/lib/python3.10/site-packages/spiga/models/weights")
+        spiga_dir = self._spiga_package_dir()
+        spiga_models_dir = os.path.join(spiga_dir, "models", "weights")
         os.makedirs(spiga_models_dir, exist_ok=True)
         model_path = os.path.join(spiga_models_dir, "spiga_300wpublic.pt")
 
@@ -234,9 +483,8 @@ class Predictor(BasePredictor):
         if os.path.exists(model_path) and os.path.getsize(model_path) > min_valid_size_bytes:
             print("✅ SPIGA model found in site-packages cache!")
         else:
-            # 1) Try to copy from repository root if present (useful for local dev)
+            # 1) Try to link from repository root if present (useful for local dev)
             try:
-                import shutil
                 repo_root = os.path.abspath(os.path.join(os.getcwd(), ".."))
                 local_candidates = [
                     os.path.join(repo_root, "spiga_300wpublic.pt"),
@@ -244,36 +492,31 @@ class Predictor(BasePredictor):
                 ]
                 for candidate in local_candidates:
                     if os.path.exists(candidate) and os.path.getsize(candidate) > min_valid_size_bytes:
-                        print(f"📁 Found local SPIGA weights at {candidate}, copying to cache...")
-                        shutil.copy2(candidate, model_path)
+                        print(f"📁 Found local SPIGA weights at {candidate}, linking from weight store...")
+                        get_weight_store().materialize(candidate, model_path)
                         break
             except Exception as e:
-                print(f"⚠️ Local copy attempt failed: {e}")
+                print(f"⚠️ Local link attempt failed: {e}")
 
             # 2) If still missing or too small, download via Google Drive using gdown
             if not (os.path.exists(model_path) and os.path.getsize(model_path) > min_valid_size_bytes):
                 print("📥 Downloading SPIGA model via Google Drive (gdown)...")
                 drive_file_id = "1YrbScfMzrAAWMJQYgxdLZ9l57nmTdpQC"
                 try:
-                    try:
-                        import gdown  # type: ignore
-                    except Exception:
-                        # Fallback: install gdown at runtime if not present
-                        print("⬇️ Installing gdown at runtime...")
-                        subprocess.run([sys.executable, "-m", "pip", "install", "-q", "gdown==5.1.0"], check=True)
-                        import gdown  # type: ignore
-
                     url = f"https://drive.google.com/uc?id={drive_file_id}"
-                    gdown.download(url=url, output=model_path, quiet=False, fuzzy=True)
+                    self._run_gdown("download", url=url, output=model_path, quiet=False, fuzzy=True)
 
                     if not os.path.exists(model_path) or os.path.getsize(model_path) <= min_valid_size_bytes:
                         raise RuntimeError("Downloaded SPIGA file is too small or missing after gdown.")
+                    get_weight_store().adopt(model_path)
                     print("✅ SPIGA model downloaded successfully via gdown!")
+                except DeadlineExceeded:
+                    raise
                 except Exception as e:
                     raise Exception(f"Failed to obtain SPIGA weights via gdown: {e}")
 
         # Patch SPIGA framework.py to use local file - IMPROVED WITH PROPER INDENTATION
-        framework_path = os.path.join(os.path.expanduser("~/.pyenv/versions/3.10.18/lib/python3.10/site-packages/spiga/inference/framework.py"))
+        framework_path = os.path.join(spiga_dir, "inference", "framework.py")
         if os.path.exists(framework_path):
             with open(framework_path, "r") as f:
                 content = f.read()
@@ -306,6 +549,47 @@ class Predictor(BasePredictor):
         else:
             print("⚠️ SPIGA framework file not found")
 
+    @staticmethod
+    def _ensure_gdown() -> None:
+        """Install gdown at runtime if missing (pip stage budget)."""
+        try:
+            import gdown  # type: ignore  # noqa: F401
+            return
+        except Exception:
+            pass
+        print("⬇️ Installing gdown at runtime...")
+        deadline = current_deadline()
+        with deadline.stage("pip"):
+            try:
+                subprocess.run([sys.executable, "-m", "pip", "install", "-q", "gdown==5.1.0"], check=True,
+                               timeout=deadline.timeout())
+            except subprocess.TimeoutExpired as e:
+                raise deadline.expired(e)
+
+    def _run_gdown(self, function: str, **kwargs) -> None:
+        """Call ``gdown.<function>(**kwargs)`` in a child process so the download stage budget can kill it."""
+        self._ensure_gdown()
+        code = "import gdown, json, sys; getattr(gdown, sys.argv[1])(**json.loads(sys.argv[2]))"
+        deadline = current_deadline()
+        with deadline.stage("download"):
+            try:
+                subprocess.run([sys.executable, "-c", code, function, json.dumps(kwargs)], check=True,
+                               timeout=deadline.timeout())
+            except subprocess.TimeoutExpired as e:
+                raise deadline.expired(e)
+
+    @staticmethod
+    def _spiga_package_dir() -> str:
+        """Installed spiga package directory (the pyenv path used on the original build host as fallback)."""
+        try:
+            import importlib.util
+            spec = importlib.util.find_spec("spiga")
+            if spec is not None and spec.submodule_search_locations:
+                return list(spec.submodule_search_locations)[0]
+        except Exception:
+            pass
+        return os.path.expanduser("~/.pyenv/versions/3.10.18/lib/python3.10/site-packages/spiga")
+
     def fix_all_issues(self):
         print("🔧 Fixing huggingface_hub imports...")
         self.fix_huggingface_imports()
@@ -334,6 +618,10 @@ class Predictor(BasePredictor):
         print("🔧 Patching infer_kps.py detail_encoder calls...")
         self.fix_infer_kps_detail_encoder()
         
+        # Place models on MAKEUP_DEVICE (or CPU when CUDA is unavailable)
+        print("🔧 Normalizing model device placement...")
+        self.fix_device_placement()
+        
         print("🔧 Fixing pipeline_sd15.py imports completely...")
         self.fix_pipeline_sd15_file()
         
@@ -350,15 +638,15 @@ class Predictor(BasePredictor):
         self.fix_missing_makeup_weights_handling()
         print("✅ Makeup weights handling hardened")
 
-    def _fallback_infer_via_gradio_demo(self, source_path: str, reference_path: str, intensity: float):
-        """Fallback path when infer_kps.py is not present. Uses globals from gradio_demo_kps."""
+    def _load_gradio_demo_module(self):
+        """Execute gradio_demo_kps as a module; its globals hold the same models as infer_kps."""
         import importlib.util
-        import types
         # Load gradio_demo_kps as a module
-        gd_path = os.path.join(os.getcwd(), "gradio_demo_kps.py")
+        repo_dir = getattr(self, "_repo_dir", None) or os.getcwd()
+        gd_path = os.path.join(repo_dir, "gradio_demo_kps.py")
         if not os.path.exists(gd_path):
             # Some copies place it under scripts/
-            alt = os.path.join(os.getcwd(), "scripts", "gradio_demo_kps.py")
+            alt = os.path.join(repo_dir, "scripts", "gradio_demo_kps.py")
             if os.path.exists(alt):
                 gd_path = alt
         spec = importlib.util.spec_from_file_location("gradio_demo_kps", gd_path)
@@ -366,33 +654,65 @@ class Predictor(BasePredictor):
             raise ModuleNotFoundError("gradio_demo_kps.py not found for fallback inference")
         gdk = importlib.util.module_from_spec(spec)
         spec.loader.exec_module(gdk)  # type: ignore
+        self._maybe_quantize(gdk)
+        return gdk
 
-        # Prepare IO
-        os.makedirs("test_imgs/id", exist_ok=True)
-        os.makedirs("test_imgs/makeup", exist_ok=True)
-        dst_id = os.path.join("test_imgs", "id", "input.jpg")
-        dst_mu = os.path.join("test_imgs", "makeup", "ref.jpg")
-        if os.path.abspath(source_path) != os.path.abspath(dst_id):
-            import shutil
-            shutil.copyfile(source_path, dst_id)
-        if os.path.abspath(reference_path) != os.path.abspath(dst_mu):
-            import shutil
-            shutil.copyfile(reference_path, dst_mu)
-
-        # Prefer module's load_image if present, otherwise fall back to PIL
-        load_image_fn = getattr(gdk, 'load_image', None)
-        if load_image_fn is None:
-            from PIL import Image as _PILImage
-            load_image_fn = lambda p: _PILImage.open(p).convert('RGB')
-        id_image = load_image_fn(dst_id).resize((512, 512))
-        makeup_image = load_image_fn(dst_mu).resize((512, 512))
-        pose_image = gdk.get_draw(id_image, size=512)
-        guidance = 1.6 * float(intensity)
-        return gdk.makeup_encoder.generate(
+    def _load_model_namespace(self):
+        """Module namespace exposing makeup_encoder/pipe/get_draw: infer_kps, else gradio_demo_kps.
+        Loaded once per Predictor so a failing infer_kps import isn't retried (and the fallback
+        module re-executed with fresh models) on every request.
+        """
+        namespace = getattr(self, "_namespace", None)
+        if namespace is None:
+            try:
+                namespace = self._load_infer_module()
+            except Exception:
+                namespace = self._load_gradio_demo_module()
+            self._namespace = namespace
+        return namespace
+
+    def _memory_guard(self) -> MemoryGuard:
+        """Per-Predictor MemoryGuard configured from MAKEUP_MEMORY_* (see memory_guard.py)."""
+        if getattr(self, "_guard", None) is None:
+            self._guard = MemoryGuard.from_env()
+        return self._guard
+
+    def _recycle_models(self) -> None:
+        """Drop the loaded models and landmark detectors; the next request loads them afresh."""
+        self._namespace = None
+        for name in ("infer_kps", "gradio_demo_kps"):
+            sys.modules.pop(name, None)
+        clear_landmark_backends()
+        trim_caches()
+
+    @staticmethod
+    def _guidance(intensity: float) -> float:
+        """Classifier-free guidance scale for a makeup intensity."""
+        return 1.6 * float(intensity)
+
+    def _generate_from_images(self, namespace, id_image: Image.Image, makeup_image: Image.Image, intensity: float,
+                              controller: Optional[DenoiseController] = None,
+                              pose_image: Optional[Image.Image] = None):
+        """Pose map + makeup_encoder.generate for already decoded square inputs, at the size of ``id_image``.
+        ``controller`` (see sampling.py) observes/steers the denoising loop; ``pose_image`` is a
+        pose map rendered from shared landmarks (upstream get_draw when None).
+        """
+        size = id_image.size[0]
+        if pose_image is None:
+            pose_image = namespace.get_draw(id_image, size=size)
+        guidance = self._guidance(intensity)
+        kwargs = {}
+        if size != DEFAULT_SIZE:
+            # Latent size follows the requested resolution instead of the UNet's 512 default
+            kwargs.update(height=size, width=size)
+        return controlled_generate(
+            namespace,
+            controller,
+            init_image=id_image,
             id_image=[id_image, pose_image],
             makeup_image=makeup_image,
-            pipe=gdk.pipe,
             guidance_scale=guidance,
+            **kwargs,
         )
 
     def fix_detail_encoder_init_signature(self):
@@ -415,7 +735,7 @@ class Predictor(BasePredictor):
                 indent = match.group(1)
                 content = re.sub(
                     sig_pattern,
-                    rf"{indent}def __init__(self, unet, image_encoder_path, device='cuda', dtype=torch.float32):",
+                    rf"{indent}def __init__(self, unet, image_encoder_path, device=MAKEUP_DEVICE, dtype=torch.float32):",
                     content,
                     flags=re.M,
                     count=1,
@@ -847,6 +1167,55 @@ def unscale_lora_layers(*args, **kwargs): pass'''
         except Exception as e:
             print(f"⚠️ Failed to patch infer_kps.py: {e}")
 
+    _DEVICE_HEADER = (
+        "# Stable-Makeup device placement: MAKEUP_DEVICE, else CUDA when available\n"
+        "import os as _makeup_os\n"
+        "import torch as _makeup_torch\n"
+        "MAKEUP_DEVICE = _makeup_os.environ.get(\"MAKEUP_DEVICE\") or "
+        "(\"cuda\" if _makeup_torch.cuda.is_available() else \"cpu\")\n"
+    )
+
+    def fix_device_placement(self):
+        """Route the hard-coded "cuda" placement in the inference scripts through MAKEUP_DEVICE.
+        infer_kps.py and gradio_demo_kps.py build every model with .to("cuda"); the literals
+        become a module-level MAKEUP_DEVICE resolved at import (MAKEUP_DEVICE env, else CUDA
+        when available), so the shared checkout follows each process's device in both
+        directions (e.g. a CPU quantize_calibrate run followed by a GPU server).
+        """
+        targets = [
+            os.path.join('.', 'infer_kps.py'),
+            os.path.join('.', 'gradio_demo_kps.py'),
+            os.path.join('.', 'scripts', 'gradio_demo_kps.py'),
+            os.path.join('detail_encoder', 'encoder_plus.py'),
+        ]
+        for fp in targets:
+            if not os.path.exists(fp):
+                continue
+            try:
+                with open(fp, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                original = content
+                # The header itself names "cuda"; only the code around it is rewritten
+                head, header, body = content.partition(self._DEVICE_HEADER)
+                if not header:
+                    head, body = "", content
+                head, body = [
+                    re.sub(r'(["\'])cuda(:\d+)?\1', 'MAKEUP_DEVICE', part).replace('.cuda()', '.to(MAKEUP_DEVICE)')
+                    for part in (head, body)
+                ]
+                content = head + header + body
+                if 'MAKEUP_DEVICE' in content and not header:
+                    # After any __future__ imports, which must stay first
+                    future = list(re.finditer(r'^from __future__ import .*\n', content, flags=re.M))
+                    at = future[-1].end() if future else 0
+                    content = content[:at] + self._DEVICE_HEADER + content[at:]
+                if content != original:
+                    with open(fp, 'w', encoding='utf-8') as f:
+                        f.write(content)
+                    print(f"✅ Routed model placement in {fp} through MAKEUP_DEVICE")
+            except Exception as e:
+                print(f"⚠️ Failed to patch device placement in {fp}: {e}")
+
     def add_infer_function(self):
         """Add the infer_with_params function to infer_kps.py"""
         infer_file = "infer_kps.py"
@@ -939,11 +1308,10 @@ def unscale_lora_layers(*args, **kwargs): pass'''
                     dst = os.path.join(models_dir, fname)
                     try:
                         if os.path.exists(src) and not os.path.exists(dst):
-                            import shutil
-                            shutil.copy2(src, dst)
-                            print(f"✅ Copied {fname} from {local_dir} → {models_dir}")
+                            get_weight_store().materialize(src, dst)
+                            print(f"✅ Linked {fname} from {local_dir} → {models_dir}")
                     except Exception as e:
-                        print(f"⚠️ Could not copy {fname} from {local_dir}: {e}")
+                        print(f"⚠️ Could not link {fname} from {local_dir}: {e}")
 
         # If still missing, download from GitHub repo (supports Git LFS via redirect)
         missing = [
@@ -968,15 +1336,21 @@ def unscale_lora_layers(*args, **kwargs): pass'''
                 for url in urls:
                     try:
                         import requests
-                        with requests.get(url, stream=True, allow_redirects=True, timeout=300, headers=headers) as r:
+                        deadline = current_deadline()
+                        with deadline.stage("download"), requests.get(
+                            url, stream=True, allow_redirects=True, timeout=deadline.timeout(300), headers=headers
+                        ) as r:
                             r.raise_for_status()
                             with open(dst_path, "wb") as f:
                                 for chunk in r.iter_content(chunk_size=4 * 1024 * 1024):
+                                    # The socket timeout bounds each read; the stage budget bounds the whole file
+                                    deadline.check()
                                     if chunk:
                                         f.write(chunk)
                         # Validate size (> 100MB)
                         if os.path.getsize(dst_path) < 100 * 1024 * 1024:
                             raise RuntimeError("downloaded file too small, likely a pointer")
+                        get_weight_store().adopt(dst_path)
                         print(f"✅ Downloaded {fname} from {url}")
                         success = True
                         break
@@ -986,6 +1360,8 @@ def unscale_lora_layers(*args, **kwargs): pass'''
                                 os.remove(dst_path)
                             except Exception:
                                 pass
+                        if isinstance(e, DeadlineExceeded):
+                            raise
                         print(f"⚠️ Failed to download {fname} from {url}: {e}")
                 if not success:
                     print(f"⚠️ All download attempts failed for {fname}. We'll proceed with graceful fallbacks.")
@@ -998,17 +1374,10 @@ def unscale_lora_layers(*args, **kwargs): pass'''
         if still_missing:
             try:
                 print("📥 Attempting to fetch adapter weights from Google Drive via gdown...")
-                try:
-                    import gdown  # type: ignore
-                except Exception:
-                    print("⬇️ Installing gdown at runtime...")
-                    subprocess.run([sys.executable, "-m", "pip", "install", "-q", "gdown==5.1.0"], check=True)
-                    import gdown  # type: ignore
-
                 folder_url = "https://drive.google.com/drive/folders/1397t27GrUyLPnj17qVpKWGwg93EcaFfg?usp=sharing"
                 tmp_dir = os.path.join(models_dir, "_gdown_tmp")
                 os.makedirs(tmp_dir, exist_ok=True)
-                gdown.download_folder(url=folder_url, output=tmp_dir, quiet=False, use_cookies=False)
+                self._run_gdown("download_folder", url=folder_url, output=tmp_dir, quiet=False, use_cookies=False)
 
                 # Search recursively for expected filenames and move them into place
                 found_any = False
@@ -1019,14 +1388,16 @@ def unscale_lora_layers(*args, **kwargs): pass'''
                             dst_path = os.path.join(models_dir, fname)
                             try:
                                 if os.path.getsize(candidate) > 100 * 1024 * 1024:
-                                    import shutil
-                                    shutil.move(candidate, dst_path)
+                                    store = get_weight_store()
+                                    store.link(store.ingest(candidate, move=True), dst_path)
                                     print(f"✅ Retrieved {fname} from Google Drive folder")
                                     found_any = True
                             except Exception as e:
                                 print(f"⚠️ Could not move {fname} from Google Drive download: {e}")
                 if not found_any:
                     print("⚠️ Google Drive download completed but expected files were not found.")
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 print(f"⚠️ Google Drive folder download failed: {e}")
 
@@ -1046,7 +1417,13 @@ def unscale_lora_layers(*args, **kwargs): pass'''
                     print(f"⬇️ Downloading {filename} for image_encoder_l from {repo_id}...")
                     try:
                         from huggingface_hub import hf_hub_download
-                        downloaded = hf_hub_download(repo_id=repo_id, filename=filename, local_dir=image_encoder_dir, local_dir_use_symlinks=False)
+                        # Download into the HF cache, move the blob into the weight store and link both the
+                        # cache entry and models/ to it, so the file is on disk once
+                        cached = os.path.realpath(hf_hub_download(repo_id=repo_id, filename=filename))
+                        store = get_weight_store()
+                        digest = store.ingest(cached, move=True)
+                        store.link(digest, cached)
+                        downloaded = store.link(digest, path)
                         print(f"✅ Downloaded {filename} → {downloaded}")
                     except Exception as e:
                         print(f"⚠️ Failed to download {filename} from {repo_id}: {e}")
@@ -0,0 +1,131 @@
+"""Int8 quantization for CPU deployments of the Stable-Makeup models.
+
+Two modes are supported, selected with MAKEUP_QUANTIZE:
+
+- ``dynamic``: nn.Linear layers are swapped for PyTorch's dynamically quantized
+  int8 Linear (int8 weights, activations quantized per call). Fastest on CPUs
+  with VNNI/AMX, CPU only.
+- ``weight_only``: nn.Linear weights are stored as per-channel int8 and
+  dequantized on the fly. Cuts weight memory by ~4x with minimal drift.
+
+Only Linear layers are touched, which covers the CLIP ViT-L encoder, the UNet
+attention/feed-forward projections, the ControlNet-style id/pose encoders and
+the makeup adapter projections. Convolutions stay in full precision.
+"""
+from typing import Dict, Iterable, Optional
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+QUANTIZE_MODES = ("none", "dynamic", "weight_only")
+
+
+class DynamicInt8Linear(nn.Module):
+    """Dynamic int8 replacement for nn.Linear (and subclasses such as diffusers'
+    LoRACompatibleLinear, which torch's own quantize_dynamic skips)."""
+
+    def __init__(self, linear: nn.Linear):
+        super().__init__()
+        self.in_features = linear.in_features
+        self.out_features = linear.out_features
+        # quantized dynamic Linear.from_float only accepts plain nn.Linear instances
+        plain = nn.Linear(self.in_features, self.out_features, bias=linear.bias is not None)
+        plain.weight.data.copy_(linear.weight.detach().float().cpu())
+        if linear.bias is not None:
+            plain.bias.data.copy_(linear.bias.detach().float().cpu())
+        plain.qconfig = torch.ao.quantization.default_dynamic_qconfig
+        self.inner = torch.ao.nn.quantized.dynamic.Linear.from_float(plain)
+
+    def forward(self, x: torch.Tensor, *args, **kwargs) -> torch.Tensor:
+        # Extra args (e.g. LoRA ``scale``) are accepted and ignored
+        out_dtype = x.dtype
+        return self.inner(x.float()).to(out_dtype)
+
+
+class WeightOnlyInt8Linear(nn.Module):
+    """nn.Linear with per-output-channel symmetric int8 weights, dequantized per call."""
+
+    def __init__(self, linear: nn.Linear):
+        super().__init__()
+        self.in_features = linear.in_features
+        self.out_features = linear.out_features
+        weight = linear.weight.detach().float()
+        scale = weight.abs().amax(dim=1, keepdim=True).clamp(min=1e-8) / 127.0
+        self.register_buffer("weight_int8", torch.round(weight / scale).clamp(-127, 127).to(torch.int8))
+        self.register_buffer("weight_scale", scale)
+        if linear.bias is not None:
+            self.register_buffer("bias", linear.bias.detach().clone())
+        else:
+            self.bias = None
+
+    def forward(self, x: torch.Tensor, *args, **kwargs) -> torch.Tensor:
+        weight = self.weight_int8.to(x.dtype) * self.weight_scale.to(x.dtype)
+        bias = self.bias.to(x.dtype) if self.bias is not None else None
+        return F.linear(x, weight, bias)
+
+
+_LAYER_FOR_MODE = {
+    "dynamic": DynamicInt8Linear,
+    "weight_only": WeightOnlyInt8Linear,
+}
+
+
+def _swap_linears(module: nn.Module, layer_cls, seen: set) -> int:
+    swapped = 0
+    for name, child in list(module.named_children()):
+        if id(child) in seen:
+            continue
+        seen.add(id(child))
+        if isinstance(child, nn.Linear):
+            setattr(module, name, layer_cls(child))
+            swapped += 1
+        else:
+            swapped += _swap_linears(child, layer_cls, seen)
+    return swapped
+
+
+def quantize_modules(modules: Iterable[Optional[nn.Module]], mode: str) -> Dict[str, int]:
+    """Swap every nn.Linear reachable from ``modules`` for its int8 counterpart, in place.
+
+    Shared submodules (the UNet is referenced by both the pipeline and the makeup
+    encoder) are only converted once. Returns ``{"linear_layers": n}``.
+    """
+    mode = (mode or "none").lower()
+    if mode not in QUANTIZE_MODES:
+        raise ValueError(f"Unknown quantization mode {mode!r}; expected one of {QUANTIZE_MODES}")
+    if mode == "none":
+        return {"linear_layers": 0}
+    layer_cls = _LAYER_FOR_MODE[mode]
+    seen: set = set()
+    swapped = 0
+    for module in modules:
+        if module is None or not isinstance(module, nn.Module) or id(module) in seen:
+            continue
+        seen.add(id(module))
+        swapped += _swap_linears(module, layer_cls, seen)
+    return {"linear_layers": swapped}
+
+
+def quantize_stable_makeup(namespace, mode: str) -> Dict[str, int]:
+    """Quantize the models held by an ``infer_kps``/``gradio_demo_kps`` module namespace.
+
+    Covers the makeup encoder (CLIP image encoder + adapter projections), the UNet
+    (including adapter attention processors registered on it) and the id/pose
+    ControlNet encoders. Dynamic quantization is CPU only.
+    """
+    pipe = getattr(namespace, "pipe", None)
+    device = getattr(pipe, "device", None)
+    if mode == "dynamic" and device is not None and getattr(device, "type", "cpu") != "cpu":
+        raise RuntimeError(f"dynamic int8 quantization requires CPU execution, pipeline is on {device}")
+    controlnet = getattr(pipe, "controlnet", None)
+    nets = getattr(controlnet, "nets", None)
+    modules = [
+        getattr(namespace, "makeup_encoder", None),
+        getattr(pipe, "unet", None),
+        getattr(namespace, "id_encoder", None),
+        getattr(namespace, "pose_encoder", None),
+    ]
+    modules.extend(nets if nets is not None else [controlnet])
+    with torch.no_grad():
+        return quantize_modules(modules, mode)
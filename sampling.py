@@ -0,0 +1,343 @@
+"""Per-step control of the upstream denoising loop.
+
+``makeup_encoder.generate`` hands everything to the Stable-Makeup pipeline, whose
+loop we don't own. ``DenoiseController`` hooks in by temporarily swapping the
+pipeline's scheduler for a thin proxy: the loop calls ``scheduler.step`` once
+per denoising step, which lets the controller watch the latents and stop the
+loop early. When it stops, the current x0 prediction is decoded with the VAE,
+exactly as the pipeline would have decoded its final latents.
+
+Adaptive early exit (opt-in): after ``min_steps``, the loop stops as soon as the
+relative mean change of the predicted x0 between consecutive steps drops below
+``threshold``. Only then is that change computed; other controllers (strength,
+deadlines, guidance) add no per-step tensor work or device sync.
+
+Partial denoising (``strength`` < 1): the source face is VAE-encoded, noised to
+the timestep ``strength`` of the way into the schedule, and only the remaining
+``round(strength * steps)`` steps run (img2img-style). The identity/pose
+ControlNets still condition every step; lower strength means fewer steps and
+output closer to the source.
+
+Guidance fast paths (opt-in): classifier-free guidance runs the UNet (and the
+ControlNets) on a doubled batch, [unconditional, conditional]. ``guided_models``
+patches their ``forward`` so that, on steps where the controller says so, only
+the conditional half is evaluated and mirrored into both halves; the pipeline's
+``uncond + g * (cond - uncond)`` then reduces to ``cond``. ``cfg_fast_path``
+does this for every step when the guidance scale is at or below 1 (the diffusers
+convention, where CFG is off for g <= 1); ``cfg_truncation`` does it for that
+final fraction of the steps, where guidance changes little but still costs a
+second UNet pass.
+
+Deadlines: a controller given a ``deadline`` (see deadlines.py) checks it before
+every step, so a request that runs out of budget or is cancelled stops between
+steps with DeadlineExceeded instead of finishing the schedule.
+"""
+import contextlib
+import inspect
+import os
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import torch
+from PIL import Image
+
+
+class EarlyExit(Exception):
+    """Raised from inside the denoising loop to stop it; carries the latents to decode."""
+
+    def __init__(self, latents: torch.Tensor):
+        super().__init__("denoising stopped early")
+        self.latents = latents
+
+
+class DenoiseController:
+    """Observes every scheduler step and decides whether the loop should stop."""
+
+    def __init__(self, threshold: Optional[float] = None, min_steps: int = 10, strength: float = 1.0,
+                 deadline=None, guidance: Optional[float] = None, cfg_fast_path: bool = False,
+                 cfg_truncation: float = 0.0, count_unet: bool = False):
+        self.threshold = threshold
+        self.deadline = deadline
+        self.guidance = guidance
+        self.cfg_fast_path = cfg_fast_path
+        self.cfg_truncation = float(cfg_truncation)
+        self.count_unet = count_unet
+        self.unet_evals = 0
+        self.cfg_skipped_steps = 0
+        self.min_steps = min_steps
+        self.strength = float(strength)
+        self.steps_scheduled = 0
+        self.steps_run = 0
+        self.deltas: List[float] = []
+        self.stopped_early = False
+        self._last: Optional[torch.Tensor] = None
+
+    @classmethod
+    def adaptive_from_env(cls) -> "DenoiseController":
+        """Early-exit controller tuned by MAKEUP_EARLY_EXIT_THRESHOLD / MAKEUP_EARLY_EXIT_MIN_STEPS."""
+        return cls(
+            threshold=float(os.environ.get("MAKEUP_EARLY_EXIT_THRESHOLD", 0.01)),
+            min_steps=int(os.environ.get("MAKEUP_EARLY_EXIT_MIN_STEPS", 10)),
+        )
+
+    @classmethod
+    def for_request(cls, adaptive_steps: bool = False, strength: float = 1.0, deadline=None,
+                    guidance: Optional[float] = None, cfg_fast_path: bool = False,
+                    cfg_truncation: float = 0.0) -> Optional["DenoiseController"]:
+        """Controller for the per-request options, or None when the plain full schedule applies."""
+        if deadline is not None and not deadline.has_limit("diffusion"):
+            deadline = None
+        if not adaptive_steps and strength >= 1.0 and deadline is None and not cfg_fast_path \
+                and cfg_truncation <= 0:
+            return None
+        controller = cls.adaptive_from_env() if adaptive_steps else cls()
+        controller.strength = float(strength)
+        controller.deadline = deadline
+        controller.guidance = guidance
+        controller.cfg_fast_path = cfg_fast_path
+        controller.cfg_truncation = float(cfg_truncation)
+        return controller
+
+    def schedule(self, timesteps: torch.Tensor) -> torch.Tensor:
+        """The part of the scheduler's timesteps that will actually run (the last ``strength`` of them)."""
+        if self.strength >= 1.0:
+            return timesteps
+        keep = min(len(timesteps), max(1, int(round(len(timesteps) * self.strength))))
+        return timesteps[len(timesteps) - keep:]
+
+    @property
+    def guides_models(self) -> bool:
+        """Whether the UNet/ControlNet forwards need the guided_models hook."""
+        return self.cfg_fast_path or self.cfg_truncation > 0 or self.count_unet
+
+    def skip_uncond(self) -> bool:
+        """Evaluate only the conditional branch for the step about to run."""
+        if self.cfg_fast_path and self.guidance is not None and self.guidance <= 1.0:
+            return True
+        if self.cfg_truncation > 0 and self.steps_scheduled:
+            guided = self.steps_scheduled - int(round(self.steps_scheduled * min(self.cfg_truncation, 1.0)))
+            return self.steps_run >= guided
+        return False
+
+    def on_set_timesteps(self, timesteps: torch.Tensor) -> torch.Tensor:
+        timesteps = self.schedule(timesteps)
+        self.steps_scheduled = len(timesteps)
+        return timesteps
+
+    def after_step(self, prev_sample: torch.Tensor, pred_original: Optional[torch.Tensor]) -> None:
+        if self.deadline is not None:
+            self.deadline.check()  # a clock comparison, no tensor work
+        self.steps_run += 1
+        if not self.threshold:
+            # The delta reads a value back from the device (a sync per step) and needs a copy of x0;
+            # only early exit pays for that
+            return
+        current = pred_original if pred_original is not None else prev_sample
+        if self._last is not None:
+            delta = float((current - self._last).abs().mean() / (self._last.abs().mean() + 1e-8))
+            self.deltas.append(delta)
+            remaining = self.steps_scheduled - self.steps_run
+            if remaining > 0 and self.steps_run >= self.min_steps and delta < self.threshold:
+                self.stopped_early = True
+                raise EarlyExit(current)
+        self._last = current.detach().clone()
+
+    def stats(self) -> Dict:
+        return {
+            "steps_scheduled": self.steps_scheduled,
+            "steps_run": self.steps_run,
+            "strength": self.strength,
+            "stopped_early": self.stopped_early,
+            "last_delta": self.deltas[-1] if self.deltas else None,
+            "unet_evals": self.unet_evals if self.guides_models else None,
+            "cfg_skipped_steps": self.cfg_skipped_steps,
+        }
+
+
+class ControlledScheduler:
+    """Scheduler proxy: forwards everything to the wrapped scheduler and reports each step."""
+
+    def __init__(self, inner, controller: DenoiseController):
+        self.__dict__["inner"] = inner
+        self.__dict__["controller"] = controller
+        self.__dict__["_timesteps"] = None
+
+        def step(model_output, timestep, sample, *args, return_dict: bool = True, **kwargs):
+            out = inner.step(model_output, timestep, sample, *args, return_dict=True, **kwargs)
+            controller.after_step(out.prev_sample, getattr(out, "pred_original_sample", None))
+            return out if return_dict else (out.prev_sample,)
+
+        # The pipeline inspects scheduler.step's signature to decide whether to pass eta/generator
+        step.__signature__ = inspect.signature(inner.step)
+        self.__dict__["step"] = step
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.inner, name, value)
+
+    @property
+    def timesteps(self):
+        return self._timesteps if self._timesteps is not None else self.inner.timesteps
+
+    def set_timesteps(self, *args, **kwargs):
+        self.inner.set_timesteps(*args, **kwargs)
+        self.__dict__["_timesteps"] = self.controller.on_set_timesteps(self.inner.timesteps)
+
+
+@contextlib.contextmanager
+def controlled_scheduler(pipe, controller: DenoiseController) -> Iterator[None]:
+    """Swap ``pipe.scheduler`` for a ControlledScheduler inside the block (config untouched)."""
+    original = pipe.__dict__.get("scheduler", pipe.scheduler)
+    proxy = ControlledScheduler(original, controller)
+    pipe.__dict__["scheduler"] = proxy
+    try:
+        yield
+    finally:
+        pipe.__dict__["scheduler"] = original
+
+
+def _cond_half(value, batch: int):
+    """The conditional (second) half of every tensor in ``value`` that carries the CFG batch."""
+    if torch.is_tensor(value):
+        return value[batch // 2:] if value.dim() > 0 and value.shape[0] == batch else value
+    if isinstance(value, (list, tuple)):
+        return type(value)(_cond_half(v, batch) for v in value)
+    if isinstance(value, dict):
+        return {k: _cond_half(v, batch) for k, v in value.items()}
+    return value
+
+
+def _mirrored(value):
+    """``value`` with every tensor repeated into both CFG halves (tuple/list/ModelOutput aware)."""
+    if torch.is_tensor(value):
+        return torch.cat([value, value])
+    if isinstance(value, (list, tuple)):
+        return type(value)(_mirrored(v) for v in value)
+    if isinstance(value, dict):
+        return type(value)(**{k: _mirrored(v) for k, v in value.items()})
+    return value
+
+
+def _guided_forward(forward, controller: DenoiseController, is_unet: bool):
+    def guided(*args, **kwargs):
+        sample = args[0] if args else kwargs["sample"]
+        batch = sample.shape[0]
+        if batch >= 2 and batch % 2 == 0 and controller.skip_uncond():
+            try:
+                out = forward(*_cond_half(args, batch), **_cond_half(kwargs, batch))
+            except RuntimeError as e:
+                # Some model state is tied to the doubled batch; run full CFG for the rest of the request
+                print(f"⚠️ CFG fast path disabled for this request: {e}")
+                controller.cfg_fast_path, controller.cfg_truncation = False, 0.0
+            else:
+                if is_unet:
+                    controller.unet_evals += batch // 2
+                    controller.cfg_skipped_steps += 1
+                return _mirrored(out)
+        if is_unet:
+            controller.unet_evals += batch
+        return forward(*args, **kwargs)
+
+    return guided
+
+
+@contextlib.contextmanager
+def guided_models(pipe, controller: DenoiseController) -> Iterator[None]:
+    """Route ``pipe.unet`` / ``pipe.controlnet`` through the controller's CFG decisions inside the block.
+
+    ``forward`` is patched on the instances (restoring any previous instance patch on
+    exit), so isinstance checks in the pipeline still see the real modules.
+    """
+    patched = []
+    for name in ("unet", "controlnet"):
+        module = getattr(pipe, name, None)
+        if module is None or not callable(getattr(module, "forward", None)):
+            continue
+        previous = module.__dict__.get("forward")
+        module.forward = _guided_forward(module.forward, controller, is_unet=name == "unet")
+        patched.append((module, previous))
+    try:
+        yield
+    finally:
+        for module, previous in reversed(patched):
+            if previous is None:
+                del module.forward
+            else:
+                module.forward = previous
+
+
+def decode_latents(pipe, latents: torch.Tensor) -> Image.Image:
+    """VAE-decode latents to a PIL image the way the pipeline post-processes its output."""
+    vae = pipe.vae
+    with torch.no_grad():
+        image = vae.decode(latents.to(vae.dtype) / vae.config.scaling_factor, return_dict=False)[0]
+    processor = getattr(pipe, "image_processor", None)
+    if processor is not None:
+        return processor.postprocess(image, output_type="pil")[0]
+    image = (image / 2 + 0.5).clamp(0, 1)[0].permute(1, 2, 0).float().cpu().numpy()
+    return Image.fromarray((image * 255).round().astype(np.uint8))
+
+
+def encode_image(pipe, image: Image.Image, generator: Optional[torch.Generator] = None) -> torch.Tensor:
+    """VAE-encode a PIL image to scaled latents (the inverse of decode_latents)."""
+    vae = pipe.vae
+    processor = getattr(pipe, "image_processor", None)
+    if processor is not None:
+        pixels = processor.preprocess(image)
+    else:
+        array = np.asarray(image.convert("RGB"), dtype=np.float32) / 127.5 - 1.0
+        pixels = torch.from_numpy(array).permute(2, 0, 1).unsqueeze(0)
+    pixels = pixels.to(device=vae.device, dtype=vae.dtype)
+    with torch.no_grad():
+        latents = vae.encode(pixels).latent_dist.sample(generator)
+    return latents * vae.config.scaling_factor
+
+
+def start_latents(pipe, controller: DenoiseController, image: Image.Image, num_inference_steps: int,
+                  seed: Optional[int] = None) -> torch.Tensor:
+    """Latents of ``image`` noised to the first timestep ``controller`` will run."""
+    scheduler = pipe.scheduler
+    device = pipe.vae.device
+    scheduler.set_timesteps(num_inference_steps, device=device)
+    first = controller.schedule(scheduler.timesteps)[:1]
+    generator = torch.Generator(device="cpu").manual_seed(0 if seed is None else int(seed))
+    latents = encode_image(pipe, image, generator)
+    noise = torch.randn(latents.shape, generator=generator, dtype=torch.float32).to(device, latents.dtype)
+    latents = scheduler.add_noise(latents, noise, first.to(device))
+    return latents.to(dtype=pipe.unet.dtype if getattr(pipe, "unet", None) is not None else latents.dtype)
+
+
+def _generate_steps(generate, kwargs: Dict, fallback: int = 30) -> int:
+    """Denoising steps ``generate(**kwargs)`` runs: the caller's value, else generate's own default."""
+    if kwargs.get("num_inference_steps") is not None:
+        return int(kwargs["num_inference_steps"])
+    try:
+        default = inspect.signature(generate).parameters["num_inference_steps"].default
+    except (KeyError, TypeError, ValueError):
+        default = inspect.Parameter.empty
+    return fallback if default in (inspect.Parameter.empty, None) else int(default)
+
+
+def controlled_generate(namespace, controller: Optional[DenoiseController] = None,
+                        init_image: Optional[Image.Image] = None, **kwargs):
+    """``makeup_encoder.generate`` under ``controller``; decodes x0 when the loop stops early.
+
+    With ``controller.strength`` < 1, denoising starts from ``init_image`` (the source face).
+    """
+    pipe = namespace.pipe
+    if controller is None or pipe is None:
+        return namespace.makeup_encoder.generate(pipe=pipe, **kwargs)
+    if controller.strength < 1.0 and init_image is not None and kwargs.get("latents") is None:
+        # Pass the step count explicitly so the start timestep comes from the schedule that runs
+        kwargs["num_inference_steps"] = _generate_steps(namespace.makeup_encoder.generate, kwargs)
+        kwargs["latents"] = start_latents(
+            pipe, controller, init_image, kwargs["num_inference_steps"], kwargs.get("seed")
+        )
+    guided = guided_models(pipe, controller) if controller.guides_models else contextlib.nullcontext()
+    with controlled_scheduler(pipe, controller), guided:
+        try:
+            return namespace.makeup_encoder.generate(pipe=pipe, **kwargs)
+        except EarlyExit as stop:
+            return decode_latents(pipe, stop.latents)
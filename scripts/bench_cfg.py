@@ -0,0 +1,97 @@
+"""UNet evaluations saved and image drift of the classifier-free guidance fast paths, per intensity.
+
+For every intensity, each source/reference pair is generated with full CFG on
+every step (the baseline), with ``cfg_fast_path`` and with each
+``--truncations`` fraction (same seed). Reports UNet evaluations per image (one
+per latent in the UNet batch), latency, and MAE / PSNR / SSIM against the
+baseline, per pair and averaged per intensity and mode.
+
+    python scripts/bench_cfg.py --sources eval/faces --references eval/looks \
+        --intensities 0.3 0.6 1.0 1.4 2.0 --truncations 0.1 0.2 0.3
+"""
+import argparse
+import json
+import os
+import tempfile
+
+from bench_common import generate_pair, image_metrics, load_runtime, timed
+from load_test import list_images
+from sampling import DenoiseController
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sources", required=True, help="Directory of source faces")
+    parser.add_argument("--references", required=True, help="Directory of reference looks (paired round-robin)")
+    parser.add_argument("--intensities", type=float, nargs="+", default=[0.3, 0.6, 1.0, 1.4, 2.0])
+    parser.add_argument("--truncations", type=float, nargs="+", default=[0.1, 0.2, 0.3])
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="cfg_report.json")
+    args = parser.parse_args()
+
+    sources = list_images(os.path.abspath(args.sources))
+    references = list_images(os.path.abspath(args.references))
+    if not sources or not references:
+        raise SystemExit("Need at least one source and one reference image")
+    pairs = [(s, references[i % len(references)]) for i, s in enumerate(sources)]
+
+    _predictor, ns = load_runtime()
+    out_dir = tempfile.mkdtemp(prefix="cfg_bench_")
+    modes = {"fast_path": {"cfg_fast_path": True}}
+    modes.update({f"truncate_{t:g}": {"cfg_truncation": t} for t in args.truncations})
+
+    def run(source, reference, intensity, **options):
+        controller = DenoiseController(guidance=1.6 * intensity, count_unet=True, **options)
+        image, seconds = timed(generate_pair, ns, source, reference, intensity, args.seed,
+                               controller=controller, num_inference_steps=args.steps)
+        return image, {"latency_s": seconds, "unet_evals": controller.unet_evals,
+                       "cfg_skipped_steps": controller.cfg_skipped_steps}
+
+    run(*pairs[0], 1.0)  # warm-up
+
+    rows = []
+    for intensity in args.intensities:
+        for index, (source, reference) in enumerate(pairs):
+            baseline, base = run(source, reference, intensity)
+            baseline.save(os.path.join(out_dir, f"{index}_i{intensity:g}_full.png"))
+            row = {"intensity": intensity, "guidance": 1.6 * intensity, "source": source, "reference": reference,
+                   "full": base}
+            for name, options in modes.items():
+                image, result = run(source, reference, intensity, **options)
+                image.save(os.path.join(out_dir, f"{index}_i{intensity:g}_{name}.png"))
+                result["unet_evals_saved"] = base["unet_evals"] - result["unet_evals"]
+                result["vs_full"] = image_metrics(image, baseline)
+                row[name] = result
+            rows.append(row)
+            print(f"⏱️ intensity {intensity:g}, {os.path.basename(source)}: " + ", ".join(
+                f"{name} -{row[name]['unet_evals_saved']} evals (MAE {row[name]['vs_full']['mae']:.2f})"
+                for name in modes))
+
+    def mean(values):
+        values = list(values)
+        return sum(values) / len(values) if values else None
+
+    summary = {}
+    for intensity in args.intensities:
+        entries = [r for r in rows if r["intensity"] == intensity]
+        summary[f"{intensity:g}"] = {"full": {
+            "mean_unet_evals": mean(r["full"]["unet_evals"] for r in entries),
+            "mean_latency_s": mean(r["full"]["latency_s"] for r in entries),
+        }}
+        for name in modes:
+            summary[f"{intensity:g}"][name] = {
+                "mean_unet_evals": mean(r[name]["unet_evals"] for r in entries),
+                "mean_unet_evals_saved": mean(r[name]["unet_evals_saved"] for r in entries),
+                "mean_latency_s": mean(r[name]["latency_s"] for r in entries),
+                **{f"mean_{k}": mean(r[name]["vs_full"][k] for r in entries)
+                   for k in ("mae", "psnr", "ssim") if k in entries[0][name]["vs_full"]},
+            }
+
+    with open(args.output, "w") as f:
+        json.dump({"summary": summary, "pairs": rows, "images": out_dir}, f, indent=2)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Shared helpers for the benchmark / calibration scripts in this directory.
+
+The scripts drive the same runtime as predict.py (clone + patch Stable-Makeup,
+import infer_kps) and report latency, memory and image-difference metrics as JSON.
+"""
+import os
+import resource
+import sys
+import time
+from typing import Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from image_io import as_rgb_array, decode_image  # noqa: E402
+from sampling import controlled_generate  # noqa: E402
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MB (Linux /proc, ru_maxrss elsewhere)."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def load_runtime(env: Optional[Dict[str, str]] = None):
+    """Prepare the Stable-Makeup checkout like Predictor.predict does and return (predictor, infer_kps)."""
+    for key, value in (env or {}).items():
+        os.environ[key] = value
+    os.chdir(REPO_ROOT)
+    from predict import Predictor
+
+    predictor = Predictor()
+    predictor._prepare_runtime()
+    return predictor, predictor._load_infer_module()
+
+
+def generate_pair(namespace, source_path: str, reference_path: str, intensity: float = 1.0,
+                  seed: int = 0, size: int = 512, controller=None, **kwargs) -> Image.Image:
+    """Run one seeded source/reference generation through the upstream makeup encoder.
+    ``controller`` is an optional sampling.DenoiseController.
+    """
+    id_image = decode_image(source_path, (size, size))
+    makeup_image = decode_image(reference_path, (size, size))
+    pose_image = namespace.get_draw(id_image, size=size)
+    result = controlled_generate(
+        namespace,
+        controller,
+        init_image=id_image,
+        id_image=[id_image, pose_image],
+        makeup_image=makeup_image,
+        guidance_scale=1.6 * float(intensity),
+        seed=seed,
+        **kwargs,
+    )
+    if not isinstance(result, Image.Image):
+        result = Image.fromarray(as_rgb_array(result))
+    return result
+
+
+def timed(fn, *args, **kwargs):
+    """Return (result, seconds) for a single call."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def image_metrics(candidate: Image.Image, baseline: Image.Image) -> Dict[str, float]:
+    """Pixel-difference metrics of ``candidate`` against ``baseline`` (resized to match)."""
+    if candidate.size != baseline.size:
+        candidate = candidate.resize(baseline.size, Image.BICUBIC)
+    a = np.asarray(candidate.convert("RGB"), dtype=np.float64)
+    b = np.asarray(baseline.convert("RGB"), dtype=np.float64)
+    diff = a - b
+    mse = float(np.mean(diff ** 2))
+    metrics = {
+        "mae": float(np.mean(np.abs(diff))),
+        "max_abs": float(np.max(np.abs(diff))),
+        "psnr": float("inf") if mse == 0 else float(10.0 * np.log10(255.0 ** 2 / mse)),
+    }
+    try:
+        from skimage.metrics import structural_similarity
+        metrics["ssim"] = float(structural_similarity(a, b, channel_axis=-1, data_range=255.0))
+    except Exception:
+        pass
+    return metrics
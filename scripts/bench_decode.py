@@ -0,0 +1,88 @@
+"""Benchmark input decoding: the old double full decode vs the shared reduced-scale decode.
+
+The old flow decoded the uploaded source twice per request (inference and eye
+preservation), each time at full resolution followed by a resize to 512x512.
+The new flow decodes once with a JPEG draft (DCT-domain downscale). Synthetic
+JPEGs are generated for each megapixel size unless files are passed in.
+
+    python scripts/bench_decode.py --megapixels 1 12 24 48 --runs 5
+    python scripts/bench_decode.py photos/*.jpg
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from bench_common import image_metrics
+from image_io import decode_full, decode_image
+
+
+def synthetic_jpeg(megapixels: float, directory: str) -> str:
+    # 4:3 photo with smooth structure plus noise so the JPEG isn't trivially compressible
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([xx / width, yy / height, (xx + yy) / (width + height)], axis=-1) * 255.0
+    noise = rng.normal(0, 12, size=(height, width, 3)).astype(np.float32)
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+    path = os.path.join(directory, f"synthetic_{megapixels:g}mp.jpg")
+    Image.fromarray(pixels).save(path, quality=92)
+    return path
+
+
+def old_flow(path: str):
+    inference = decode_full(path).resize((512, 512))
+    eyes = decode_full(path).resize((512, 512))
+    return inference, eyes
+
+
+def new_flow(path: str):
+    image = decode_image(path)
+    return image, image
+
+
+def bench(fn, path: str, runs: int) -> float:
+    fn(path)
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn(path)
+    return (time.perf_counter() - start) / runs * 1000.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="*")
+    parser.add_argument("--megapixels", nargs="+", type=float, default=[1, 12, 24, 48])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", default="decode_bench.json")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="decode_bench_")
+    paths = args.images or [synthetic_jpeg(mp, tmp) for mp in args.megapixels]
+    results = []
+    for path in paths:
+        with Image.open(path) as img:
+            width, height = img.size
+        old_ms = bench(old_flow, path, args.runs)
+        new_ms = bench(new_flow, path, args.runs)
+        results.append({
+            "image": os.path.basename(path),
+            "megapixels": round(width * height / 1e6, 1),
+            "old_double_full_decode_ms": old_ms,
+            "shared_draft_decode_ms": new_ms,
+            "speedup": old_ms / new_ms,
+            "vs_full_decode": image_metrics(new_flow(path)[0], old_flow(path)[0]),
+        })
+        print(f"{results[-1]['image']}: {old_ms:.1f} ms -> {new_ms:.1f} ms ({old_ms / new_ms:.1f}x)")
+
+    with open(args.output, "w") as f:
+        json.dump({"runs": args.runs, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Two-pass vs shared single-pass landmarks for the pose map and the eye mask.
+
+Two-pass (previous flow): upstream ``get_draw`` (facelib + SPIGA + matplotlib
+render) for the pose map, then a second detection by the eye landmark backend
+for the eye mask. Single-pass: one ``detect`` whose points feed both
+``landmarks.pose_map`` (cv2 render) and ``landmarks.eye_mask``.
+
+Reports per-image latency of both flows and how closely the cv2 pose map
+matches upstream's (pixel metrics plus IoU of the drawn pixels). Both pose maps
+are saved for inspection.
+
+    python scripts/bench_landmark_pass.py faces/ --backend spiga --runs 3
+"""
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+from bench_common import image_metrics, load_runtime, timed
+from image_io import decode_image
+from landmarks import eye_mask, get_landmark_backend, pose_map
+from load_test import list_images
+
+
+def two_pass(namespace, backend, image: Image.Image):
+    pose = namespace.get_draw(image, size=512)
+    mask = eye_mask(backend.detect(np.asarray(image)), image.size)
+    return pose, mask
+
+
+def single_pass(backend, image: Image.Image):
+    result = backend.detect(np.asarray(image))
+    return pose_map(result, 512, image.size), eye_mask(result, image.size)
+
+
+def drawn_iou(a: Image.Image, b: Image.Image) -> float:
+    a = np.asarray(a.convert("L")) > 0
+    b = np.asarray(b.convert("L")) > 0
+    union = np.logical_or(a, b).sum()
+    return float(np.logical_and(a, b).sum() / union) if union else 1.0
+
+
+def best_of(runs: int, fn, *args):
+    result, best = None, float("inf")
+    for _ in range(runs):
+        result, seconds = timed(fn, *args)
+        best = min(best, seconds)
+    return result, best * 1000.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="+", help="Image files or directories")
+    parser.add_argument("--backend", default="spiga")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", default="landmark_pass_bench.json")
+    args = parser.parse_args()
+    paths = [os.path.abspath(p) for arg in args.images for p in (list_images(arg) if os.path.isdir(arg) else [arg])]
+
+    _predictor, namespace = load_runtime()
+    backend = get_landmark_backend(args.backend)
+    out_dir = tempfile.mkdtemp(prefix="landmark_pass_")
+
+    rows = []
+    for index, path in enumerate(paths):
+        image = decode_image(path)
+        two_pass(namespace, backend, image)  # warm caches for this size
+        (upstream_pose, _mask), two_ms = best_of(args.runs, two_pass, namespace, backend, image)
+        (shared_pose, _mask), one_ms = best_of(args.runs, single_pass, backend, image)
+        upstream_pose = Image.fromarray(np.asarray(upstream_pose).astype(np.uint8)).convert("RGB")
+        upstream_pose.save(os.path.join(out_dir, f"{index}_get_draw.png"))
+        row = {"image": os.path.basename(path), "two_pass_ms": two_ms, "single_pass_ms": one_ms,
+               "speedup": two_ms / one_ms}
+        if shared_pose is None:
+            row["pose_map"] = "backend has no 68-point set; predict falls back to get_draw"
+        else:
+            shared_pose.save(os.path.join(out_dir, f"{index}_shared.png"))
+            row["pose_vs_get_draw"] = image_metrics(shared_pose, upstream_pose)
+            row["pose_drawn_iou"] = drawn_iou(shared_pose, upstream_pose)
+        rows.append(row)
+        print(f"{row['image']}: {two_ms:.0f} ms -> {one_ms:.0f} ms ({row['speedup']:.2f}x)")
+
+    summary = {
+        "backend": args.backend,
+        "mean_two_pass_ms": float(np.mean([r["two_pass_ms"] for r in rows])),
+        "mean_single_pass_ms": float(np.mean([r["single_pass_ms"] for r in rows])),
+        "pose_maps": out_dir,
+    }
+    summary["speedup"] = summary["mean_two_pass_ms"] / summary["mean_single_pass_ms"]
+    with open(args.output, "w") as f:
+        json.dump({"summary": summary, "images": rows}, f, indent=2)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
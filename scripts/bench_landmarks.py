@@ -0,0 +1,107 @@
+"""Compare eye-landmark backends on CPU: init cost, latency and eye-mask IoU.
+
+Masks are built exactly as in eye preservation (landmarks.eye_mask on the 512x512
+source) and compared against the reference backend (SPIGA by default).
+
+    python scripts/bench_landmarks.py faces/ --backends spiga mediapipe face_alignment --output lm.json
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+# Benchmark the CPU path regardless of the host
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+import numpy as np
+from PIL import Image
+
+from bench_common import rss_mb
+from landmarks import LANDMARK_BACKENDS, eye_mask, get_landmark_backend
+
+
+def collect_images(paths):
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            for ext in ("*.jpg", "*.jpeg", "*.png", "*.webp"):
+                images.extend(sorted(glob.glob(os.path.join(path, ext))))
+        else:
+            images.append(path)
+    return images
+
+
+def mask_iou(a, b) -> float:
+    if a is None or b is None:
+        return float("nan")
+    a = np.asarray(a) > 127
+    b = np.asarray(b) > 127
+    union = np.logical_or(a, b).sum()
+    return float(np.logical_and(a, b).sum() / union) if union else 1.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="+", help="Image files or directories")
+    parser.add_argument("--backends", nargs="+", default=list(LANDMARK_BACKENDS))
+    parser.add_argument("--reference-backend", default="spiga")
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", default="landmark_bench.json")
+    args = parser.parse_args()
+
+    images = [np.asarray(Image.open(p).convert("RGB").resize((args.size, args.size))) for p in collect_images(args.images)]
+    if not images:
+        raise SystemExit("No images found")
+    backends = list(dict.fromkeys([args.reference_backend] + args.backends))
+
+    masks = {}
+    report = {"images": len(images), "size": args.size, "reference": args.reference_backend, "backends": {}}
+    for name in backends:
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        try:
+            backend = get_landmark_backend(name)
+        except Exception as e:
+            report["backends"][name] = {"error": str(e)}
+            continue
+        init_s = time.perf_counter() - start
+        backend.detect(images[0])  # warm-up (lazy graph/kernel init)
+
+        latencies, masks[name], detected = [], [], 0
+        for rgb in images:
+            result = None
+            for _ in range(args.runs):
+                t0 = time.perf_counter()
+                result = backend.detect(rgb)
+                latencies.append(time.perf_counter() - t0)
+            detected += int(result is not None and result.eyes is not None)
+            masks[name].append(eye_mask(result, (args.size, args.size)))
+
+        lat_ms = np.array(latencies) * 1000.0
+        report["backends"][name] = {
+            "init_s": init_s,
+            "rss_increase_mb": rss_mb() - rss_before,
+            "latency_ms_mean": float(lat_ms.mean()),
+            "latency_ms_p50": float(np.percentile(lat_ms, 50)),
+            "latency_ms_p95": float(np.percentile(lat_ms, 95)),
+            "eye_landmark_rate": detected / len(images),
+        }
+
+    ref_masks = masks.get(args.reference_backend)
+    if ref_masks is not None:
+        for name, entry in report["backends"].items():
+            if name in masks:
+                ious = [mask_iou(m, r) for m, r in zip(masks[name], ref_masks)]
+                valid = [v for v in ious if not np.isnan(v)]
+                entry["mask_iou_mean"] = float(np.mean(valid)) if valid else None
+                entry["mask_iou_min"] = float(np.min(valid)) if valid else None
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
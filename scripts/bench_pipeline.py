@@ -0,0 +1,94 @@
+"""Serial requests vs the staged pipeline (pipeline.StagedPipeline).
+
+Runs the same ``--requests`` source/reference pairs twice: one after the other
+through Predictor._run_inference + JPEG save (the predict() path), then through
+the staged pipeline. Reports throughput of both, how far each staged output is
+from its serial counterpart (both paths apply predict()'s eye-preservation
+defaults, so they should match up to model nondeterminism) and, for the
+pipeline, each stage's utilization and queue behaviour. With ``--stub-latency`` the model is
+the stub from stubs.py (diffusion = a sleep of that length, landmarks = stub),
+so the overlap of the real CPU stages can be measured without a GPU.
+
+    python scripts/bench_pipeline.py --source face.jpg --reference look.jpg --requests 32
+    python scripts/bench_pipeline.py --stub-latency 0.3 --requests 64 --pre-workers 2 --post-workers 2
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from PIL import Image
+
+from bench_common import image_metrics, load_runtime
+from load_test import synthetic_photo
+from pipeline import StagedPipeline
+from stubs import stub_predictor
+
+
+def run_serial(predictor, pairs, out_dir: str) -> float:
+    start = time.perf_counter()
+    for index, (source, reference) in enumerate(pairs):
+        image = predictor._run_inference(source, reference)
+        image.save(os.path.join(out_dir, f"serial_{index}.jpg"))
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", help="Source face (default: synthetic photos)")
+    parser.add_argument("--reference", help="Reference look (default: synthetic photos)")
+    parser.add_argument("--stub-latency", type=float, default=None, help="Use stub models with this diffusion time")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--pre-workers", type=int, default=2)
+    parser.add_argument("--post-workers", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--output", default="pipeline_bench.json")
+    args = parser.parse_args()
+
+    out_dir = tempfile.mkdtemp(prefix="pipeline_bench_")
+    if args.source and args.reference:
+        pairs = [(args.source, args.reference)] * args.requests
+    else:
+        pairs = [(synthetic_photo(os.path.join(out_dir, f"src_{i}.jpg"), i),
+                  synthetic_photo(os.path.join(out_dir, f"ref_{i}.jpg"), 100 + i)) for i in range(args.requests)]
+    if args.stub_latency is not None:
+        predictor = stub_predictor(args.stub_latency)
+    else:
+        predictor, _namespace = load_runtime()
+
+    predictor._run_inference(*pairs[0])  # warm-up
+    serial_s = run_serial(predictor, pairs, out_dir)
+
+    pipeline = StagedPipeline(predictor, pre_workers=args.pre_workers, post_workers=args.post_workers,
+                              queue_size=args.queue_size, output_dir=out_dir)
+    with pipeline:
+        futures = [pipeline.submit(source, reference) for source, reference in pairs]
+        errors = 0
+        mae = []
+        for index, future in enumerate(futures):
+            try:
+                path = future.result()
+            except Exception:
+                errors += 1
+                continue
+            serial = Image.open(os.path.join(out_dir, f"serial_{index}.jpg"))
+            mae.append(image_metrics(Image.open(path), serial)["mae"])
+    staged = pipeline.report()
+
+    report = {
+        "requests": args.requests,
+        "serial_s": serial_s,
+        "serial_throughput_per_s": args.requests / serial_s,
+        "pipeline_errors": errors,
+        "max_mae_vs_serial": max(mae) if mae else None,
+        "pipeline": staged,
+        "speedup": serial_s / staged["wall_s"],
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
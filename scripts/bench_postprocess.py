@@ -0,0 +1,153 @@
+"""Allocations and copies of the per-request image path: old PIL/NumPy round-trips vs one uint8 buffer.
+
+Both flows take a decoded source and the pipeline's PIL output through eye
+preservation (stub landmarks, chroma mode) to a JPEG encode. The old flow is the
+previous implementation (whole-frame YCbCr conversions and float32 copies); the
+new flow is the current predict.py path. Per request it counts
+
+- ``pil_buffers``: image-sized PIL buffers created (convert / filter / copy / fromarray),
+- ``pil_to_numpy``: PIL -> NumPy conversions (each a full copy),
+- ``numpy_peak_mb``: peak of Python/NumPy heap allocations (tracemalloc),
+
+plus latency and the pixel difference between the two outputs.
+
+    python scripts/bench_postprocess.py --runs 50
+"""
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from bench_common import image_metrics
+from image_io import as_rgb_array, decode_image
+from landmarks import eye_mask, get_landmark_backend, register_landmark_backend
+from load_test import synthetic_photo
+from stubs import StubLandmarks
+
+FEATHER_PX = 2.0
+DILATE = 5
+
+
+class CopyCounter:
+    """Counts image-sized PIL buffers and PIL -> NumPy copies while active."""
+
+    def __init__(self, min_pixels: int = 64 * 64):
+        self.min_pixels = min_pixels
+        self.pil_buffers = 0
+        self.pil_to_numpy = 0
+
+    def __enter__(self) -> "CopyCounter":
+        counter = self
+        self._new, self._tobytes = Image.Image._new, Image.Image.tobytes
+
+        def _new(image, im):
+            result = counter._new(image, im)
+            if result.size[0] * result.size[1] >= counter.min_pixels:
+                counter.pil_buffers += 1
+            return result
+
+        def tobytes(image, *args, **kwargs):
+            if image.size[0] * image.size[1] >= counter.min_pixels:
+                counter.pil_to_numpy += 1
+            return counter._tobytes(image, *args, **kwargs)
+
+        Image.Image._new, Image.Image.tobytes = _new, tobytes
+        return self
+
+    def __exit__(self, *exc) -> None:
+        Image.Image._new, Image.Image.tobytes = self._new, self._tobytes
+
+
+def _mask(source: Image.Image) -> Image.Image:
+    mask = eye_mask(get_landmark_backend("stub").detect(np.asarray(source)), source.size)
+    mask = mask.filter(ImageFilter.GaussianBlur(radius=FEATHER_PX))
+    return mask.filter(ImageFilter.MaxFilter(size=DILATE))
+
+
+def old_flow(source_path: str, output: Image.Image) -> bytes:
+    src_img = decode_image(source_path)
+    stylized = output
+    if not isinstance(stylized, Image.Image):
+        stylized = Image.fromarray(stylized.astype(np.uint8))
+    mask = _mask(src_img)
+    src_arr = np.array(src_img.convert("YCbCr"), dtype=np.float32)
+    sty_arr = np.array(stylized.convert("YCbCr"), dtype=np.float32)
+    m = np.expand_dims(np.array(mask, dtype=np.float32) / 255.0, axis=-1)
+    out = sty_arr.copy()
+    out[..., 1] = (1.0 - m[..., 0]) * sty_arr[..., 1] + m[..., 0] * src_arr[..., 1]
+    out[..., 2] = (1.0 - m[..., 0]) * sty_arr[..., 2] + m[..., 0] * src_arr[..., 2]
+    out = np.clip(out, 0, 255).astype("uint8")
+    result = Image.fromarray(out, mode="YCbCr").convert("RGB")
+    buffer = io.BytesIO()
+    result.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def new_flow(predictor, source_path: str, output: Image.Image) -> bytes:
+    src_img = decode_image(source_path)
+    pixels = as_rgb_array(output)
+    predictor._preserve_eyes_colors(np.asarray(src_img), pixels, feather_px=FEATHER_PX, landmark_backend="stub")
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def measure(fn, runs: int) -> dict:
+    fn()
+    with CopyCounter() as counter:
+        tracemalloc.start()
+        start = time.perf_counter()
+        for _ in range(runs):
+            encoded = fn()
+        elapsed = time.perf_counter() - start
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        "latency_ms": elapsed / runs * 1000.0,
+        "pil_buffers": counter.pil_buffers / runs,
+        "pil_to_numpy": counter.pil_to_numpy / runs,
+        "numpy_peak_mb": peak / 1024.0 ** 2,
+        "image": Image.open(io.BytesIO(encoded)).convert("RGB"),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", help="Source face (default: synthetic)")
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--output", default="postprocess_bench.json")
+    args = parser.parse_args()
+
+    from predict import Predictor
+
+    os.environ["MAKEUP_PRESERVE_EYES_DILATE"] = str(DILATE)
+    os.environ["MAKEUP_PRESERVE_EYES_MODE"] = "chroma"
+    register_landmark_backend("stub", StubLandmarks)
+    source = args.source or synthetic_photo(os.path.join(tempfile.mkdtemp(prefix="postprocess_"), "src.jpg"), 0)
+    # Stand-in pipeline output: the source with a colour cast, as a fresh PIL image like pipe(...).images[0]
+    shifted = np.asarray(decode_image(source), dtype=np.int16) + (25, -10, 15)
+    output = Image.fromarray(np.clip(shifted, 0, 255).astype(np.uint8))
+
+    predictor = Predictor()
+    old = measure(lambda: old_flow(source, output), args.runs)
+    new = measure(lambda: new_flow(predictor, source, output), args.runs)
+    report = {
+        "runs": args.runs,
+        "old": {k: v for k, v in old.items() if k != "image"},
+        "new": {k: v for k, v in new.items() if k != "image"},
+        "speedup": old["latency_ms"] / new["latency_ms"],
+        "new_vs_old": image_metrics(new["image"], old["image"]),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
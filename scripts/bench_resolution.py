@@ -0,0 +1,119 @@
+"""Latency and memory of each generation resolution, plus the quality of the cheap upscale.
+
+Every resolution runs in its own process (so peak RSS and peak CUDA memory are
+per resolution): ``--runs`` requests through Predictor._run_inference after one
+warm-up, recording mean / best latency, peak RSS, peak CUDA allocated and
+reserved memory, and the latency of the bicubic upscale to ``--output-size``.
+The upscaled outputs are then compared with the native ``--output-size``
+output (MAE / PSNR / SSIM), so the report shows what each size saves and what
+it costs in detail.
+
+    python scripts/bench_resolution.py --source face.jpg --reference look.jpg --resolutions 256 384 512 768
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from bench_common import REPO_ROOT, image_metrics, load_runtime, peak_rss_mb
+from image_io import DEFAULT_SIZE, GENERATION_SIZES, upscale
+
+
+def run_one(args) -> None:
+    import torch
+
+    predictor, _namespace = load_runtime()
+    cuda = torch.cuda.is_available()
+
+    def request():
+        start = time.perf_counter()
+        image = predictor._run_inference(args.source, args.reference, args.intensity, resolution=args.resolution)
+        if cuda:
+            torch.cuda.synchronize()
+        return image, time.perf_counter() - start
+
+    request()  # warm-up: model load and first-call costs
+    if cuda:
+        torch.cuda.reset_peak_memory_stats()
+    latencies = []
+    for _ in range(args.runs):
+        image, seconds = request()
+        latencies.append(seconds)
+    start = time.perf_counter()
+    upscaled = upscale(image, args.output_size)
+    upscale_s = time.perf_counter() - start
+    upscaled.save(os.path.join(args.out_dir, f"{args.resolution}.png"))
+    result = {
+        "resolution": args.resolution,
+        "runs": args.runs,
+        "mean_latency_s": sum(latencies) / len(latencies),
+        "best_latency_s": min(latencies),
+        "upscale_ms": upscale_s * 1000.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if cuda:
+        result["peak_cuda_allocated_mb"] = torch.cuda.max_memory_allocated() / 1024.0 ** 2
+        result["peak_cuda_reserved_mb"] = torch.cuda.max_memory_reserved() / 1024.0 ** 2
+    print("RESULT " + json.dumps(result))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", required=True)
+    parser.add_argument("--reference", required=True)
+    parser.add_argument("--resolutions", nargs="+", type=int, default=list(GENERATION_SIZES))
+    parser.add_argument("--output-size", type=int, default=DEFAULT_SIZE, help="Upscale target and quality baseline")
+    parser.add_argument("--intensity", type=float, default=1.0)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", default="resolution_bench.json")
+    parser.add_argument("--resolution", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--out-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.source = os.path.abspath(args.source)
+    args.reference = os.path.abspath(args.reference)
+
+    if args.resolution:
+        run_one(args)
+        return
+
+    out_dir = tempfile.mkdtemp(prefix="resolution_bench_")
+    # The native run at the output size is the quality baseline for the upscaled ones
+    resolutions = sorted(set(args.resolutions) | ({args.output_size} & set(GENERATION_SIZES)))
+    results = []
+    for resolution in resolutions:
+        cmd = [sys.executable, os.path.abspath(__file__), "--resolution", str(resolution), "--out-dir", out_dir,
+               "--source", args.source, "--reference", args.reference, "--runs", str(args.runs),
+               "--intensity", str(args.intensity), "--output-size", str(args.output_size)]
+        print(f"⏱️ Benchmarking {resolution}x{resolution}...")
+        proc = subprocess.run(cmd, cwd=REPO_ROOT, capture_output=True, text=True)
+        lines = [l for l in proc.stdout.splitlines() if l.startswith("RESULT ")]
+        if proc.returncode != 0 or not lines:
+            print(proc.stdout[-2000:], proc.stderr[-2000:])
+            results.append({"resolution": resolution, "error": f"exited with {proc.returncode}"})
+            continue
+        results.append(json.loads(lines[-1][len("RESULT "):]))
+
+    native = os.path.join(out_dir, f"{args.output_size}.png")
+    native_latency = next((r.get("mean_latency_s") for r in results if r["resolution"] == args.output_size), None)
+    for result in results:
+        if "error" in result:
+            continue
+        if native_latency:
+            result["speedup_vs_native"] = native_latency / result["mean_latency_s"]
+        if os.path.exists(native):
+            upscaled = Image.open(os.path.join(out_dir, f"{result['resolution']}.png"))
+            result["vs_native"] = image_metrics(upscaled, Image.open(native))
+
+    report = {"output_size": args.output_size, "images": out_dir, "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Throughput and memory of the shared-weight CPU worker pool as the worker count grows.
+
+For every worker count a fresh pool is started (weights loaded once, then
+forked), ``--requests`` predictions are submitted and the wall-clock
+throughput plus the summed RSS and PSS of parent + workers are recorded. PSS
+splits shared pages between processes, so it shows the real memory cost.
+
+    python scripts/bench_worker_pool.py --source face.jpg --reference look.jpg --workers 1 2 4 8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from bench_common import REPO_ROOT
+
+
+def run_one(args) -> None:
+    from worker_pool import WorkerPool
+
+    pool = WorkerPool(workers=args.worker, threads_per_worker=args.threads)
+    t0 = time.perf_counter()
+    pool.start()
+    startup_s = time.perf_counter() - t0
+    # One warm-up request per worker so first-call costs don't skew throughput
+    for f in [pool.submit(args.source, args.reference) for _ in range(args.worker)]:
+        f.result()
+    t0 = time.perf_counter()
+    futures = [pool.submit(args.source, args.reference, makeup_intensity=args.intensity) for _ in range(args.requests)]
+    errors = 0
+    for f in futures:
+        try:
+            f.result()
+        except Exception:
+            errors += 1
+    elapsed = time.perf_counter() - t0
+    memory = pool.memory()
+    pool.close()
+    print("RESULT " + json.dumps({
+        "workers": args.worker,
+        "threads_per_worker": pool.threads_per_worker,
+        "startup_s": startup_s,
+        "requests": args.requests,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        # Failed requests don't count as throughput
+        "throughput_rps": (args.requests - errors) / elapsed,
+        "shared_weights_gb": pool.shared_bytes / 1024 ** 3,
+        "total_rss_mb": memory["rss_mb"],
+        "total_pss_mb": memory["pss_mb"],
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", required=True)
+    parser.add_argument("--reference", required=True)
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=None, help="Threads per worker (default: cores / workers)")
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--intensity", type=float, default=1.0)
+    parser.add_argument("--output", default="worker_pool_bench.json")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.source = os.path.abspath(args.source)
+    args.reference = os.path.abspath(args.reference)
+
+    if args.worker:
+        os.environ.setdefault("MAKEUP_DEVICE", "cpu")
+        run_one(args)
+        return
+
+    results = []
+    for n in args.workers:
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", str(n), "--source", args.source,
+               "--reference", args.reference, "--requests", str(args.requests), "--intensity", str(args.intensity)]
+        if args.threads:
+            cmd += ["--threads", str(args.threads)]
+        print(f"⏱️ Benchmarking {n} worker(s)...")
+        proc = subprocess.run(cmd, cwd=REPO_ROOT, capture_output=True, text=True)
+        lines = [l for l in proc.stdout.splitlines() if l.startswith("RESULT ")]
+        if proc.returncode != 0 or not lines:
+            print(proc.stdout[-2000:], proc.stderr[-2000:])
+            results.append({"workers": n, "error": f"exited with {proc.returncode}"})
+            continue
+        results.append(json.loads(lines[-1][len("RESULT "):]))
+
+    with open(args.output, "w") as f:
+        json.dump({"results": results}, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""CPU smoke check of the denoising controls in sampling.py (no weights, no GPU).
+
+Drives Predictor._run_inference with the tiny stub diffusion pipeline from
+stubs.py and checks that:
+
+- the default request runs the full schedule,
+- ``strength`` < 1 starts from the VAE-encoded source and runs only that fraction of the steps,
+- ``adaptive_steps`` stops after the step floor once x0 has converged,
+- ``cfg_fast_path`` evaluates only the conditional branch at guidance <= 1 (half the
+  UNet evaluations, same image as full CFG at guidance 1) and nothing changes above 1,
+- ``cfg_truncation`` drops the unconditional branch for that final fraction of steps.
+
+    python scripts/check_sampling.py
+"""
+import argparse
+import os
+import tempfile
+
+from PIL import Image
+
+from bench_common import image_metrics
+from stubs import StubDenoisingNamespace, stub_predictor
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-steps", type=int, default=5)
+    args = parser.parse_args()
+    steps = 30  # predict() uses the upstream default schedule
+
+    os.environ["MAKEUP_PRESERVE_EYES"] = "0"
+    os.environ["MAKEUP_EARLY_EXIT_MIN_STEPS"] = str(args.min_steps)
+    workdir = tempfile.mkdtemp(prefix="check_sampling_")
+    source = os.path.join(workdir, "source.png")
+    reference = os.path.join(workdir, "reference.png")
+    Image.new("RGB", (512, 512), (180, 140, 120)).save(source)
+    Image.new("RGB", (512, 512), (150, 40, 60)).save(reference)
+
+    predictor = stub_predictor()
+    namespace = StubDenoisingNamespace()
+    predictor._load_model_namespace = lambda: namespace
+    encoder = namespace.makeup_encoder
+    failures = []
+
+    def check(name, condition, detail):
+        print(f"{'✅' if condition else '❌'} {name}: {detail}")
+        if not condition:
+            failures.append(name)
+
+    outputs = []
+
+    def run(**options):
+        image = predictor._run_inference(source, reference, **options)
+        check("output size", image.size == (512, 512), f"{image.size}")
+        outputs.append(image)
+        return predictor.last_run_stats
+
+    before = encoder.steps
+    run()
+    check("full schedule", encoder.steps - before == steps, f"{encoder.steps - before} steps")
+
+    for strength in (0.5, 0.3):
+        stats = run(strength=strength)
+        expected = max(1, int(round(steps * strength)))
+        check(f"strength={strength}", stats["steps_run"] == expected == stats["steps_scheduled"],
+              f"{stats['steps_run']}/{stats['steps_scheduled']} steps (expected {expected})")
+
+    stats = run(adaptive_steps=True)
+    check("adaptive_steps", stats["stopped_early"] and args.min_steps <= stats["steps_run"] < steps,
+          f"{stats['steps_run']}/{stats['steps_scheduled']} steps, last delta {stats['last_delta']}")
+
+    # guidance = 1.6 * intensity: 0.5 -> 0.8 (fast path applies), 0.625 -> 1.0, 1.0 -> 1.6 (it doesn't)
+    stats = run(makeup_intensity=0.5, cfg_fast_path=True)
+    fast = outputs[-1]
+    check("cfg_fast_path at guidance 0.8", stats["unet_evals"] == steps and stats["cfg_skipped_steps"] == steps,
+          f"{stats['unet_evals']} UNet evaluations, {stats['cfg_skipped_steps']} steps without CFG")
+    run(makeup_intensity=0.625)
+    difference = image_metrics(fast, outputs[-1])
+    check("fast path == full CFG at guidance 1", difference["max_abs"] <= 1.0, f"max abs diff {difference['max_abs']}")
+    stats = run(makeup_intensity=1.0, cfg_fast_path=True)
+    check("cfg_fast_path at guidance 1.6", stats["unet_evals"] == 2 * steps and stats["cfg_skipped_steps"] == 0,
+          f"{stats['unet_evals']} UNet evaluations")
+    stats = run(makeup_intensity=1.0, cfg_truncation=0.2)
+    expected = int(round(steps * 0.2))
+    check("cfg_truncation=0.2", stats["cfg_skipped_steps"] == expected and stats["unet_evals"] == 2 * steps - expected,
+          f"{stats['cfg_skipped_steps']} steps without CFG, {stats['unet_evals']} UNet evaluations")
+
+    if failures:
+        raise SystemExit(f"{len(failures)} check(s) failed: {', '.join(failures)}")
+
+
+if __name__ == "__main__":
+    main()
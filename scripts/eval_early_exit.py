@@ -0,0 +1,95 @@
+"""Quality / latency evaluation of adaptive early-exit denoising.
+
+Runs every source/reference pair of a fixed image set once with the full
+schedule and once per threshold with early exit enabled (same seed), and
+reports steps used, latency and image-difference metrics (MAE / PSNR / SSIM)
+against the full-schedule output, per pair and averaged per threshold.
+
+    python scripts/eval_early_exit.py --sources eval/faces --references eval/looks \
+        --thresholds 0.02 0.01 0.005 --min-steps 10 --output early_exit_report.json
+"""
+import argparse
+import json
+import os
+import tempfile
+
+from bench_common import generate_pair, image_metrics, load_runtime, timed
+from load_test import list_images
+from sampling import DenoiseController
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sources", required=True, help="Directory of source faces")
+    parser.add_argument("--references", required=True, help="Directory of reference looks (paired round-robin)")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.02, 0.01, 0.005])
+    parser.add_argument("--min-steps", type=int, default=10)
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--intensity", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="early_exit_report.json")
+    args = parser.parse_args()
+
+    sources = list_images(os.path.abspath(args.sources))
+    references = list_images(os.path.abspath(args.references))
+    if not sources or not references:
+        raise SystemExit("Need at least one source and one reference image")
+    pairs = [(s, references[i % len(references)]) for i, s in enumerate(sources)]
+
+    _predictor, ns = load_runtime()
+    out_dir = tempfile.mkdtemp(prefix="early_exit_")
+
+    def run(source, reference, controller):
+        return timed(generate_pair, ns, source, reference, args.intensity, args.seed,
+                     controller=controller, num_inference_steps=args.steps)
+
+    # Warm-up call so the first pair doesn't carry lazy-init cost
+    run(*pairs[0], None)
+
+    rows = []
+    for index, (source, reference) in enumerate(pairs):
+        full = DenoiseController()
+        baseline, base_s = run(source, reference, full)
+        baseline.save(os.path.join(out_dir, f"{index}_full.png"))
+        row = {"source": source, "reference": reference, "full": {"latency_s": base_s, **full.stats()}}
+        for threshold in args.thresholds:
+            controller = DenoiseController(threshold, args.min_steps)
+            image, seconds = run(source, reference, controller)
+            image.save(os.path.join(out_dir, f"{index}_t{threshold:g}.png"))
+            row[f"{threshold:g}"] = {
+                "latency_s": seconds,
+                **controller.stats(),
+                "vs_full": image_metrics(image, baseline),
+            }
+        rows.append(row)
+        print(f"⏱️ {os.path.basename(source)}: " + ", ".join(
+            f"{t:g}→{row[f'{t:g}']['steps_run']} steps" for t in args.thresholds))
+
+    def mean(values):
+        values = [v for v in values if v is not None]
+        return sum(values) / len(values) if values else None
+
+    summary = {"full": {
+        "mean_latency_s": mean(r["full"]["latency_s"] for r in rows),
+        "mean_steps": mean(r["full"]["steps_run"] for r in rows),
+    }}
+    for threshold in args.thresholds:
+        entries = [r[f"{threshold:g}"] for r in rows]
+        summary[f"{threshold:g}"] = {
+            "mean_latency_s": mean(e["latency_s"] for e in entries),
+            "mean_steps": mean(e["steps_run"] for e in entries),
+            "stopped_early_rate": mean(float(e["stopped_early"]) for e in entries),
+            "mean_psnr": mean(e["vs_full"]["psnr"] for e in entries),
+            "mean_ssim": mean(e["vs_full"].get("ssim") for e in entries),
+            "speedup": summary["full"]["mean_latency_s"] / mean(e["latency_s"] for e in entries),
+        }
+
+    report = {"steps": args.steps, "min_steps": args.min_steps, "seed": args.seed, "images": out_dir,
+              "summary": summary, "pairs": rows}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+"""Golden-image regression suite over every performance mode.
+
+A fixed set of cases (source/reference pair x intensity, fixed seed) is
+rendered once with the pre-optimization behaviour (``BASELINE_ENV``: the
+upstream ``get_draw`` pose map) and stored as the golden baseline:
+
+    python scripts/golden.py record --sources eval/faces --references eval/looks
+
+``record`` copies the inputs into ``<golden>/inputs`` and writes
+``<golden>/baselines/<case>.png`` plus ``manifest.json`` (cases, seed, latency,
+torch/device info). ``check`` then renders the same cases in every mode of
+``MODES`` and compares each output with its baseline:
+
+    python scripts/golden.py check                      # all modes
+    python scripts/golden.py check --modes early_exit cfg_truncation
+
+Each mode runs in its own process (load-time settings such as quantization or
+torch.compile need a fresh model load), with the same global seed before every
+case. Every mode starts from ``BASELINE_ENV`` and changes only its own settings,
+so each is measured against the original renderer. Metrics per case are pixel
+MAE / max abs / PSNR, SSIM (scikit-image) and, when the ``lpips`` package is
+installed, LPIPS (AlexNet). Every mode has tolerances (``max_mae``,
+``min_ssim``, ``max_lpips``, ...; override with ``--tolerances file.json``); a
+case outside them fails the mode. Latency is recorded next to the scores, with
+the speedup over the ``reference`` mode, so a speed gain can't hide broken
+makeup transfer. The report goes to ``--output`` and the exit status is 1 if
+any mode failed.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from bench_common import REPO_ROOT, image_metrics
+from load_test import list_images
+
+DEFAULT_GOLDEN_DIR = os.path.join(REPO_ROOT, "golden")
+DEFAULT_INTENSITIES = [0.5, 1.0, 1.6]
+
+# What the baselines are recorded with: the behaviour before the performance work
+BASELINE_ENV = {"MAKEUP_POSE_MAP": "upstream"}
+
+# name -> environment (applied over BASELINE_ENV before the models load), per-request options,
+# tolerances vs the baseline.
+# Tolerances are starting points: tighten them once a mode's spread on the golden set is known.
+MODES: Dict[str, Dict] = {
+    "reference": {
+        "env": {},
+        "options": {},
+        "tolerance": {"max_mae": 1.0, "min_ssim": 0.995, "max_lpips": 0.005},
+    },
+    "compile": {
+        "env": {"MAKEUP_WARMUP": "1", "MAKEUP_COMPILE": "1"},
+        "options": {},
+        "tolerance": {"max_mae": 2.0, "min_ssim": 0.99, "max_lpips": 0.01},
+    },
+    "quantize_weight_only": {
+        "env": {"MAKEUP_QUANTIZE": "weight_only"},
+        "options": {},
+        "tolerance": {"max_mae": 4.0, "min_ssim": 0.95, "max_lpips": 0.05},
+    },
+    "quantize_dynamic": {
+        "env": {"MAKEUP_QUANTIZE": "dynamic", "MAKEUP_DEVICE": "cpu"},
+        "options": {},
+        "tolerance": {"max_mae": 6.0, "min_ssim": 0.92, "max_lpips": 0.08},
+    },
+    "early_exit": {
+        "env": {},
+        "options": {"adaptive_steps": True},
+        "tolerance": {"max_mae": 4.0, "min_ssim": 0.95, "max_lpips": 0.05},
+    },
+    "strength": {
+        # Partial denoising: start latents from the noised source plus a trimmed schedule
+        "env": {},
+        "options": {"strength": 0.6},
+        "tolerance": {"max_mae": 12.0, "min_ssim": 0.80, "max_lpips": 0.20},
+    },
+    "cfg_fast_path": {
+        "env": {},
+        "options": {"cfg_fast_path": True},
+        "tolerance": {"max_mae": 8.0, "min_ssim": 0.90, "max_lpips": 0.10},
+    },
+    "cfg_truncation": {
+        "env": {},
+        "options": {"cfg_truncation": 0.2},
+        "tolerance": {"max_mae": 5.0, "min_ssim": 0.93, "max_lpips": 0.06},
+    },
+    "pose_map_landmarks": {
+        "env": {"MAKEUP_POSE_MAP": "landmarks"},
+        "options": {},
+        "tolerance": {"max_mae": 6.0, "min_ssim": 0.90, "max_lpips": 0.08},
+    },
+    "landmarks_mediapipe": {
+        "env": {},
+        "options": {"landmark_backend": "mediapipe"},
+        "tolerance": {"max_mae": 6.0, "min_ssim": 0.90, "max_lpips": 0.08},
+    },
+    "resolution_384_upscaled": {
+        "env": {},
+        "options": {"resolution": 384, "output_size": 512},
+        "tolerance": {"max_mae": 10.0, "min_ssim": 0.80, "max_lpips": 0.15},
+    },
+}
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def seed_everything(seed: int) -> None:
+    import torch
+
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+class Perceptual:
+    """LPIPS distance when the optional ``lpips`` package is installed, else unavailable."""
+
+    def __init__(self):
+        try:
+            import lpips
+            import torch
+
+            self._torch = torch
+            self._model = lpips.LPIPS(net="alex", verbose=False).eval()
+        except Exception:
+            self._model = None
+
+    @property
+    def available(self) -> bool:
+        return self._model is not None
+
+    def __call__(self, candidate: Image.Image, baseline: Image.Image) -> Optional[float]:
+        if self._model is None:
+            return None
+        torch = self._torch
+
+        def tensor(image):
+            array = np.asarray(image.convert("RGB").resize(baseline.size), dtype=np.float32) / 127.5 - 1.0
+            return torch.from_numpy(array).permute(2, 0, 1).unsqueeze(0)
+
+        with torch.no_grad():
+            return float(self._model(tensor(candidate), tensor(baseline)).item())
+
+
+def within(metrics: Dict, tolerance: Dict) -> List[str]:
+    """Violated tolerances (``max_<metric>`` / ``min_<metric>``); metrics that weren't measured are skipped."""
+    violations = []
+    for key, limit in tolerance.items():
+        bound, metric = key.split("_", 1)
+        value = metrics.get(metric)
+        if value is None:
+            continue
+        if (bound == "max" and value > limit) or (bound == "min" and value < limit):
+            violations.append(f"{metric}={value:.4g} ({bound} {limit})")
+    return violations
+
+
+# -- child: render every case in one mode ------------------------------------
+def render_mode(args) -> None:
+    mode = MODES[args.mode]
+    os.environ.update(BASELINE_ENV)
+    os.environ.update(mode["env"])
+    with open(os.path.join(args.golden_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+
+    import torch
+    from predict import Predictor
+
+    predictor = Predictor()
+    predictor.setup()  # loads, warms up and compiles under MAKEUP_WARMUP / MAKEUP_COMPILE
+    inputs = os.path.join(args.golden_dir, "inputs")
+
+    def render(case):
+        seed_everything(manifest["seed"])
+        start = time.perf_counter()
+        image = predictor._run_inference(
+            os.path.join(inputs, case["source"]), os.path.join(inputs, case["reference"]), case["intensity"],
+            **mode["options"],
+        )
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        return image, time.perf_counter() - start
+
+    render(manifest["cases"][0])  # warm-up, not timed
+    latencies = {}
+    for case in manifest["cases"]:
+        image, seconds = render(case)
+        image.save(os.path.join(args.render_dir, f"{case['id']}.png"))
+        latencies[case["id"]] = seconds
+    print("RESULT " + json.dumps({
+        "mode": args.mode,
+        "latency_s": latencies,
+        "device": predictor._target_device(),
+        "torch": torch.__version__,
+    }))
+
+
+def run_mode(name: str, golden_dir: str, render_dir: str) -> Dict:
+    os.makedirs(render_dir, exist_ok=True)
+    cmd = [sys.executable, os.path.abspath(__file__), "--golden-dir", golden_dir, "_render", "--mode", name,
+           "--render-dir", render_dir]
+    print(f"⏱️ Rendering mode {name}...")
+    proc = subprocess.run(cmd, cwd=REPO_ROOT, capture_output=True, text=True)
+    lines = [l for l in proc.stdout.splitlines() if l.startswith("RESULT ")]
+    if proc.returncode != 0 or not lines:
+        print(proc.stdout[-2000:], proc.stderr[-2000:])
+        return {"mode": name, "error": f"exited with {proc.returncode}"}
+    return json.loads(lines[-1][len("RESULT "):])
+
+
+# -- commands -----------------------------------------------------------------
+def record(args) -> None:
+    sources = list_images(os.path.abspath(args.sources))
+    references = list_images(os.path.abspath(args.references))
+    if not sources or not references:
+        raise SystemExit("Need at least one source and one reference image")
+    golden_dir = os.path.abspath(args.golden_dir)
+    inputs = os.path.join(golden_dir, "inputs")
+    os.makedirs(inputs, exist_ok=True)
+
+    cases = []
+    for index, source in enumerate(sources):
+        reference = references[index % len(references)]
+        for path in (source, reference):
+            shutil.copy2(path, os.path.join(inputs, os.path.basename(path)))
+        for intensity in args.intensities:
+            stem = os.path.splitext(os.path.basename(source))[0]
+            cases.append({
+                "id": f"{index:02d}_{stem}_i{intensity:g}",
+                "source": os.path.basename(source),
+                "reference": os.path.basename(reference),
+                "intensity": intensity,
+            })
+    manifest = {
+        "seed": args.seed,
+        "cases": cases,
+        "inputs": {name: file_sha256(os.path.join(inputs, name)) for name in sorted(os.listdir(inputs))},
+    }
+    with open(os.path.join(golden_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    baselines = os.path.join(golden_dir, "baselines")
+    result = run_mode("reference", golden_dir, baselines)
+    if "error" in result:
+        raise SystemExit(f"Recording failed: {result['error']}")
+    manifest.update(latency_s=result["latency_s"], device=result["device"], torch=result["torch"],
+                    recorded_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+    with open(os.path.join(golden_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"✅ Recorded {len(cases)} golden cases in {golden_dir}")
+
+
+def check(args) -> None:
+    golden_dir = os.path.abspath(args.golden_dir)
+    with open(os.path.join(golden_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    inputs = os.path.join(golden_dir, "inputs")
+    changed = [n for n, digest in manifest["inputs"].items() if file_sha256(os.path.join(inputs, n)) != digest]
+    if changed:
+        raise SystemExit(f"Golden inputs changed since recording: {changed}; re-record the baselines")
+    tolerances = {name: dict(mode["tolerance"]) for name, mode in MODES.items()}
+    if args.tolerances:
+        with open(args.tolerances) as f:
+            for name, overrides in json.load(f).items():
+                tolerances.setdefault(name, {}).update(overrides)
+
+    perceptual = Perceptual()
+    if not perceptual.available:
+        print("⚠️ lpips not installed; perceptual tolerances fall back to SSIM only")
+    render_root = tempfile.mkdtemp(prefix="golden_")
+    modes = args.modes or list(MODES)
+    results = {name: run_mode(name, golden_dir, os.path.join(render_root, name)) for name in modes}
+    reference_latency = results.get("reference", {}).get("latency_s") or manifest.get("latency_s") or {}
+
+    report = {"golden_dir": golden_dir, "renders": render_root, "lpips": perceptual.available, "modes": {}}
+    failed = []
+    for name, result in results.items():
+        if "error" in result:
+            report["modes"][name] = {"status": "error", **result}
+            failed.append(name)
+            continue
+        cases = []
+        for case in manifest["cases"]:
+            baseline = Image.open(os.path.join(golden_dir, "baselines", f"{case['id']}.png")).convert("RGB")
+            output = Image.open(os.path.join(render_root, name, f"{case['id']}.png")).convert("RGB")
+            metrics = image_metrics(output, baseline)
+            metrics["lpips"] = perceptual(output, baseline)
+            latency = result["latency_s"][case["id"]]
+            violations = within(metrics, tolerances.get(name, {}))
+            cases.append({
+                "id": case["id"],
+                "latency_s": latency,
+                "speedup": reference_latency[case["id"]] / latency if case["id"] in reference_latency else None,
+                **metrics,
+                "violations": violations,
+            })
+        status = "fail" if any(c["violations"] for c in cases) else "pass"
+        if status == "fail":
+            failed.append(name)
+
+        def mean(key):
+            values = [c[key] for c in cases if c.get(key) is not None]
+            return sum(values) / len(values) if values else None
+
+        report["modes"][name] = {
+            "status": status,
+            "tolerance": tolerances.get(name, {}),
+            "mean_latency_s": mean("latency_s"),
+            "mean_speedup": mean("speedup"),
+            "mean_mae": mean("mae"),
+            "min_ssim": min((c["ssim"] for c in cases if "ssim" in c), default=None),
+            "max_lpips": max((c["lpips"] for c in cases if c["lpips"] is not None), default=None),
+            "cases": cases,
+        }
+        summary = report["modes"][name]
+        print(f"{'✅' if status == 'pass' else '❌'} {name}: {summary['mean_latency_s']:.2f} s/case"
+              + (f" ({summary['mean_speedup']:.2f}x)" if summary["mean_speedup"] else "")
+              + f", MAE {summary['mean_mae']:.2f}"
+              + (f", min SSIM {summary['min_ssim']:.4f}" if summary["min_ssim"] is not None else "")
+              + (f", max LPIPS {summary['max_lpips']:.4f}" if summary["max_lpips"] is not None else ""))
+
+    report["failed"] = failed
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    if failed:
+        raise SystemExit(f"Golden regression failed for: {', '.join(failed)} (see {args.output})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--golden-dir", default=DEFAULT_GOLDEN_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    rec = commands.add_parser("record", help="Render and store the baselines")
+    rec.add_argument("--sources", required=True, help="Directory of source faces")
+    rec.add_argument("--references", required=True, help="Directory of reference looks (paired round-robin)")
+    rec.add_argument("--intensities", type=float, nargs="+", default=DEFAULT_INTENSITIES)
+    rec.add_argument("--seed", type=int, default=0)
+    chk = commands.add_parser("check", help="Render every mode and compare with the baselines")
+    chk.add_argument("--modes", nargs="+", choices=list(MODES))
+    chk.add_argument("--tolerances", help="JSON file of per-mode tolerance overrides")
+    chk.add_argument("--output", default="golden_report.json")
+    child = commands.add_parser("_render")
+    child.add_argument("--mode", required=True, choices=list(MODES))
+    child.add_argument("--render-dir", required=True)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args)
+    elif args.command == "check":
+        check(args)
+    else:
+        render_mode(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""Concurrent load test for the Cog predictor.
+
+Replays a request mix (repeated and unique source/reference pairs, mixed
+intensities) with N concurrent clients against either
+
+- a running predictor server (``cog serve`` / ``cog run``; POST /predictions), or
+- an in-process Predictor with stubbed models (``--in-process``), which runs the
+  real predict() code and additionally checks that every response file carries
+  the stub signature of its own request (catching shared output paths).
+
+Writes throughput (successful requests only), error rate, failed requests per
+second and latency percentiles as JSON.
+
+    python scripts/load_test.py --url http://localhost:5000 --concurrency 4 --requests 200
+    python scripts/load_test.py --in-process --stub-latency 0.2 --concurrency 8 --requests 400
+"""
+import argparse
+import base64
+import glob
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+INTENSITIES = [0.3, 0.6, 1.0, 1.4, 2.0]
+
+
+def synthetic_photo(path: str, seed: int, size=(1024, 768)) -> str:
+    rng = np.random.default_rng(seed)
+    base = rng.integers(40, 220, size=3)
+    pixels = np.clip(base + rng.normal(0, 20, size=(size[1], size[0], 3)), 0, 255).astype(np.uint8)
+    Image.fromarray(pixels).save(path, quality=90)
+    return path
+
+
+def list_images(directory: Optional[str]) -> List[str]:
+    if not directory:
+        return []
+    files = []
+    for ext in ("*.jpg", "*.jpeg", "*.png", "*.webp"):
+        files.extend(glob.glob(os.path.join(directory, ext)))
+    return sorted(files)
+
+
+class RequestMix:
+    """Yields request dicts; ``repeat_ratio`` of them reuse a small pool of pairs."""
+
+    def __init__(self, sources: List[str], references: List[str], repeat_ratio: float, workdir: str, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.workdir = workdir
+        self.sources = sources or [synthetic_photo(os.path.join(workdir, f"src_{i}.jpg"), i) for i in range(4)]
+        self.references = references or [synthetic_photo(os.path.join(workdir, f"ref_{i}.jpg"), 100 + i) for i in range(4)]
+        self.repeat_ratio = repeat_ratio
+        self._unique = 0
+        self._lock = threading.Lock()
+
+    def _unique_copy(self, path: str) -> str:
+        # A fresh file with different bytes so per-input caches can't serve it
+        with self._lock:
+            self._unique += 1
+            n = self._unique
+        image = Image.open(path).convert("RGB")
+        pixels = np.asarray(image).copy()
+        pixels[0, 0] = (n % 256, (n // 256) % 256, 7)
+        out = os.path.join(self.workdir, f"unique_{n}_{os.path.basename(path)}")
+        Image.fromarray(pixels).save(out, quality=90)
+        return out
+
+    def next(self) -> Dict:
+        repeated = self.rng.random() < self.repeat_ratio
+        source = self.rng.choice(self.sources)
+        reference = self.rng.choice(self.references)
+        if not repeated:
+            source, reference = self._unique_copy(source), self._unique_copy(reference)
+        return {
+            "kind": "repeated" if repeated else "unique",
+            "source_image": source,
+            "reference_image": reference,
+            "makeup_intensity": self.rng.choice(INTENSITIES),
+        }
+
+
+def data_uri(path: str) -> str:
+    with open(path, "rb") as f:
+        return "data:image/jpeg;base64," + base64.b64encode(f.read()).decode("ascii")
+
+
+class HttpTarget:
+    def __init__(self, url: str, timeout: float):
+        import requests
+
+        self.session = requests.Session()
+        self.url = url.rstrip("/") + "/predictions"
+        self.timeout = timeout
+
+    def __call__(self, request: Dict) -> None:
+        payload = {"input": {
+            "source_image": data_uri(request["source_image"]),
+            "reference_image": data_uri(request["reference_image"]),
+            "makeup_intensity": request["makeup_intensity"],
+        }}
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        body = response.json()
+        if body.get("status") not in (None, "succeeded"):
+            raise RuntimeError(f"prediction {body.get('status')}: {body.get('error')}")
+
+
+class InProcessTarget:
+    def __init__(self, stub_latency: float):
+        from stubs import predict_kwargs, read_signature, signature_for, stub_predictor
+
+        self.predictor = stub_predictor(stub_latency)
+        self._predict_kwargs = predict_kwargs
+        self._read_signature = read_signature
+        self._signature_for = signature_for
+
+    def __call__(self, request: Dict) -> None:
+        from cog import Path
+        from image_io import decode_image
+
+        kwargs = self._predict_kwargs(
+            self.predictor,
+            source_image=Path(request["source_image"]),
+            reference_image=Path(request["reference_image"]),
+            makeup_intensity=request["makeup_intensity"],
+        )
+        output = self.predictor.predict(**kwargs)
+        if os.path.basename(str(output)) == "error.jpg":
+            raise RuntimeError("predict() returned the fallback error image")
+        expected = self._signature_for(decode_image(request["reference_image"]), 1.6 * request["makeup_intensity"])
+        got = self._read_signature(Image.open(str(output)))
+        if abs(got[0] - expected[0]) > 6 or abs(got[1] - expected[1]) > 6:
+            raise AssertionError(f"output mismatch: file {output} belongs to another request")
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ms = np.array(values) * 1000.0
+    return {
+        "mean": float(ms.mean()),
+        "p50": float(np.percentile(ms, 50)),
+        "p95": float(np.percentile(ms, 95)),
+        "p99": float(np.percentile(ms, 99)),
+        "max": float(ms.max()),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Base URL of a running predictor server")
+    target.add_argument("--in-process", action="store_true", help="Drive Predictor in-process with stub models")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--repeat-ratio", type=float, default=0.5, help="Fraction of requests reusing a pair")
+    parser.add_argument("--sources", help="Directory of source faces (default: synthetic)")
+    parser.add_argument("--references", help="Directory of reference looks (default: synthetic)")
+    parser.add_argument("--stub-latency", type=float, default=0.05, help="Seconds per stub generation")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="load_test.json")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    mix = RequestMix(list_images(args.sources), list_images(args.references), args.repeat_ratio, workdir, args.seed)
+    requests_ = [mix.next() for _ in range(args.requests)]
+    call = HttpTarget(args.url, args.timeout) if args.url else InProcessTarget(args.stub_latency)
+
+    records = []
+    lock = threading.Lock()
+
+    def run(request: Dict) -> None:
+        start = time.perf_counter()
+        error = None
+        try:
+            call(request)
+        except Exception as e:
+            error = type(e).__name__ if not isinstance(e, AssertionError) else "OutputMismatch"
+        with lock:
+            records.append({"kind": request["kind"], "latency": time.perf_counter() - start, "error": error})
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(run, requests_))
+    duration = time.perf_counter() - started
+
+    def summarize(rows: List[Dict]) -> Dict:
+        ok = [r["latency"] for r in rows if r["error"] is None]
+        errors: Dict[str, int] = {}
+        for r in rows:
+            if r["error"]:
+                errors[r["error"]] = errors.get(r["error"], 0) + 1
+        return {
+            "requests": len(rows),
+            "error_rate": (len(rows) - len(ok)) / len(rows) if rows else 0.0,
+            "errors": errors,
+            "latency_ms": percentiles(ok),
+        }
+
+    report = {
+        "target": args.url or "in-process-stub",
+        "concurrency": args.concurrency,
+        "repeat_ratio": args.repeat_ratio,
+        "duration_s": duration,
+        # Only successful requests count as throughput; failures are reported on their own
+        "throughput_rps": sum(r["error"] is None for r in records) / duration,
+        "error_rps": sum(r["error"] is not None for r in records) / duration,
+        **summarize(records),
+        "by_kind": {kind: summarize([r for r in records if r["kind"] == kind]) for kind in ("repeated", "unique")},
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Calibrate / validate int8 CPU quantization against the fp32 baseline.
+
+Each mode runs in its own process (quantization is applied in place), on CPU,
+with a fixed seed. Reports per-mode latency, RSS after load, peak RSS and
+image-difference metrics (MAE / PSNR / SSIM) against the fp32 output.
+
+    python scripts/quantize_calibrate.py --source face.jpg --reference look.jpg \
+        --modes none dynamic weight_only --runs 3 --output quant_report.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from bench_common import REPO_ROOT, generate_pair, image_metrics, load_runtime, peak_rss_mb, rss_mb, timed
+
+
+def run_worker(args) -> None:
+    _predictor, ns = load_runtime({"MAKEUP_DEVICE": "cpu", "MAKEUP_QUANTIZE": args.worker})
+    load_rss = rss_mb()
+    # First call pays for lazy init; keep it out of the steady-state numbers
+    _, first_s = timed(generate_pair, ns, args.source, args.reference, args.intensity, args.seed,
+                       num_inference_steps=args.steps)
+    latencies = []
+    image = None
+    for _ in range(args.runs):
+        image, seconds = timed(generate_pair, ns, args.source, args.reference, args.intensity, args.seed,
+                               num_inference_steps=args.steps)
+        latencies.append(seconds)
+    image.save(args.image_out)
+    print("RESULT " + json.dumps({
+        "mode": args.worker,
+        "first_call_s": first_s,
+        "latency_s": latencies,
+        "mean_latency_s": sum(latencies) / len(latencies),
+        "rss_after_load_mb": load_rss,
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", required=True)
+    parser.add_argument("--reference", required=True)
+    parser.add_argument("--modes", nargs="+", default=["none", "dynamic", "weight_only"])
+    parser.add_argument("--intensity", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", default="quant_report.json")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--image-out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.source = os.path.abspath(args.source)
+    args.reference = os.path.abspath(args.reference)
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    modes = list(dict.fromkeys(["none"] + args.modes))
+    out_dir = tempfile.mkdtemp(prefix="quant_calib_")
+    report = {"device": "cpu", "steps": args.steps, "seed": args.seed, "modes": {}}
+    for mode in modes:
+        image_out = os.path.join(out_dir, f"{mode}.png")
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", mode, "--image-out", image_out,
+               "--source", args.source, "--reference", args.reference, "--intensity", str(args.intensity),
+               "--seed", str(args.seed), "--steps", str(args.steps), "--runs", str(args.runs)]
+        print(f"⏱️ Running {mode}...")
+        proc = subprocess.run(cmd, cwd=REPO_ROOT, capture_output=True, text=True)
+        lines = [l for l in proc.stdout.splitlines() if l.startswith("RESULT ")]
+        if proc.returncode != 0 or not lines:
+            print(proc.stdout[-2000:], proc.stderr[-2000:])
+            report["modes"][mode] = {"error": f"worker exited with {proc.returncode}"}
+            continue
+        entry = json.loads(lines[-1][len("RESULT "):])
+        entry["image"] = image_out
+        report["modes"][mode] = entry
+
+    from PIL import Image
+
+    baseline = report["modes"].get("none", {})
+    if "image" in baseline:
+        base_img = Image.open(baseline["image"])
+        for mode, entry in report["modes"].items():
+            if "image" not in entry:
+                continue
+            entry["vs_fp32"] = image_metrics(Image.open(entry["image"]), base_img)
+            entry["speedup"] = baseline["mean_latency_s"] / entry["mean_latency_s"]
+            entry["rss_saving_mb"] = baseline["rss_after_load_mb"] - entry["rss_after_load_mb"]
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Memory soak test: many predict() calls on an in-process Predictor with stub models.
+
+Runs ``--requests`` predictions through the real predict() path (decode, eye
+preservation, file handling, memory guard) with stub models, and reports the
+MemoryGuard summary: RSS per request, growth slope and whether sustained growth
+was detected. ``--leak-kb`` makes the stub keep that much memory per call, to
+check that the detector (and the trim/recycle policy) fire.
+
+    python scripts/soak_test.py --requests 500
+    python scripts/soak_test.py --requests 200 --leak-kb 512 --budget-mb 800 --policy recycle
+"""
+import argparse
+import json
+import os
+import tempfile
+
+from cog import Path
+
+from load_test import RequestMix
+from stubs import StubNamespace, predict_kwargs, stub_predictor
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--repeat-ratio", type=float, default=0.5)
+    parser.add_argument("--stub-latency", type=float, default=0.0)
+    parser.add_argument("--leak-kb", type=int, default=0, help="Memory the stub retains per call")
+    parser.add_argument("--window", type=int, default=50)
+    parser.add_argument("--growth-mb", type=float, default=64.0, help="Growth over one window counted as sustained")
+    parser.add_argument("--budget-mb", type=float, default=None)
+    parser.add_argument("--policy", default="none", choices=["none", "trim", "recycle"])
+    parser.add_argument("--fail-on-growth", action="store_true", help="Exit 1 if sustained growth is detected")
+    parser.add_argument("--output", default="soak_test.json")
+    args = parser.parse_args()
+
+    os.environ.update({
+        "MAKEUP_MEMORY_WINDOW": str(args.window),
+        "MAKEUP_MEMORY_GROWTH_MB": str(args.growth_mb),
+        "MAKEUP_MEMORY_POLICY": args.policy,
+    })
+    if args.budget_mb is not None:
+        os.environ["MAKEUP_MEMORY_BUDGET_MB"] = str(args.budget_mb)
+
+    predictor = stub_predictor(args.stub_latency)
+
+    def load_namespace():
+        # Fresh stub models per load, so a recycle really releases what the "models" retained
+        namespace = StubNamespace(args.stub_latency)
+        encoder = namespace.makeup_encoder
+        generate = encoder.generate
+        retained = []
+
+        def leaky_generate(*a, **k):
+            retained.append(bytearray(os.urandom(args.leak_kb * 1024)))
+            return generate(*a, **k)
+
+        if args.leak_kb:
+            encoder.generate = leaky_generate
+        return namespace
+
+    # Use the real (cached, recyclable) namespace loading with stub models underneath
+    del predictor._load_model_namespace
+    predictor._load_infer_module = load_namespace
+
+    mix = RequestMix([], [], args.repeat_ratio, tempfile.mkdtemp(prefix="soak_test_"))
+    errors = 0
+    rss_mb = []  # the guard keeps only its growth window
+    for _ in range(args.requests):
+        request = mix.next()
+        output = predictor.predict(**predict_kwargs(
+            predictor,
+            source_image=Path(request["source_image"]),
+            reference_image=Path(request["reference_image"]),
+            makeup_intensity=request["makeup_intensity"],
+        ))
+        errors += os.path.basename(str(output)) == "error.jpg"
+        rss_mb.append(round(predictor._memory_guard().history[-1]["after_rss_mb"], 1))
+        if request["kind"] == "unique":
+            os.remove(request["source_image"])
+            os.remove(request["reference_image"])
+
+    guard = predictor._memory_guard()
+    report = {"errors": errors, "leak_kb": args.leak_kb, **guard.report(),
+              "rss_mb": rss_mb}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps({k: v for k, v in report.items() if k != "rss_mb"}, indent=2))
+    if args.fail_on_growth and report["sustained_growth"]:
+        raise SystemExit("Sustained memory growth detected")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Stub models for exercising predict.py without weights, a GPU or the upstream checkout.
+
+``stub_predictor()`` returns a real Predictor whose model namespace and landmark
+backend are replaced by cheap stand-ins with a configurable latency. Everything
+else (decode, eye preservation, file handling, error paths) is the real code.
+
+The stub generator stamps a signature patch in the top-left corner of its output
+(R = guidance, G = mean reference colour) so callers can check that the file a
+request got back was produced for that request.
+
+``StubDenoisingNamespace`` instead runs a real (tiny) diffusers denoising loop on
+CPU: a randomly initialised one-level AutoencoderKL, the DDIM scheduler, and an
+oracle "UNet" whose conditional prediction steers x0 towards the reference
+latents (the unconditional one towards zero), run with classifier-free guidance
+on a doubled batch like the upstream pipeline. It exercises sampling.py
+(scheduler hooks, early exit, partial denoising, CFG fast paths) without weights.
+"""
+import inspect
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+import numpy as np
+from PIL import Image
+
+from bench_common import REPO_ROOT  # noqa: F401  (puts the repo root on sys.path)
+from landmarks import LandmarkBackend, LandmarkResult, register_landmark_backend
+
+SIGNATURE_PATCH = 16
+
+
+def signature_for(makeup_image: Image.Image, guidance: float) -> Tuple[int, int]:
+    ref_mean = int(np.asarray(makeup_image.convert("L"), dtype=np.float32).mean())
+    return int(round(guidance * 50)) % 256, ref_mean
+
+
+def read_signature(image: Image.Image) -> Tuple[int, int]:
+    patch = np.asarray(image.convert("RGB"), dtype=np.float32)[:SIGNATURE_PATCH // 2, :SIGNATURE_PATCH // 2]
+    return int(round(patch[..., 0].mean())), int(round(patch[..., 1].mean()))
+
+
+class StubMakeupEncoder:
+    """Stands in for detail_encoder: sleeps for ``latency_s`` and blends the two images."""
+
+    def __init__(self, latency_s: float = 0.05):
+        self.latency_s = latency_s
+        self.device = "cpu"
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def get_image_embeds(self, makeup_image):
+        import torch
+
+        return torch.zeros(1, 4, 8), torch.zeros(1, 4, 8)
+
+    def generate(self, id_image, makeup_image, pipe=None, guidance_scale=1.6, **kwargs):
+        with self._lock:
+            self.calls += 1
+        self.get_image_embeds(makeup_image)
+        time.sleep(self.latency_s)
+        source = np.asarray(id_image[0], dtype=np.float32)
+        reference = np.asarray(makeup_image.resize(id_image[0].size), dtype=np.float32)
+        out = 0.8 * source + 0.2 * reference
+        r, g = signature_for(makeup_image, guidance_scale)
+        out[:SIGNATURE_PATCH, :SIGNATURE_PATCH] = (r, g, 0)
+        return Image.fromarray(np.clip(out, 0, 255).astype(np.uint8))
+
+
+class StubNamespace:
+    """Mimics the infer_kps module globals used by Predictor."""
+
+    def __init__(self, latency_s: float = 0.05):
+        self.makeup_encoder = StubMakeupEncoder(latency_s)
+        self.pipe = None
+
+    def get_draw(self, pil_img, size):
+        return Image.new("RGB", (size, size), (0, 0, 0))
+
+
+def _stub_unet(scheduler):
+    import torch
+
+    class StubUNet(torch.nn.Module):
+        """Oracle noise prediction: x0 is whatever ``encoder_hidden_states`` holds (the target latents)."""
+
+        def __init__(self):
+            super().__init__()
+            self.register_buffer("alphas_cumprod", scheduler.alphas_cumprod.clone())
+
+        @property
+        def dtype(self):
+            return self.alphas_cumprod.dtype
+
+        def forward(self, sample, timestep, encoder_hidden_states=None, return_dict=True, **kwargs):
+            alpha = self.alphas_cumprod[int(timestep)]
+            target = encoder_hidden_states.reshape(sample.shape)
+            return ((sample - alpha.sqrt() * target) / (1 - alpha).sqrt(),)
+
+    return StubUNet()
+
+
+class StubDiffusionPipe:
+    """The pipe attributes sampling.py touches: vae, scheduler, image_processor, unet."""
+
+    def __init__(self):
+        import torch
+        from diffusers import AutoencoderKL, DDIMScheduler
+        from diffusers.image_processor import VaeImageProcessor
+
+        torch.manual_seed(0)
+        self.vae = AutoencoderKL(
+            block_out_channels=(32,),
+            down_block_types=("DownEncoderBlock2D",),
+            up_block_types=("UpDecoderBlock2D",),
+            latent_channels=4,
+            norm_num_groups=32,
+        ).eval()
+        self.scheduler = DDIMScheduler(beta_schedule="scaled_linear", beta_start=0.00085, beta_end=0.012,
+                                       clip_sample=False, set_alpha_to_one=False)
+        self.image_processor = VaeImageProcessor(vae_scale_factor=1)
+        self.unet = _stub_unet(self.scheduler)
+
+
+class StubDenoisingEncoder:
+    """detail_encoder stand-in whose generate() runs a DDIM loop like the upstream pipeline."""
+
+    def __init__(self):
+        self.calls = 0
+        self.steps = 0
+
+    def generate(self, id_image, makeup_image, pipe=None, guidance_scale=1.6, num_inference_steps=30,
+                 seed=None, latents=None, **kwargs):
+        import torch
+        from sampling import decode_latents, encode_image
+
+        self.calls += 1
+        generator = torch.Generator().manual_seed(0 if seed is None else int(seed))
+        target = encode_image(pipe, makeup_image.resize(id_image[0].size), generator)
+        scheduler = pipe.scheduler
+        scheduler.set_timesteps(num_inference_steps)
+        if latents is None:
+            latents = torch.randn(target.shape, generator=generator)
+        latents = latents * scheduler.init_noise_sigma
+        # Always CFG, [uncond, cond], as the upstream pipeline does
+        embeds = torch.cat([torch.zeros_like(target), target]).flatten(1)
+        for t in scheduler.timesteps:
+            self.steps += 1
+            model_input = torch.cat([latents] * 2)
+            noise_uncond, noise_cond = pipe.unet(model_input, t, encoder_hidden_states=embeds,
+                                                 return_dict=False)[0].chunk(2)
+            noise_pred = noise_uncond + guidance_scale * (noise_cond - noise_uncond)
+            latents = scheduler.step(noise_pred, t, latents).prev_sample
+        return decode_latents(pipe, latents)
+
+
+class StubDenoisingNamespace(StubNamespace):
+    def __init__(self):
+        self.makeup_encoder = StubDenoisingEncoder()
+        self.pipe = StubDiffusionPipe()
+
+
+class StubLandmarks(LandmarkBackend):
+    """Fixed eye polygons in the middle of the image."""
+
+    name = "stub"
+
+    def detect(self, rgb: np.ndarray):
+        h, w = rgb.shape[:2]
+        eye = np.array([(0, 0), (8, -4), (16, -4), (24, 0), (16, 4), (8, 4)], dtype=np.float32)
+        left = eye * (w / 512.0) + (0.33 * w, 0.42 * h)
+        right = eye * (w / 512.0) + (0.58 * w, 0.42 * h)
+        return LandmarkResult(np.concatenate([left, right]), (0.25 * w, 0.25 * h, 0.5 * w, 0.5 * h))
+
+
+def stub_predictor(latency_s: float = 0.05):
+    """A Predictor wired to stub models (no clone, downloads or weights)."""
+    from predict import Predictor
+
+    register_landmark_backend("stub", StubLandmarks)
+    os.environ["MAKEUP_LANDMARK_BACKEND"] = "stub"
+    predictor = Predictor()
+    predictor._repo_dir = os.getcwd()  # marks the runtime as prepared
+    namespace = StubNamespace(latency_s)
+    predictor._load_model_namespace = lambda: namespace
+    predictor.stub_namespace = namespace
+    return predictor
+
+
+def predict_kwargs(predictor, **overrides) -> Dict:
+    """Keyword arguments for predictor.predict(): the declared Input defaults plus ``overrides``."""
+    kwargs = {}
+    for name, param in inspect.signature(predictor.predict).parameters.items():
+        default = param.default
+        kwargs[name] = getattr(default, "default", default)
+    kwargs.update(overrides)
+    return kwargs
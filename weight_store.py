@@ -0,0 +1,260 @@
+"""Content-addressed local store for model weights.
+
+Every weight file (stablemakeup adapters, SPIGA checkpoint, CLIP image encoder)
+is kept exactly once under ``MAKEUP_WEIGHT_STORE`` (default
+``~/.cache/stable-makeup/weights``), keyed by its SHA-256:
+
+    <store>/blobs/<aa>/<sha256>   the file contents
+    <store>/links.json            link path -> sha256 of every place that uses a blob
+    <store>/hashes.json           (path, size, mtime, inode) -> sha256 cache
+
+The places that need a file get a hardlink to the blob (a symlink when the
+store is on another filesystem), so nothing is copied at startup and a
+container layer never holds the same gigabytes twice. Hashes are cached by
+inode/size/mtime, and a path that is already linked to its blob is a no-op.
+A new blob is a copy of its source (or the source itself, renamed into the
+store, for ``adopt``), never a hardlink to it, so a later in-place write to the
+source can't change a blob behind its digest. ``gc`` leaves temp files and
+anything younger than ``GC_GRACE_S`` alone, so it can run next to an ingest.
+
+    python weight_store.py ls
+    python weight_store.py gc [--dry-run]
+"""
+import argparse
+import errno
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional
+
+DEFAULT_STORE_DIR = os.path.expanduser("~/.cache/stable-makeup/weights")
+GC_GRACE_S = 3600.0
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(8 * 1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class WeightStore:
+    def __init__(self, root: Optional[str] = None):
+        self.root = os.path.abspath(root or os.environ.get("MAKEUP_WEIGHT_STORE", DEFAULT_STORE_DIR))
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.root, "blobs"), exist_ok=True)
+
+    # -- bookkeeping -------------------------------------------------------
+    def _json_path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _load(self, name: str) -> Dict:
+        try:
+            with open(self._json_path(name), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, name: str, data: Dict) -> None:
+        tmp = self._json_path(name) + f".tmp{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp, self._json_path(name))
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    def digest_of(self, path: str) -> str:
+        """SHA-256 of ``path``, cached by (size, mtime, inode) so unchanged files are hashed once."""
+        st = os.stat(path)
+        key = os.path.realpath(path)
+        stamp = [st.st_size, st.st_mtime_ns, st.st_ino]
+        with self._lock:
+            hashes = self._load("hashes.json")
+            cached = hashes.get(key)
+            if cached and cached.get("stamp") == stamp:
+                return cached["sha256"]
+        digest = _sha256_file(path)
+        with self._lock:
+            hashes = self._load("hashes.json")
+            hashes[key] = {"stamp": stamp, "sha256": digest}
+            self._save("hashes.json", hashes)
+        return digest
+
+    def _register(self, link_path: str, digest: str) -> None:
+        with self._lock:
+            links = self._load("links.json")
+            links[os.path.abspath(link_path)] = digest
+            self._save("links.json", links)
+
+    # -- public API --------------------------------------------------------
+    def ingest(self, src: str, move: bool = False) -> str:
+        """Add ``src`` to the store and return its digest.
+
+        The blob is a copy of ``src`` (with ``move``, ``src`` itself renamed into the store when it
+        is on the same filesystem), never a hardlink that later writes to ``src`` would reach.
+        """
+        digest = self.digest_of(src)
+        blob = self.blob_path(digest)
+        if os.path.exists(blob):
+            return digest
+        tmp_dir = os.path.join(self.root, "blobs", "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp = os.path.join(tmp_dir, f"{digest}.tmp{os.getpid()}.{threading.get_ident()}")
+        moved = False
+        if move:
+            try:
+                os.replace(src, tmp)
+                moved = True
+            except OSError:
+                pass
+        try:
+            if not moved:
+                shutil.copyfile(src, tmp)
+                # Store what was actually copied, in case src changed after it was hashed
+                digest = _sha256_file(tmp)
+                blob = self.blob_path(digest)
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.replace(tmp, blob)
+        except BaseException:
+            if moved:
+                os.replace(tmp, src)
+            elif os.path.lexists(tmp):
+                os.remove(tmp)
+            raise
+        return digest
+
+    def link(self, digest: str, dest: str) -> str:
+        """Point ``dest`` at the blob for ``digest``: hardlink, else symlink. Returns ``dest``."""
+        blob = self.blob_path(digest)
+        if not os.path.exists(blob):
+            raise FileNotFoundError(f"Blob {digest} is not in the weight store {self.root}")
+        if os.path.exists(dest) and os.path.samefile(dest, blob):
+            self._register(dest, digest)
+            return dest
+        os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        tmp = f"{dest}.tmp{os.getpid()}"
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(blob, tmp)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            os.symlink(blob, tmp)
+        os.replace(tmp, dest)
+        self._register(dest, digest)
+        return dest
+
+    def materialize(self, src: str, dest: str) -> str:
+        """Make ``dest`` provide the contents of ``src`` without a copy (replaces shutil.copy2)."""
+        return self.link(self.ingest(src), dest)
+
+    def adopt(self, path: str) -> str:
+        """Move a freshly downloaded file under store management, deduplicating against existing blobs."""
+        return self.link(self.ingest(path, move=True), path)
+
+    def entries(self) -> List[Dict]:
+        links = self._load("links.json")
+        blobs = []
+        for sub in sorted(os.listdir(os.path.join(self.root, "blobs"))):
+            if sub == "tmp":
+                continue
+            for digest in sorted(os.listdir(os.path.join(self.root, "blobs", sub))):
+                if ".tmp" in digest:
+                    continue
+                path = self.blob_path(digest)
+                blobs.append({
+                    "sha256": digest,
+                    "size": os.path.getsize(path),
+                    "links": sorted(p for p, d in links.items() if d == digest),
+                })
+        return blobs
+
+    def gc(self, dry_run: bool = False, grace_s: float = GC_GRACE_S) -> Dict[str, int]:
+        """Delete blobs no live link points at, and forget links whose path is gone or was replaced.
+
+        Temp files and blobs created or linked within ``grace_s`` are kept: an ingest may still be
+        writing them, or about to link them.
+        """
+        with self._lock:
+            links = self._load("links.json")
+            live_links = {}
+            for path, digest in links.items():
+                blob = self.blob_path(digest)
+                if os.path.lexists(path) and os.path.exists(blob) and os.path.samefile(path, blob):
+                    live_links[path] = digest
+            live = set(live_links.values())
+            removed = freed = recent = 0
+            cutoff = time.time() - grace_s
+            for sub in os.listdir(os.path.join(self.root, "blobs")):
+                if sub == "tmp":
+                    continue
+                sub_dir = os.path.join(self.root, "blobs", sub)
+                for name in os.listdir(sub_dir):
+                    path = os.path.join(sub_dir, name)
+                    if name in live or ".tmp" in name:
+                        continue
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    if max(st.st_mtime, st.st_ctime) > cutoff:
+                        recent += 1
+                        continue
+                    removed += 1
+                    freed += st.st_size
+                    if not dry_run:
+                        os.remove(path)
+            hashes = self._load("hashes.json")
+            stale_hashes = [p for p in hashes if not os.path.exists(p)]
+            if not dry_run:
+                self._save("links.json", live_links)
+                for p in stale_hashes:
+                    hashes.pop(p, None)
+                self._save("hashes.json", hashes)
+        return {
+            "blobs_removed": removed,
+            "bytes_freed": freed,
+            "recent_kept": recent,
+            "links_dropped": len(links) - len(live_links),
+            "hashes_dropped": len(stale_hashes),
+        }
+
+
+_STORE: Optional[WeightStore] = None
+
+
+def get_weight_store() -> WeightStore:
+    """Process-wide store at MAKEUP_WEIGHT_STORE."""
+    global _STORE
+    if _STORE is None:
+        _STORE = WeightStore()
+    return _STORE
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect or garbage-collect the weight store")
+    parser.add_argument("--root", default=None, help="Store directory (default: MAKEUP_WEIGHT_STORE)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("ls", help="List blobs and the paths linked to them")
+    gc = sub.add_parser("gc", help="Remove blobs that are no longer linked anywhere")
+    gc.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    store = WeightStore(args.root)
+    if args.command == "ls":
+        print(json.dumps(store.entries(), indent=2))
+    else:
+        stats = store.gc(dry_run=args.dry_run)
+        action = "Would free" if args.dry_run else "Freed"
+        print(f"🧹 {action} {stats['bytes_freed'] / 1024 ** 2:.1f} MB in {stats['blobs_removed']} blobs")
+        print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
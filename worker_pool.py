@@ -0,0 +1,330 @@
+"""Multi-process CPU worker pool that shares one copy of the model weights.
+
+The parent process prepares the Stable-Makeup runtime and loads every model
+(UNet, CLIP encoder, id/pose encoders, adapters, landmark backend) exactly once,
+moves the weight tensors into shared memory and then forks the workers. Forked
+workers map the same physical pages read-only, so adding a worker costs its
+activations and scratch buffers, not another copy of the weights.
+
+The dispatcher in submit() hands each request to the worker with the fewest in
+flight. Every worker runs with a pinned torch thread count and, on Linux, its own
+slice of CPU cores, which avoids oversubscription when N workers share a host.
+
+Each worker tracks its memory per request (memory_guard.MemoryGuard). Under
+``MAKEUP_MEMORY_POLICY=recycle`` a worker that stays over budget after trimming
+exits, and the pool forks a fresh one from the parent on the same task queue.
+Every request runs under its own activated Deadline (deadlines.py), so
+``timeout_s`` and MAKEUP_REQUEST_TIMEOUT_S apply in workers as in predict().
+A worker that dies (OOM kill, segfault) is noticed by the collector: the
+requests queued on it fail with RuntimeError and a fresh worker takes its place
+on a new queue. Replacements are forked off the collector thread, so results
+from the other workers keep flowing meanwhile.
+
+    pool = WorkerPool(workers=4)
+    pool.start()
+    future = pool.submit("/data/face.jpg", "/data/look.jpg", makeup_intensity=1.0)
+    print(future.result())  # path of the written JPEG
+    pool.close()
+"""
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Set
+
+import torch
+
+from deadlines import Deadline
+from memory_guard import MemoryGuard
+
+DEFAULT_OUTPUT_DIR = "/tmp/makeup_pool"
+LIVENESS_INTERVAL_S = 1.0
+
+
+def share_module_memory(namespace) -> int:
+    """Move the weights of every model in an infer_kps namespace to shared memory.
+
+    Returns the number of bytes now backed by shared memory. Tensors that cannot be
+    shared (e.g. packed int8 weights) stay private and are inherited copy-on-write.
+    """
+    pipe = getattr(namespace, "pipe", None)
+    candidates = [
+        getattr(namespace, "makeup_encoder", None),
+        getattr(pipe, "unet", None),
+        getattr(pipe, "vae", None),
+        getattr(pipe, "controlnet", None),
+        getattr(pipe, "text_encoder", None),
+    ]
+    seen = set()
+    shared = 0
+    for module in candidates:
+        if not isinstance(module, torch.nn.Module):
+            continue
+        for tensor in itertools.chain(module.parameters(), module.buffers()):
+            if id(tensor) in seen:
+                continue
+            seen.add(id(tensor))
+            try:
+                tensor.share_memory_()
+                shared += tensor.numel() * tensor.element_size()
+            except Exception:
+                continue
+    return shared
+
+
+def process_memory(pid: int) -> Dict[str, float]:
+    """RSS and PSS (proportional set size, shared pages split between sharers) in MB."""
+    stats = {"rss_mb": 0.0, "pss_mb": 0.0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                if line.startswith("Rss:"):
+                    stats["rss_mb"] = int(line.split()[1]) / 1024.0
+                elif line.startswith("Pss:"):
+                    stats["pss_mb"] = int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return stats
+
+
+def _cpu_slices(workers: int, threads_per_worker: int) -> List[Optional[List[int]]]:
+    try:
+        cpus = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return [None] * workers
+    slices = []
+    for i in range(workers):
+        chunk = cpus[(i * threads_per_worker) % len(cpus):][:threads_per_worker]
+        slices.append(chunk or None)
+    return slices
+
+
+def _worker_main(worker_id, predictor, task_queue, result_queue, threads, cpus, output_dir):
+    torch.set_num_threads(threads)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError:
+            pass
+    # Private scratch dir so any relative-path writes by upstream code don't race between workers
+    scratch = os.path.join(output_dir, f"worker_{worker_id}")
+    os.makedirs(scratch, exist_ok=True)
+    os.chdir(scratch)
+    guard = MemoryGuard.from_env()
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, kwargs = task
+        deadline = Deadline.for_request(kwargs.pop("timeout_s", 0.0))
+        # Time spent queued counts against the deadline (CLOCK_MONOTONIC is shared by forked processes)
+        deadline.start = kwargs.pop("submitted_at", deadline.start)
+        try:
+            with deadline.activate(), guard.track():
+                image = predictor._run_inference(**kwargs)
+                result_path = os.path.join(output_dir, f"{task_id}.jpg")
+                with deadline.stage("encode"):
+                    image.save(result_path)
+            result_queue.put((task_id, worker_id, result_path, None))
+        except Exception as e:
+            result_queue.put((task_id, worker_id, None, f"{type(e).__name__}: {e}"))
+        if guard.recycle_requested:
+            # Task id None tells the parent to fork a replacement on this worker's queue
+            result_queue.put((None, worker_id, None, "recycle"))
+            break
+
+
+class WorkerPool:
+    """Fork-based pool of Predictor workers sharing read-only model weights."""
+
+    def __init__(self, workers: Optional[int] = None, threads_per_worker: Optional[int] = None,
+                 pin_cpus: bool = True, output_dir: str = DEFAULT_OUTPUT_DIR):
+        cpu_count = os.cpu_count() or 1
+        self.workers = workers or int(os.environ.get("MAKEUP_WORKERS", max(1, cpu_count // 4)))
+        self.threads_per_worker = threads_per_worker or max(1, cpu_count // self.workers)
+        self.pin_cpus = pin_cpus
+        self.output_dir = output_dir
+        self.shared_bytes = 0
+        self._procs: List[mp.process.BaseProcess] = []
+        self._queues = []
+        self._inflight: List[int] = []
+        self._owned: List[Set[int]] = []
+        self._replacing: Set[int] = set()
+        self._closing = False
+        self._futures: Dict[int, Future] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._collector: Optional[threading.Thread] = None
+        self._predictor = None
+        self._ctx = None
+        self._cpu_slices: List[Optional[List[int]]] = []
+        self.recycled = 0
+
+    def start(self, predictor=None) -> "WorkerPool":
+        """Load the models once in this process, share them and fork the workers."""
+        if predictor is None:
+            from predict import Predictor
+
+            predictor = Predictor()
+        os.makedirs(self.output_dir, exist_ok=True)
+        # Keep the parent single-threaded so no OpenMP pool exists at fork time
+        torch.set_num_threads(1)
+        predictor._prepare_runtime()
+        namespace = predictor._load_infer_module()
+        self.shared_bytes = share_module_memory(namespace)
+        try:
+            # Build the eye landmark backend before forking so workers inherit it too
+            from landmarks import get_landmark_backend
+
+            get_landmark_backend()
+        except Exception as e:
+            print(f"⚠️ Landmark backend not preloaded: {e}")
+        print(f"✅ Shared {self.shared_bytes / 1024 ** 3:.2f} GiB of weights with {self.workers} workers")
+
+        self._predictor = predictor
+        self._ctx = mp.get_context("fork")
+        self._results = self._ctx.Queue()
+        self._cpu_slices = (_cpu_slices(self.workers, self.threads_per_worker) if self.pin_cpus
+                            else [None] * self.workers)
+        for worker_id in range(self.workers):
+            self._queues.append(self._ctx.Queue())
+            self._procs.append(self._spawn(worker_id))
+            self._inflight.append(0)
+            self._owned.append(set())
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+        return self
+
+    def _spawn(self, worker_id: int):
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self._predictor, self._queues[worker_id], self._results, self.threads_per_worker,
+                  self._cpu_slices[worker_id], self.output_dir),
+            daemon=True,
+        )
+        proc.start()
+        return proc
+
+    def _respawn(self, worker_id: int, reason: str) -> None:
+        """Fork a replacement for a worker that exited; runs on its own thread, not the collector's."""
+        try:
+            self._procs[worker_id].join(timeout=30)
+            if not self._closing:
+                self._procs[worker_id] = self._spawn(worker_id)
+                self.recycled += 1
+                print(f"♻️ Replaced worker {worker_id} ({reason})")
+        finally:
+            with self._lock:
+                self._replacing.discard(worker_id)
+
+    def _replace(self, worker_id: int, reason: str) -> None:
+        with self._lock:
+            if self._closing or worker_id in self._replacing:
+                return
+            self._replacing.add(worker_id)
+        threading.Thread(target=self._respawn, args=(worker_id, reason), name=f"pool-respawn-{worker_id}",
+                         daemon=True).start()
+
+    def _check_workers(self) -> None:
+        """Fail the requests of workers that died without reporting, and replace those workers."""
+        for worker_id, proc in enumerate(self._procs):
+            # Exit code 0 is a recycle (announced on the result queue) or close()
+            if proc.exitcode is None or proc.exitcode == 0:
+                continue
+            with self._lock:
+                if self._closing or worker_id in self._replacing:
+                    continue
+                # The dead worker may have held the queue's lock; its tasks move to no one
+                lost = self._owned[worker_id]
+                self._owned[worker_id] = set()
+                self._inflight[worker_id] = 0
+                self._queues[worker_id] = self._ctx.Queue()
+                futures = [self._futures.pop(task_id) for task_id in lost if task_id in self._futures]
+            error = f"worker {worker_id} died (exit code {proc.exitcode})"
+            print(f"⚠️ {error}; failing {len(futures)} request(s)")
+            for future in futures:
+                future.set_exception(RuntimeError(error))
+            self._replace(worker_id, error)
+
+    def submit(self, source_path: str, reference_path: Optional[str] = None, makeup_intensity: float = 1.0,
+               timeout_s: float = 0.0, **kwargs) -> Future:
+        """Queue one request on the least-loaded worker; the future resolves to the output path.
+
+        ``timeout_s`` (else MAKEUP_REQUEST_TIMEOUT_S) is the request deadline, counted from submission
+        like the staged pipeline's; an expired request fails its future with DeadlineExceeded's JSON.
+        """
+        # Workers run in their own scratch directories, so pass absolute paths
+        kwargs.update(source_path=os.path.abspath(source_path),
+                      reference_path=os.path.abspath(reference_path) if reference_path is not None else None,
+                      makeup_intensity=makeup_intensity, timeout_s=timeout_s, submitted_at=time.monotonic())
+        future: Future = Future()
+        with self._lock:
+            task_id = next(self._ids)
+            worker_id = min(range(self.workers), key=lambda i: self._inflight[i])
+            self._inflight[worker_id] += 1
+            self._owned[worker_id].add(task_id)
+            self._futures[task_id] = future
+            task_queue = self._queues[worker_id]
+        task_queue.put((task_id, kwargs))
+        return future
+
+    def _collect(self) -> None:
+        checked = time.monotonic()
+        while True:
+            try:
+                item = self._results.get(timeout=LIVENESS_INTERVAL_S)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if time.monotonic() - checked >= LIVENESS_INTERVAL_S:
+                self._check_workers()
+                checked = time.monotonic()
+            if not item:
+                continue
+            task_id, worker_id, result_path, error = item
+            if task_id is None:
+                self._replace(worker_id, "memory budget exceeded")
+                continue
+            with self._lock:
+                if task_id in self._owned[worker_id]:
+                    self._owned[worker_id].discard(task_id)
+                    self._inflight[worker_id] -= 1
+                future = self._futures.pop(task_id, None)
+            if future is None:
+                continue
+            if error is None:
+                future.set_result(result_path)
+            else:
+                future.set_exception(RuntimeError(error))
+
+    def memory(self) -> Dict[str, float]:
+        """Summed RSS/PSS of the parent and all workers. PSS counts shared weights once."""
+        totals = {"rss_mb": 0.0, "pss_mb": 0.0}
+        for pid in [os.getpid()] + [p.pid for p in self._procs if p.is_alive()]:
+            for key, value in process_memory(pid).items():
+                totals[key] += value
+        return totals
+
+    def close(self) -> None:
+        with self._lock:
+            self._closing = True
+        for task_queue in self._queues:
+            task_queue.put(None)
+        for proc in self._procs:
+            proc.join(timeout=30)
+            if proc.is_alive():
+                proc.terminate()
+        if self._collector is not None:
+            self._results.put(None)
+            self._collector.join(timeout=5)
+        self._procs, self._queues, self._inflight, self._owned = [], [], [], []
+
+    def __enter__(self) -> "WorkerPool":
+        return self.start() if not self._procs else self
+
+    def __exit__(self, *exc) -> None:
+        self.close()